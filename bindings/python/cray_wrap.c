@@ -16,7 +16,19 @@
 #endif
 #include <Python.h>
 #include <structmember.h>
+#ifdef WINDOWS
+	#include <winsock2.h>
+	#ifdef _MSC_VER
+		#pragma comment(lib, "ws2_32.lib")
+	#endif
+#else
+	#include <sys/socket.h>
+#endif
+#ifndef MSG_NOSIGNAL
+	#define MSG_NOSIGNAL 0
+#endif
 #include <c-ray/c-ray.h>
+#include <v.h>
 #include "py_types.h"
 
 static PyObject *py_cr_get_version(PyObject *self, PyObject *args) {
@@ -222,6 +234,104 @@ static PyObject *py_cr_renderer_get_result(PyObject *self, PyObject *args) {
 	return py_bitmap_wrap(bm);
 }
 
+static PyObject *py_cr_renderer_acquire_pass(PyObject *self, PyObject *args) {
+	(void)self;
+	PyObject *r_ext;
+	Py_ssize_t after_pass;
+	long timeout_ms;
+	if (!PyArg_ParseTuple(args, "Onl", &r_ext, &after_pass, &timeout_ms)) {
+		return NULL;
+	}
+	struct cr_renderer *r = PyCapsule_GetPointer(r_ext, "cray.cr_renderer");
+	if (!r) return NULL;
+	size_t pass = 0;
+	const struct cr_bitmap *bm = NULL;
+	Py_BEGIN_ALLOW_THREADS
+	bm = cr_renderer_acquire_pass(r, after_pass, timeout_ms, &pass);
+	Py_END_ALLOW_THREADS
+	if (!bm) Py_RETURN_NONE;
+	PyObject *py_bm = py_bitmap_wrap((struct cr_bitmap *)bm);
+	if (!py_bm) return NULL;
+	return Py_BuildValue("(nN)", (Py_ssize_t)pass, py_bm);
+}
+
+// Returns a list of (x, y, width, height) rects of result tiles that changed since the last call.
+// Unlike cr_tile, y counts rows from the bottom, to match the memory layout of the result bitmap.
+static PyObject *py_cr_renderer_get_dirty_tiles(PyObject *self, PyObject *args) {
+	(void)self;
+	PyObject *r_ext;
+	if (!PyArg_ParseTuple(args, "O", &r_ext)) {
+		return NULL;
+	}
+	struct cr_renderer *r = PyCapsule_GetPointer(r_ext, "cray.cr_renderer");
+	if (!r) return NULL;
+	PyObject *list = PyList_New(0);
+	if (!list) return NULL;
+	struct cr_bitmap *bm = cr_renderer_get_result(r);
+	if (!bm) return list;
+	struct cr_tile tiles[256];
+	size_t count;
+	do {
+		count = cr_renderer_get_dirty_tiles(r, tiles, sizeof(tiles) / sizeof(tiles[0]));
+		for (size_t i = 0; i < count; ++i) {
+			const struct cr_tile *t = &tiles[i];
+			PyObject *rect = Py_BuildValue("(iiii)", t->start_x, (int)bm->height - t->end_y, t->w, t->h);
+			if (!rect || PyList_Append(list, rect) < 0) {
+				Py_XDECREF(rect);
+				Py_DECREF(list);
+				return NULL;
+			}
+			Py_DECREF(rect);
+		}
+	} while (count == sizeof(tiles) / sizeof(tiles[0]));
+	return list;
+}
+
+static PyObject *py_cr_renderer_get_stats(PyObject *self, PyObject *args) {
+	(void)self;
+	PyObject *r_ext;
+	if (!PyArg_ParseTuple(args, "O", &r_ext)) {
+		return NULL;
+	}
+	struct cr_renderer *r = PyCapsule_GetPointer(r_ext, "cray.cr_renderer");
+	if (!r) return NULL;
+	struct cr_renderer_stats stats = cr_renderer_get_stats(r);
+	PyObject *timings = PyList_New(stats.timing_count);
+	if (!timings) return NULL;
+	for (size_t i = 0; i < stats.timing_count; ++i) {
+		const struct cr_timing *t = &stats.timings[i];
+		PyObject *timing = Py_BuildValue("(IzKK)", t->phase, t->name, (unsigned long long)t->us, (unsigned long long)t->count);
+		if (!timing) {
+			Py_DECREF(timings);
+			return NULL;
+		}
+		PyList_SET_ITEM(timings, i, timing);
+	}
+	PyObject *peak_bytes = PyTuple_New(cr_mem_category_count);
+	if (!peak_bytes) {
+		Py_DECREF(timings);
+		return NULL;
+	}
+	for (size_t i = 0; i < cr_mem_category_count; ++i)
+		PyTuple_SET_ITEM(peak_bytes, i, PyLong_FromUnsignedLongLong(stats.peak_bytes[i]));
+	return Py_BuildValue("(NN)", timings, peak_bytes);
+}
+
+static PyObject *py_cr_renderer_add_timing(PyObject *self, PyObject *args) {
+	(void)self;
+	PyObject *r_ext;
+	enum cr_phase phase;
+	char *name = NULL;
+	unsigned long long us;
+	if (!PyArg_ParseTuple(args, "OIzK", &r_ext, &phase, &name, &us)) {
+		return NULL;
+	}
+	struct cr_renderer *r = PyCapsule_GetPointer(r_ext, "cray.cr_renderer");
+	if (!r) return NULL;
+	cr_renderer_add_timing(r, phase, name, us);
+	Py_RETURN_NONE;
+}
+
 static PyObject *py_cr_renderer_render(PyObject *self, PyObject *args) {
 	(void)self; (void)args;
 	PyObject *r_ext;
@@ -235,6 +345,212 @@ static PyObject *py_cr_renderer_render(PyObject *self, PyObject *args) {
 	Py_RETURN_NONE;
 }
 
+/*
+	Progress queue
+	Status callbacks get called from c-ray threads. Instead of grabbing the GIL and calling into
+	Python on every update, we push a small event into a ring buffer and poke a socket. The Python
+	side owns the socket pair, so an event loop can wait on the other end (e.g. asyncio sock_recv())
+	and drain the queue at its own pace. If the consumer falls behind, the oldest events are dropped.
+	Python callbacks set while the queue is attached are chained, and still called after the push.
+*/
+
+enum progress_kind {
+	progress_start = 0,
+	progress_status,
+	progress_stop,
+};
+
+struct progress_event {
+	enum progress_kind kind;
+	double completion;
+	int64_t eta_ms;
+	int64_t samples_per_sec;
+	size_t finished_tiles;
+	size_t total_tiles;
+	size_t finished_passes;
+	bool paused;
+};
+
+#define PROGRESS_QUEUE_SIZE 64
+
+struct progress_queue {
+	v_mutex *lock;
+	struct progress_event events[PROGRESS_QUEUE_SIZE];
+	size_t head;
+	size_t count;
+#ifdef WINDOWS
+	SOCKET wake;
+#else
+	int wake;
+#endif
+	// (fn, user_data) tuples for py_callable_wrapper(), by enum cr_renderer_callback
+	PyObject *chained[cr_cb_status_update + 1];
+};
+
+static void progress_queue_push(struct progress_queue *q, enum progress_kind kind, enum cr_renderer_callback cb, struct cr_renderer_cb_info *info) {
+	struct progress_event e = {
+		.kind = kind,
+		.completion = info->completion,
+		.eta_ms = info->eta_ms,
+		.samples_per_sec = info->samples_per_sec,
+		.total_tiles = info->tiles_count,
+		.finished_passes = info->finished_passes,
+		.paused = info->paused,
+	};
+	for (size_t i = 0; info->tiles && i < info->tiles_count; ++i)
+		e.finished_tiles += info->tiles[i].state == cr_tile_finished;
+	v_mutex_lock(q->lock);
+	if (q->count == PROGRESS_QUEUE_SIZE) {
+		q->head = (q->head + 1) % PROGRESS_QUEUE_SIZE;
+		q->count--;
+	}
+	q->events[(q->head + q->count++) % PROGRESS_QUEUE_SIZE] = e;
+	PyObject *chained = q->chained[cb];
+	v_mutex_release(q->lock);
+	// Socket is non-blocking, if it's full, the reader is already due to wake up.
+	const char c = 0;
+	(void)send(q->wake, &c, 1, MSG_NOSIGNAL);
+	if (chained) py_callable_wrapper(info, chained);
+}
+
+static void progress_cb_start(struct cr_renderer_cb_info *info, void *arg) {
+	progress_queue_push(arg, progress_start, cr_cb_on_start, info);
+}
+
+static void progress_cb_status(struct cr_renderer_cb_info *info, void *arg) {
+	progress_queue_push(arg, progress_status, cr_cb_status_update, info);
+}
+
+static void progress_cb_stop(struct cr_renderer_cb_info *info, void *arg) {
+	progress_queue_push(arg, progress_stop, cr_cb_on_stop, info);
+}
+
+static void progress_queue_destroy(PyObject *capsule) {
+	struct progress_queue *q = PyCapsule_GetPointer(capsule, "cray.progress_queue");
+	if (!q) return;
+	for (size_t i = 0; i < sizeof(q->chained) / sizeof(q->chained[0]); ++i)
+		Py_XDECREF(q->chained[i]);
+	v_mutex_destroy(q->lock);
+	free(q);
+}
+
+// Takes the fileno() of a non-blocking socket to poke when events are pushed.
+// The caller owns the socket and must keep it open while the queue is attached.
+static PyObject *py_progress_queue_new(PyObject *self, PyObject *args) {
+	(void)self;
+	long long wake;
+	if (!PyArg_ParseTuple(args, "L", &wake)) {
+		return NULL;
+	}
+	struct progress_queue *q = calloc(1, sizeof(*q));
+	if (!q) return PyErr_NoMemory();
+	q->lock = v_mutex_create();
+	q->wake = wake;
+	return PyCapsule_New(q, "cray.progress_queue", progress_queue_destroy);
+}
+
+// Call a Python callback after pushing events of that type, like renderer_set_callback() would
+static PyObject *py_progress_queue_chain(PyObject *self, PyObject *args) {
+	(void)self;
+	PyObject *q_ext;
+	enum cr_renderer_callback callback_type;
+	PyObject *py_callback_fn;
+	PyObject *py_user_data = Py_None;
+	if (!PyArg_ParseTuple(args, "OIO|O", &q_ext, &callback_type, &py_callback_fn, &py_user_data)) {
+		return NULL;
+	}
+	struct progress_queue *q = PyCapsule_GetPointer(q_ext, "cray.progress_queue");
+	if (!q) return NULL;
+	if (callback_type > cr_cb_status_update) {
+		PyErr_SetString(PyExc_ValueError, "Only on_start, on_stop and on_status_update can be chained");
+		return NULL;
+	}
+	if (!PyCallable_Check(py_callback_fn)) {
+		PyErr_SetString(PyExc_ValueError, "callback must be callable");
+		return NULL;
+	}
+	PyObject *py_arg = Py_BuildValue("(OO)", py_callback_fn, py_user_data);
+	if (!py_arg) return NULL;
+	// A replaced callback may still be running on a render thread, so it's left alone,
+	// same as with renderer_set_callback()
+	v_mutex_lock(q->lock);
+	q->chained[callback_type] = py_arg;
+	v_mutex_release(q->lock);
+	Py_RETURN_NONE;
+}
+
+// Route start, status and stop callbacks of a renderer into a queue, or back to nothing if q is None.
+// The caller must keep the queue alive while it's attached.
+static PyObject *py_progress_queue_attach(PyObject *self, PyObject *args) {
+	(void)self;
+	PyObject *r_ext, *q_ext;
+	if (!PyArg_ParseTuple(args, "OO", &r_ext, &q_ext)) {
+		return NULL;
+	}
+	struct cr_renderer *r = PyCapsule_GetPointer(r_ext, "cray.cr_renderer");
+	if (!r) return NULL;
+	struct progress_queue *q = NULL;
+	if (q_ext != Py_None) {
+		q = PyCapsule_GetPointer(q_ext, "cray.progress_queue");
+		if (!q) return NULL;
+	}
+	cr_renderer_set_callback(r, cr_cb_on_start, q ? progress_cb_start : NULL, q);
+	cr_renderer_set_callback(r, cr_cb_status_update, q ? progress_cb_status : NULL, q);
+	cr_renderer_set_callback(r, cr_cb_on_stop, q ? progress_cb_stop : NULL, q);
+	Py_RETURN_NONE;
+}
+
+// Drop queued events, e.g. ones left over from an earlier render that nobody consumed.
+static PyObject *py_progress_queue_reset(PyObject *self, PyObject *args) {
+	(void)self;
+	PyObject *q_ext;
+	if (!PyArg_ParseTuple(args, "O", &q_ext)) {
+		return NULL;
+	}
+	struct progress_queue *q = PyCapsule_GetPointer(q_ext, "cray.progress_queue");
+	if (!q) return NULL;
+	v_mutex_lock(q->lock);
+	q->head = 0;
+	q->count = 0;
+	v_mutex_release(q->lock);
+	Py_RETURN_NONE;
+}
+
+// Returns a list of (kind, completion, eta_ms, samples_per_sec, finished_tiles, total_tiles, finished_passes, paused)
+static PyObject *py_progress_queue_drain(PyObject *self, PyObject *args) {
+	(void)self;
+	PyObject *q_ext;
+	if (!PyArg_ParseTuple(args, "O", &q_ext)) {
+		return NULL;
+	}
+	struct progress_queue *q = PyCapsule_GetPointer(q_ext, "cray.progress_queue");
+	if (!q) return NULL;
+	// The caller clears wakeups from the socket first, so anything pushed after this triggers a new one.
+	struct progress_event events[PROGRESS_QUEUE_SIZE];
+	v_mutex_lock(q->lock);
+	const size_t count = q->count;
+	for (size_t i = 0; i < count; ++i)
+		events[i] = q->events[(q->head + i) % PROGRESS_QUEUE_SIZE];
+	q->head = 0;
+	q->count = 0;
+	v_mutex_release(q->lock);
+	PyObject *list = PyList_New(count);
+	if (!list) return NULL;
+	for (size_t i = 0; i < count; ++i) {
+		const struct progress_event *e = &events[i];
+		PyObject *item = Py_BuildValue("(idLLnnnO)", e->kind, e->completion,
+			(long long)e->eta_ms, (long long)e->samples_per_sec,
+			(Py_ssize_t)e->finished_tiles, (Py_ssize_t)e->total_tiles, (Py_ssize_t)e->finished_passes,
+			e->paused ? Py_True : Py_False);
+		if (!item) {
+			Py_DECREF(list);
+			return NULL;
+		}
+		PyList_SET_ITEM(list, i, item);
+	}
+	return list;
+}
+
 static PyObject *py_cr_renderer_start_interactive(PyObject *self, PyObject *args) {
 	(void)self; (void)args;
 	PyObject *r_ext;
@@ -390,6 +706,160 @@ static PyObject *py_cr_mesh_bind_faces(PyObject *self, PyObject *args) {
 	Py_RETURN_NONE;
 }
 
+// Grab a C-contiguous 4-byte element buffer with the expected format and row width.
+// Returns the row count, or -1 with an exception set. None yields 0 rows and an empty view.
+static Py_ssize_t get_array_view(PyObject *obj, Py_buffer *view, char format, Py_ssize_t row_width, const char *name) {
+	*view = (Py_buffer){ 0 };
+	if (obj == Py_None) return 0;
+	if (PyObject_GetBuffer(obj, view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) == -1) {
+		return -1;
+	}
+	// Skip byte order prefix, if any
+	const char *fmt = view->format ? view->format : "B";
+	if (*fmt == '@' || *fmt == '=' || *fmt == '<') fmt++;
+	const bool int_ok = format == 'i' && (*fmt == 'i' || (*fmt == 'l' && sizeof(long) == 4));
+	if (view->itemsize != 4 || fmt[1] != '\0' || (*fmt != format && !int_ok)) {
+		PyErr_Format(PyExc_TypeError, "%s: expected %s array, got format '%s'", name, format == 'f' ? "float32" : "int32", view->format);
+		PyBuffer_Release(view);
+		return -1;
+	}
+	const Py_ssize_t elems = view->len / view->itemsize;
+	if (elems % row_width) {
+		PyErr_Format(PyExc_ValueError, "%s: expected shape (N, %zd)", name, row_width);
+		PyBuffer_Release(view);
+		return -1;
+	}
+	return elems / row_width;
+}
+
+static bool check_indices(const Py_buffer *view, Py_ssize_t limit, const char *name) {
+	const int *idx = view->buf;
+	const Py_ssize_t count = view->len / view->itemsize;
+	for (Py_ssize_t i = 0; i < count; ++i) {
+		if (idx[i] < 0 || idx[i] >= limit) {
+			PyErr_Format(PyExc_IndexError, "%s[%zd] = %d out of range [0, %zd)", name, i, idx[i], limit);
+			return false;
+		}
+	}
+	return true;
+}
+
+static PyObject *py_cr_mesh_bind_arrays(PyObject *self, PyObject *args) {
+	(void)self; (void)args;
+	PyObject *s_ext;
+	cr_mesh mesh;
+	PyObject *v, *f, *n, *t, *m, *n_idx, *t_idx;
+	int borrow;
+	if (!PyArg_ParseTuple(args, "OlOOOOOOOp", &s_ext, &mesh, &v, &f, &n, &t, &m, &n_idx, &t_idx, &borrow)) {
+		return NULL;
+	}
+	struct cr_scene *s = PyCapsule_GetPointer(s_ext, "cray.cr_scene");
+	if (!s) return NULL;
+	if (v == Py_None || f == Py_None) {
+		PyErr_SetString(PyExc_ValueError, "vertices and faces are required");
+		return NULL;
+	}
+	// If normals or uvs are given without explicit indices, they're per-vertex and share the face indices.
+	const bool n_per_vertex = n != Py_None && n_idx == Py_None;
+	const bool t_per_vertex = t != Py_None && t_idx == Py_None;
+	if (n_per_vertex) n_idx = f;
+	if (t_per_vertex) t_idx = f;
+
+	Py_buffer views[7] = { 0 };
+	Py_buffer *v_view = &views[0], *f_view = &views[1], *n_view = &views[2], *t_view = &views[3];
+	Py_buffer *m_view = &views[4], *n_idx_view = &views[5], *t_idx_view = &views[6];
+	PyObject *ret = NULL;
+
+	const Py_ssize_t v_n = get_array_view(v, v_view, 'f', 3, "vertices");
+	if (v_n < 0) goto out;
+	const Py_ssize_t f_n = get_array_view(f, f_view, 'i', MAX_CRAY_VERTEX_COUNT, "faces");
+	if (f_n < 0) goto out;
+	const Py_ssize_t n_n = get_array_view(n, n_view, 'f', 3, "normals");
+	if (n_n < 0) goto out;
+	const Py_ssize_t t_n = get_array_view(t, t_view, 'f', 2, "uvs");
+	if (t_n < 0) goto out;
+	const Py_ssize_t m_n = get_array_view(m, m_view, 'i', 1, "material_idx");
+	if (m_n < 0) goto out;
+	const Py_ssize_t n_idx_n = get_array_view(n_idx, n_idx_view, 'i', MAX_CRAY_VERTEX_COUNT, "normal_idx");
+	if (n_idx_n < 0) goto out;
+	const Py_ssize_t t_idx_n = get_array_view(t_idx, t_idx_view, 'i', MAX_CRAY_VERTEX_COUNT, "uv_idx");
+	if (t_idx_n < 0) goto out;
+
+	if ((m_view->buf && m_n != f_n) || (n_idx_view->buf && n_idx_n != f_n) || (t_idx_view->buf && t_idx_n != f_n)) {
+		PyErr_SetString(PyExc_ValueError, "material_idx, normal_idx and uv_idx must have one row per face");
+		goto out;
+	}
+	if (n_per_vertex && n_n != v_n) {
+		PyErr_Format(PyExc_ValueError, "normals: %zd rows for %zd vertices, pass normal_idx", n_n, v_n);
+		goto out;
+	}
+	if (t_per_vertex && t_n != v_n) {
+		PyErr_Format(PyExc_ValueError, "uvs: %zd rows for %zd vertices, pass uv_idx", t_n, v_n);
+		goto out;
+	}
+	if (!check_indices(f_view, v_n, "faces")) goto out;
+	if (n_idx_view->buf && !check_indices(n_idx_view, n_n, "normal_idx")) goto out;
+	if (t_idx_view->buf && !check_indices(t_idx_view, t_n, "uv_idx")) goto out;
+	if (m_view->buf && !check_indices(m_view, 1 << 16, "material_idx")) goto out;
+
+	cr_mesh_bind_vertex_buf(s, mesh, (struct cr_vertex_buf_param){
+		.vertices = v_view->buf,
+		.vertex_count = v_n,
+		.normals = n_view->buf,
+		.normal_count = n_n,
+		.tex_coords = t_view->buf,
+		.tex_coord_count = t_n,
+		.borrow = borrow,
+	});
+	cr_mesh_bind_face_indices(s, mesh, (struct cr_face_index_param){
+		.vertex_idx = f_view->buf,
+		.normal_idx = n_idx_view->buf,
+		.texture_idx = t_idx_view->buf,
+		.mat_idx = m_view->buf,
+		.face_count = f_n,
+	});
+	ret = Py_None;
+	Py_INCREF(ret);
+out:
+	// When borrowing, the Python side holds on to the arrays for us.
+	for (size_t i = 0; i < sizeof(views) / sizeof(views[0]); ++i) {
+		if (views[i].obj) PyBuffer_Release(&views[i]);
+	}
+	return ret;
+}
+
+static PyObject *py_cr_mesh_update_vertices(PyObject *self, PyObject *args) {
+	(void)self; (void)args;
+	PyObject *s_ext;
+	cr_mesh mesh;
+	PyObject *v, *n;
+	if (!PyArg_ParseTuple(args, "OlOO", &s_ext, &mesh, &v, &n)) {
+		return NULL;
+	}
+	struct cr_scene *s = PyCapsule_GetPointer(s_ext, "cray.cr_scene");
+	if (!s) return NULL;
+	if (v == Py_None) {
+		PyErr_SetString(PyExc_ValueError, "vertices are required");
+		return NULL;
+	}
+	Py_buffer v_view, n_view = { 0 };
+	const Py_ssize_t v_n = get_array_view(v, &v_view, 'f', 3, "vertices");
+	if (v_n < 0) return NULL;
+	const Py_ssize_t n_n = get_array_view(n, &n_view, 'f', 3, "normals");
+	if (n_n < 0) {
+		PyBuffer_Release(&v_view);
+		return NULL;
+	}
+	// Refitting can take a while for big meshes, and doesn't need the GIL
+	bool updated;
+	Py_BEGIN_ALLOW_THREADS
+	updated = cr_mesh_update_vertices(s, mesh, v_view.buf, v_n, n_view.buf, n_n);
+	Py_END_ALLOW_THREADS
+	PyBuffer_Release(&v_view);
+	if (n_view.obj) PyBuffer_Release(&n_view);
+	return PyBool_FromLong(updated);
+}
+
 static PyObject *py_cr_mesh_finalize(PyObject *self, PyObject *args) {
 	(void)self; (void)args;
 	PyObject *s_ext;
@@ -470,7 +940,7 @@ static PyObject *py_cr_camera_get_num_pref(PyObject *self, PyObject *args) {
 	}
 	struct cr_scene *s = PyCapsule_GetPointer(s_ext, "cray.cr_scene");
 	double value = cr_camera_get_num_pref(s, cam, param);
-	return PyLong_FromDouble(value);
+	return PyFloat_FromDouble(value);
 }
 
 static PyObject *py_cr_camera_update(PyObject *self, PyObject *args) {
@@ -485,6 +955,22 @@ static PyObject *py_cr_camera_update(PyObject *self, PyObject *args) {
 	return PyBool_FromLong(ret);
 }
 
+static PyObject *py_cr_camera_set_pose(PyObject *self, PyObject *args) {
+	(void)self; (void)args;
+	PyObject *s_ext;
+	cr_camera cam;
+	struct cr_camera_pose_param p = { 0 };
+	if (!PyArg_ParseTuple(args, "Ol(fff)(fff)d(nn)", &s_ext, &cam,
+			&p.position.x, &p.position.y, &p.position.z,
+			&p.roll, &p.pitch, &p.yaw,
+			&p.fov, &p.res_x, &p.res_y)) {
+		return NULL;
+	}
+	struct cr_scene *s = PyCapsule_GetPointer(s_ext, "cray.cr_scene");
+	bool ret = cr_camera_set_pose(s, cam, p);
+	return PyBool_FromLong(ret);
+}
+
 static PyObject *py_cr_scene_new_material_set(PyObject *self, PyObject *args) {
 	(void)self; (void)args;
 	PyObject *s_ext;
@@ -572,6 +1058,71 @@ static PyObject *py_cr_instance_set_transform(PyObject *self, PyObject *args) {
 	Py_RETURN_NONE;
 }
 
+static PyObject *py_cr_instance_new_n(PyObject *self, PyObject *args) {
+	(void)self; (void)args;
+	PyObject *s_ext;
+	cr_object object;
+	enum cr_object_type type;
+	Py_ssize_t count;
+	if (!PyArg_ParseTuple(args, "OlIn", &s_ext, &object, &type, &count)) {
+		return NULL;
+	}
+	if (type != cr_object_mesh && type != cr_object_sphere) {
+		PyErr_SetString(PyExc_ValueError, "Unknown cr_object_type");
+		return NULL;
+	}
+	if (count < 1) {
+		PyErr_SetString(PyExc_ValueError, "count must be at least 1");
+		return NULL;
+	}
+	struct cr_scene *s = PyCapsule_GetPointer(s_ext, "cray.cr_scene");
+	cr_instance first = cr_instance_new_n(s, object, type, count);
+	return PyLong_FromLongLong(first);
+}
+
+static PyObject *py_cr_instance_set_transforms(PyObject *self, PyObject *args) {
+	(void)self; (void)args;
+	PyObject *s_ext;
+	PyObject *id_buff, *mtx_buff;
+	if (!PyArg_ParseTuple(args, "OOO", &s_ext, &id_buff, &mtx_buff)) {
+		return NULL;
+	}
+	struct cr_scene *s = PyCapsule_GetPointer(s_ext, "cray.cr_scene");
+	if (!s) return NULL;
+	Py_buffer id_view, mtx_view;
+	if (PyObject_GetBuffer(id_buff, &id_view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) == -1) {
+		return NULL;
+	}
+	if (PyObject_GetBuffer(mtx_buff, &mtx_view, PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) == -1) {
+		PyBuffer_Release(&id_view);
+		return NULL;
+	}
+	PyObject *ret = NULL;
+	const char *id_fmt = id_view.format ? id_view.format : "B";
+	if (*id_fmt == '@' || *id_fmt == '=' || *id_fmt == '<') id_fmt++;
+	if (id_view.itemsize != sizeof(cr_instance) || !strchr("qlQL", *id_fmt)) {
+		PyErr_Format(PyExc_TypeError, "instance_ids: expected int64 array, got format '%s'", id_view.format);
+		goto out;
+	}
+	const char *mtx_fmt = mtx_view.format ? mtx_view.format : "B";
+	if (*mtx_fmt == '@' || *mtx_fmt == '=' || *mtx_fmt == '<') mtx_fmt++;
+	if (strcmp(mtx_fmt, "f")) {
+		PyErr_Format(PyExc_TypeError, "matrices: expected float32 array, got format '%s'", mtx_view.format);
+		goto out;
+	}
+	const Py_ssize_t count = id_view.len / id_view.itemsize;
+	if (mtx_view.len != count * (Py_ssize_t)sizeof(float[4][4])) {
+		PyErr_SetString(PyExc_ValueError, "matrices must have shape (len(instance_ids), 4, 4)");
+		goto out;
+	}
+	size_t changed = cr_instance_set_transforms(s, id_view.buf, mtx_view.buf, count);
+	ret = PyLong_FromSize_t(changed);
+out:
+	PyBuffer_Release(&id_view);
+	PyBuffer_Release(&mtx_view);
+	return ret;
+}
+
 static PyObject *py_cr_instance_transform(PyObject *self, PyObject *args) {
 	(void)self; (void)args;
 	PyObject *s_ext;
@@ -662,6 +1213,33 @@ static PyObject *py_cr_load_json(PyObject *self, PyObject *args) {
 	return PyBool_FromLong(ret);
 }
 
+static PyObject *py_cr_write_baked(PyObject *self, PyObject *args) {
+	(void)self;
+	PyObject *r_ext;
+	char *path = NULL;
+	if (!PyArg_ParseTuple(args, "Os", &r_ext, &path)) {
+		return NULL;
+	}
+	struct cr_renderer *r = PyCapsule_GetPointer(r_ext, "cray.cr_renderer");
+	bool ret;
+	Py_BEGIN_ALLOW_THREADS
+	ret = cr_write_baked(r, path);
+	Py_END_ALLOW_THREADS
+	return PyBool_FromLong(ret);
+}
+
+static PyObject *py_cr_load_baked(PyObject *self, PyObject *args) {
+	(void)self;
+	PyObject *r_ext;
+	char *path = NULL;
+	if (!PyArg_ParseTuple(args, "Os", &r_ext, &path)) {
+		return NULL;
+	}
+	struct cr_renderer *r = PyCapsule_GetPointer(r_ext, "cray.cr_renderer");
+	bool ret = cr_load_baked(r, path);
+	return PyBool_FromLong(ret);
+}
+
 static PyObject *py_log_level_set(PyObject *self, PyObject *args) {
 	(void)self;
 	enum cr_log_level level;
@@ -697,6 +1275,15 @@ static PyMethodDef cray_methods[] = {
 	{ "renderer_set_num_pref", py_cr_renderer_set_num_pref, METH_VARARGS, "" },
 	{ "renderer_set_str_pref", py_cr_renderer_set_str_pref, METH_VARARGS, "" },
 	{ "renderer_set_callback", py_cr_renderer_set_callback, METH_VARARGS, "" },
+	{ "renderer_acquire_pass", py_cr_renderer_acquire_pass, METH_VARARGS, "" },
+	{ "renderer_get_dirty_tiles", py_cr_renderer_get_dirty_tiles, METH_VARARGS, "" },
+	{ "renderer_get_stats", py_cr_renderer_get_stats, METH_VARARGS, "" },
+	{ "renderer_add_timing", py_cr_renderer_add_timing, METH_VARARGS, "" },
+	{ "progress_queue_new", py_progress_queue_new, METH_VARARGS, "" },
+	{ "progress_queue_chain", py_progress_queue_chain, METH_VARARGS, "" },
+	{ "progress_queue_attach", py_progress_queue_attach, METH_VARARGS, "" },
+	{ "progress_queue_drain", py_progress_queue_drain, METH_VARARGS, "" },
+	{ "progress_queue_reset", py_progress_queue_reset, METH_VARARGS, "" },
 	{ "renderer_stop", py_cr_renderer_stop, METH_VARARGS, "" },
 	{ "renderer_restart", py_cr_renderer_restart, METH_VARARGS, "" },
 	{ "renderer_toggle_pause", py_cr_renderer_toggle_pause, METH_VARARGS, "" },
@@ -711,24 +1298,31 @@ static PyMethodDef cray_methods[] = {
 	{ "scene_add_sphere", py_cr_scene_add_sphere, METH_VARARGS, "" },
 	{ "mesh_bind_vertex_buf", py_cr_mesh_bind_vertex_buf, METH_VARARGS, "" },
 	{ "mesh_bind_faces", py_cr_mesh_bind_faces, METH_VARARGS, "" },
+	{ "mesh_bind_arrays", py_cr_mesh_bind_arrays, METH_VARARGS, "" },
 	{ "mesh_finalize", py_cr_mesh_finalize, METH_VARARGS, "" },
+	{ "mesh_update_vertices", py_cr_mesh_update_vertices, METH_VARARGS, "" },
 	{ "scene_mesh_new", py_cr_scene_mesh_new, METH_VARARGS, "" },
 	{ "scene_get_mesh", py_cr_scene_get_mesh, METH_VARARGS, "" },
 	{ "camera_new", py_cr_camera_new, METH_VARARGS, "" },
 	{ "camera_set_num_pref", py_cr_camera_set_num_pref, METH_VARARGS, "" },
 	{ "camera_get_num_pref", py_cr_camera_get_num_pref, METH_VARARGS, "" },
 	{ "camera_update", py_cr_camera_update, METH_VARARGS, "" },
+	{ "camera_set_pose", py_cr_camera_set_pose, METH_VARARGS, "" },
 	{ "scene_new_material_set", py_cr_scene_new_material_set, METH_VARARGS, "" },
 	{ "material_set_add", py_cr_material_set_add, METH_VARARGS, "" },
 	{ "material_update", py_cr_material_update, METH_VARARGS, "" },
 	{ "instance_new", py_cr_instance_new, METH_VARARGS, "" },
 	{ "instance_set_transform", py_cr_instance_set_transform, METH_VARARGS, "" },
+	{ "instance_new_n", py_cr_instance_new_n, METH_VARARGS, "" },
+	{ "instance_set_transforms", py_cr_instance_set_transforms, METH_VARARGS, "" },
 	{ "instance_transform", py_cr_instance_transform, METH_VARARGS, "" },
 	{ "instance_bind_material_set", py_cr_instance_bind_material_set, METH_VARARGS, "" },
 	{ "scene_set_background", py_cr_scene_set_background, METH_VARARGS, "" },
 	{ "start_render_worker", py_cr_start_render_worker, METH_VARARGS, "" },
 	{ "send_shutdown_to_workers", py_cr_send_shutdown_to_workers, METH_VARARGS, "" },
 	{ "load_json", py_cr_load_json, METH_VARARGS, "" },
+	{ "write_baked", py_cr_write_baked, METH_VARARGS, "" },
+	{ "load_baked", py_cr_load_baked, METH_VARARGS, "" },
 	{ "log_level_set", py_log_level_set, METH_VARARGS, "" },
 	{ "log_level_get", py_log_level_get, METH_NOARGS, "" },
 	{ "debug_dump_state", py_debug_dump_state, METH_VARARGS, "" },
@@ -1,4 +1,13 @@
+import asyncio
 import ctypes as ct
+import os
+import socket
+import struct
+import time
+import zlib
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from contextlib import contextmanager
 from enum import IntEnum
 
@@ -24,6 +33,9 @@ class _cr_rparam(IntEnum):
 	asset_path = 10
 	node_list = 11
 	blender_mode = 12
+	adaptive_threshold = 13
+	adaptive_min_samples = 14
+	time_limit_ms = 15
 
 def _r_set_num(ptr, param, value):
 	return _lib.renderer_set_num_pref(ptr, param, value)
@@ -47,33 +59,51 @@ class _cr_cb_type(IntEnum):
 class _callbacks:
 	def __init__(self, r_ptr):
 		self.r_ptr = r_ptr
+		# Set once renderer.progress() or render_async() attach a progress queue. It takes over
+		# on_start, on_stop and on_status_update, and calls these callbacks after queueing.
+		self._progress_q = None
+		self._chainable = {}
+
+	def _set(self, kind, fn, user_data):
+		if kind in (_cr_cb_type.on_start, _cr_cb_type.on_stop, _cr_cb_type.on_status_update):
+			self._chainable[kind] = (fn, user_data)
+			if self._progress_q is not None:
+				_lib.progress_queue_chain(self._progress_q, kind, fn, user_data)
+				return
+		_lib.renderer_set_callback(self.r_ptr, kind, fn, user_data)
+
+	def _attach_progress_queue(self, q):
+		_lib.progress_queue_attach(self.r_ptr, q)
+		for kind, (fn, user_data) in self._chainable.items():
+			_lib.progress_queue_chain(q, kind, fn, user_data)
+		self._progress_q = q
 
 	def _set_on_start(self, fn_and_userdata):
 		fn, user_data = fn_and_userdata
 		if not callable(fn):
 			raise TypeError("on_start callback function not callable")
-		_lib.renderer_set_callback(self.r_ptr, _cr_cb_type.on_start, fn, user_data)
+		self._set(_cr_cb_type.on_start, fn, user_data)
 	on_start = property(None, _set_on_start, None, "Tuple (fn,user_data) - fn will be called when c-ray starts rendering, with arguments (cr_cb_info, user_data)")
 
 	def _set_on_stop(self, fn_and_userdata):
 		fn, user_data = fn_and_userdata
 		if not callable(fn):
 			raise TypeError("on_stop callback function not callable")
-		_lib.renderer_set_callback(self.r_ptr, _cr_cb_type.on_stop, fn, user_data)
+		self._set(_cr_cb_type.on_stop, fn, user_data)
 	on_stop = property(None, _set_on_stop, None, "Tuple (fn,user_data) - fn will be called when c-ray is done rendering, with arguments (cr_cb_info, user_data)")
 
 	def _set_on_status_update(self, fn_and_userdata):
 		fn, user_data = fn_and_userdata
 		if not callable(fn):
 			raise TypeError("on_status_update callback function not callable")
-		_lib.renderer_set_callback(self.r_ptr, _cr_cb_type.on_status_update, fn, user_data)
+		self._set(_cr_cb_type.on_status_update, fn, user_data)
 	on_status_update = property(None, _set_on_status_update, None, "Tuple (fn,user_data) - fn will be called periodically while c-ray is rendering, with arguments (cr_cb_info, user_data)")
 
 	def _set_on_interactive_pass_finished(self, fn_and_userdata):
 		fn, user_data = fn_and_userdata
 		if not callable(fn):
 			raise TypeError("on_interactive_pass_finished callback function not callable")
-		_lib.renderer_set_callback(self.r_ptr, _cr_cb_type.on_interactive_pass_finished, fn, user_data)
+		self._set(_cr_cb_type.on_interactive_pass_finished, fn, user_data)
 	on_interactive_pass_finished = property(None, _set_on_interactive_pass_finished, None, "Tuple (fn,user_data) - fn will be called every time c-ray finishes rendering a pass in interactive mode, with arguments (cr_cb_info, user_data)")
 
 class _pref:
@@ -188,6 +218,24 @@ class _pref:
 		_r_set_num(self.r_ptr, _cr_rparam.blender_mode, value)
 	blender_mode = property(_get_blender_mode, _set_blender_mode, None, "")
 
+	def _get_adaptive_threshold(self):
+		return float(_r_get_str(self.r_ptr, _cr_rparam.adaptive_threshold))
+	def _set_adaptive_threshold(self, value):
+		_r_set_str(self.r_ptr, _cr_rparam.adaptive_threshold, str(float(value)))
+	adaptive_threshold = property(_get_adaptive_threshold, _set_adaptive_threshold, None, "Stop rendering tiles once their estimated noise drops below this, e.g. 0.01. 0 disables")
+
+	def _get_adaptive_min_samples(self):
+		return _r_get_num(self.r_ptr, _cr_rparam.adaptive_min_samples)
+	def _set_adaptive_min_samples(self, value):
+		_r_set_num(self.r_ptr, _cr_rparam.adaptive_min_samples, value)
+	adaptive_min_samples = property(_get_adaptive_min_samples, _set_adaptive_min_samples, None, "Samples every tile gets before adaptive sampling can stop it")
+
+	def _get_time_limit_ms(self):
+		return _r_get_num(self.r_ptr, _cr_rparam.time_limit_ms)
+	def _set_time_limit_ms(self, value):
+		_r_set_num(self.r_ptr, _cr_rparam.time_limit_ms, value)
+	time_limit_ms = property(_get_time_limit_ms, _set_time_limit_ms, None, "Render in passes over the whole image until this many milliseconds have passed, 0 disables. samples is the upper limit")
+
 class _version:
 	def _get_semantic(self):
 		return _lib.get_version()
@@ -210,9 +258,11 @@ class cr_face(ct.Structure):
 	]
 
 class mesh:
-	def __init__(self, scene_ptr, name):
+	def __init__(self, scene_ptr, name, borrowed):
 		self.scene_ptr = scene_ptr
 		self.name = name
+		# Shared with the renderer, see renderer._borrowed
+		self._borrowed = borrowed
 		self.instances = []
 		self.cr_idx = _lib.scene_mesh_new(self.scene_ptr, self.name)
 
@@ -245,17 +295,57 @@ class mesh:
 			capsule_t = ct.pythonapi.PyCapsule_New(ptr_t, name_t, None)
 
 		_lib.mesh_bind_vertex_buf(self.scene_ptr, self.cr_idx, capsule_v, num_verts, capsule_n, num_normals, capsule_t, num_texcoords)
+		self._borrowed.pop(self.cr_idx, None)
 
 	def bind_faces(self, faces, face_count):
 		_lib.mesh_bind_faces(self.scene_ptr, self.cr_idx, faces, face_count)
 
+	def bind_arrays(self, vertices, faces, normals=None, uvs=None, material_idx=None, normal_idx=None, uv_idx=None, borrow=False):
+		"""
+		Bind mesh data from C-contiguous arrays, e.g. NumPy, in one call.
+		vertices and normals are (N, 3) float32, uvs are (N, 2) float32.
+		faces, normal_idx and uv_idx are (F, 3) int32, material_idx is (F,) int32.
+		If normal_idx or uv_idx are omitted, normals and uvs are indexed with faces, and
+		must then have one row per vertex.
+		With borrow=True, vertex data is referenced instead of copied. The renderer then
+		keeps the arrays alive until this mesh is rebound or the renderer is closed, and
+		they must not be modified until then.
+		"""
+		_lib.mesh_bind_arrays(self.scene_ptr, self.cr_idx, vertices, faces, normals, uvs, material_idx, normal_idx, uv_idx, borrow)
+		if borrow:
+			self._borrowed[self.cr_idx] = (vertices, normals, uvs)
+		else:
+			self._borrowed.pop(self.cr_idx, None)
+
 	def finalize(self):
 		_lib.mesh_finalize(self.scene_ptr, self.cr_idx)
 
+	def update_vertices(self, vertices, normals=None):
+		"""
+		Move the vertices of a finalized mesh without changing its faces, e.g. for
+		deforming geometry. vertices and normals are (N, 3) float32 arrays, with the same
+		row counts as the arrays the mesh was bound with. The BVH gets refitted instead
+		of rebuilt. Returns False if the counts don't match, bind_arrays() a new mesh then.
+		"""
+		updated = _lib.mesh_update_vertices(self.scene_ptr, self.cr_idx, vertices, normals)
+		if updated:
+			# Borrowed arrays get copied before they're updated, c-ray doesn't need them anymore
+			self._borrowed.pop(self.cr_idx, None)
+		return updated
+
 	def instance_new(self):
 		self.instances.append(instance(self.scene_ptr, self, 0))
 		return self.instances[-1]
 
+	def instances_new(self, count):
+		"""
+		Create count instances of this mesh with one call. Returns a list of the new instances.
+		"""
+		first = _lib.instance_new_n(self.scene_ptr, self.cr_idx, 0, count)
+		new = [instance(self.scene_ptr, self, 0, first + i) for i in range(count)]
+		self.instances.extend(new)
+		return new
+
 class sphere:
 	def __init__(self, scene_ptr, radius):
 		self.scene_ptr = scene_ptr
@@ -280,98 +370,135 @@ class _cam_param(IntEnum):
 def _cam_get_num(scene_ptr, cam_idx, param):
 	return _lib.camera_get_num_pref(scene_ptr, cam_idx, param)
 
-def _cam_set_num(scene_ptr, cam_idx, param, value):
-	_lib.camera_set_num_pref(scene_ptr, cam_idx, param, value)
-	# Weird. Could just do this internally, no?
-	_lib.camera_update(scene_ptr, cam_idx)
-
 class _cam_pref:
 	def __init__(self, scene_ptr, cam_idx):
 		self.scene_ptr = scene_ptr
 		self.cam_idx = cam_idx
+		# Nonzero within camera.batch(), recompute is then deferred until the outermost batch exits
+		self.batch_depth = 0
+
+	def _set_num(self, param, value):
+		_lib.camera_set_num_pref(self.scene_ptr, self.cam_idx, param, value)
+		if not self.batch_depth:
+			_lib.camera_update(self.scene_ptr, self.cam_idx)
 
 	def _get_fov(self):
 		return _cam_get_num(self.scene_ptr, self.cam_idx, _cam_param.fov)
 	def _set_fov(self, value):
-		return _cam_set_num(self.scene_ptr, self.cam_idx, _cam_param.fov, value)
+		return self._set_num(_cam_param.fov, value)
 	fov = property(_get_fov, _set_fov, None, "Camera field of view, in radians")
 
 	def _get_focus_distance(self):
 		return _cam_get_num(self.scene_ptr, self.cam_idx, _cam_param.focus_distance)
 	def _set_focus_distance(self, value):
-		return _cam_set_num(self.scene_ptr, self.cam_idx, _cam_param.focus_distance, value)
+		return self._set_num(_cam_param.focus_distance, value)
 	focus_distance = property(_get_focus_distance, _set_focus_distance, None, "Camera focus distance, in meters")
 
 	def _get_fstops(self):
 		return _cam_get_num(self.scene_ptr, self.cam_idx, _cam_param.fstops)
 	def _set_fstops(self, value):
-		return _cam_set_num(self.scene_ptr, self.cam_idx, _cam_param.fstops, value)
+		return self._set_num(_cam_param.fstops, value)
 	fstops = property(_get_fstops, _set_fstops, None, "Camera aperture, in f-stops")
 
 	def _get_pose_x(self):
 		return _cam_get_num(self.scene_ptr, self.cam_idx, _cam_param.pose_x)
 	def _set_pose_x(self, value):
-		return _cam_set_num(self.scene_ptr, self.cam_idx, _cam_param.pose_x, value)
+		return self._set_num(_cam_param.pose_x, value)
 	pose_x = property(_get_pose_x, _set_pose_x, None, "Camera x coordinate in world space")
 
 	def _get_pose_y(self):
 		return _cam_get_num(self.scene_ptr, self.cam_idx, _cam_param.pose_y)
 	def _set_pose_y(self, value):
-		return _cam_set_num(self.scene_ptr, self.cam_idx, _cam_param.pose_y, value)
+		return self._set_num(_cam_param.pose_y, value)
 	pose_y = property(_get_pose_y, _set_pose_y, None, "Camera y coordinate in world space")
 
 	def _get_pose_z(self):
 		return _cam_get_num(self.scene_ptr, self.cam_idx, _cam_param.pose_z)
 	def _set_pose_z(self, value):
-		return _cam_set_num(self.scene_ptr, self.cam_idx, _cam_param.pose_z, value)
+		return self._set_num(_cam_param.pose_z, value)
 	pose_z = property(_get_pose_z, _set_pose_z, None, "Camera z coordinate in world space")
 
 	def _get_pose_roll(self):
 		return _cam_get_num(self.scene_ptr, self.cam_idx, _cam_param.pose_roll)
 	def _set_pose_roll(self, value):
-		return _cam_set_num(self.scene_ptr, self.cam_idx, _cam_param.pose_roll, value)
+		return self._set_num(_cam_param.pose_roll, value)
 	pose_roll = property(_get_pose_roll, _set_pose_roll, None, "Camera roll, in radians")
 
 	def _get_pose_pitch(self):
 		return _cam_get_num(self.scene_ptr, self.cam_idx, _cam_param.pose_pitch)
 	def _set_pose_pitch(self, value):
-		return _cam_set_num(self.scene_ptr, self.cam_idx, _cam_param.pose_pitch, value)
+		return self._set_num(_cam_param.pose_pitch, value)
 	pose_pitch = property(_get_pose_pitch, _set_pose_pitch, None, "Camera pitch, in radians")
 
 	def _get_pose_yaw(self):
 		return _cam_get_num(self.scene_ptr, self.cam_idx, _cam_param.pose_yaw)
 	def _set_pose_yaw(self, value):
-		return _cam_set_num(self.scene_ptr, self.cam_idx, _cam_param.pose_yaw, value)
+		return self._set_num(_cam_param.pose_yaw, value)
 	pose_yaw = property(_get_pose_yaw, _set_pose_yaw, None, "Camera yaw, in radians")
 
 	def _get_time(self):
 		return _cam_get_num(self.scene_ptr, self.cam_idx, _cam_param.time)
 	def _set_time(self, value):
-		return _cam_set_num(self.scene_ptr, self.cam_idx, _cam_param.time, value)
+		return self._set_num(_cam_param.time, value)
 	time = property(_get_time, _set_time, None, "Camera animation t")
 
 	def _get_res_x(self):
 		return _cam_get_num(self.scene_ptr, self.cam_idx, _cam_param.res_x)
 	def _set_res_x(self, value):
-		return _cam_set_num(self.scene_ptr, self.cam_idx, _cam_param.res_x, value)
+		return self._set_num(_cam_param.res_x, value)
 	res_x = property(_get_res_x, _set_res_x, None, "Camera x resolution, in pixels")
 	def _get_res_y(self):
 		return _cam_get_num(self.scene_ptr, self.cam_idx, _cam_param.res_y)
 	def _set_res_y(self, value):
-		return _cam_set_num(self.scene_ptr, self.cam_idx, _cam_param.res_y, value)
+		return self._set_num(_cam_param.res_y, value)
 	res_y = property(_get_res_y, _set_res_y, None, "Camera y resolution, in pixels")
 	def _get_blender_coord(self):
 		return _cam_get_num(self.scene_ptr, self.cam_idx, _cam_param.blender_coord)
 	def _set_blender_coord(self, value):
-		return _cam_set_num(self.scene_ptr, self.cam_idx, _cam_param.blender_coord, value)
+		return self._set_num(_cam_param.blender_coord, value)
 	blender_coord = property(_get_blender_coord, _set_blender_coord, None, "Boolean toggle to use Blender coordinate system in c-ray")
 class camera:
-	def __init__(self, scene_ptr):
+	def __init__(self, scene_ptr, cr_idx = None):
 		self.scene_ptr = scene_ptr
-		self.cr_idx = _lib.camera_new(self.scene_ptr)
+		# cr_idx is passed in for cameras that already exist, e.g. ones loaded from a scene file
+		self.cr_idx = _lib.camera_new(self.scene_ptr) if cr_idx is None else cr_idx
 		self.opts = _cam_pref(self.scene_ptr, self.cr_idx)
 		self.params = {}
 
+	def set_pose(self, position, euler, fov = None, res = None):
+		"""
+		Set position (x, y, z), orientation (roll, pitch, yaw) in radians and optionally
+		fov and resolution (x, y) at once. The camera is only recomputed once.
+		"""
+		if self.opts.batch_depth:
+			# The enclosing batch recomputes on exit
+			self.opts.pose_x, self.opts.pose_y, self.opts.pose_z = position
+			self.opts.pose_roll, self.opts.pose_pitch, self.opts.pose_yaw = euler
+			if fov is not None:
+				self.opts.fov = fov
+			if res is not None:
+				self.opts.res_x, self.opts.res_y = res
+			return
+		if res is not None and (res[0] < 1 or res[1] < 1):
+			raise ValueError("Invalid resolution {}".format(res))
+		_lib.camera_set_pose(self.scene_ptr, self.cr_idx, tuple(position), tuple(euler), fov if fov is not None else 0.0, tuple(res) if res is not None else (0, 0))
+
+	@contextmanager
+	def batch(self):
+		"""
+		Defer camera recompute while setting several opts, e.g.
+		with cam.batch():
+			cam.opts.fov = 80
+			cam.opts.pose_x = 1.0
+		"""
+		self.opts.batch_depth += 1
+		try:
+			yield self
+		finally:
+			self.opts.batch_depth -= 1
+			if not self.opts.batch_depth:
+				_lib.camera_update(self.scene_ptr, self.cr_idx)
+
 def inst_type(IntEnum):
 	mesh = 0
 	sphere = 1
@@ -382,13 +509,14 @@ class cr_matrix(ct.Structure):
 	]
 
 class instance:
-	def __init__(self, scene_ptr, object, type):
+	def __init__(self, scene_ptr, object, type, cr_idx = None):
 		self.scene_ptr = scene_ptr
 		self.object = object
 		self.type = type
 		self.material_set = None
 		self.matrix = None
-		self.cr_idx = _lib.instance_new(self.scene_ptr, self.object.cr_idx, self.type)
+		# cr_idx is passed in when the instance was already created in a batch
+		self.cr_idx = _lib.instance_new(self.scene_ptr, self.object.cr_idx, self.type) if cr_idx is None else cr_idx
 
 	def set_transform(self, matrix):
 		if self.matrix == matrix:
@@ -436,8 +564,9 @@ class material_set:
 		print("matset {} material {} ({}) updated".format(self.cr_idx, matname, self.materials[matname]))
 
 class scene:
-	def __init__(self, cr_renderer):
+	def __init__(self, cr_renderer, borrowed):
 		self.cr_renderer = cr_renderer
+		self.borrowed = borrowed
 		self.cr_ptr = _lib.renderer_scene_get(self.cr_renderer)
 		self.meshes = {}
 		self.cameras = {}
@@ -448,10 +577,22 @@ class scene:
 	def totals(self):
 		return _lib.scene_totals(self.cr_ptr)
 	def mesh_new(self, name):
-		self.meshes[name] = mesh(self.cr_ptr, name)
+		self.meshes[name] = mesh(self.cr_ptr, name, self.borrowed)
 		return self.meshes[name]
 	def sphere_new(self, radius):
 		return sphere(self.cr_ptr, radius)
+	def set_transforms(self, instance_ids, matrices):
+		"""
+		Set transforms for many instances with one call, and return how many changed.
+		instance_ids is an int64 array, or a sequence of instances or instance IDs.
+		matrices is a (len(instance_ids), 4, 4) float32 array of row-major matrices.
+		Note that this bypasses the matrix cached by instance.set_transform()
+		"""
+		try:
+			memoryview(instance_ids)
+		except TypeError:
+			instance_ids = array('q', (i.cr_idx if isinstance(i, instance) else i for i in instance_ids))
+		return _lib.instance_set_transforms(self.cr_ptr, instance_ids, matrices)
 	def camera_new(self, name):
 		self.cameras[name] = camera(self.cr_ptr)
 		return self.cameras[name]
@@ -468,19 +609,73 @@ class scene:
 		capsule = ct.pythonapi.PyCapsule_New(ct.byref(material.cr_struct), name, None)
 		return _lib.scene_set_background(self.cr_ptr, capsule)
 
+class progress_kind(IntEnum):
+	start = 0
+	status = 1
+	stop = 2
+
+progress_update = namedtuple('progress_update', ['kind', 'completion', 'eta_ms', 'samples_per_sec', 'finished_tiles', 'total_tiles', 'finished_passes', 'paused'])
+
+tile_rect = namedtuple('tile_rect', ['x', 'y', 'width', 'height'])
+
+class phase(IntEnum):
+	json_parse = 0
+	mesh_load = 1
+	bvh_build = 2
+	top_level_bvh = 3
+	render = 4
+	encode = 5
+
+class mem_category(IntEnum):
+	geometry = 0
+	bvh = 1
+	textures = 2
+	node_pool = 3
+	framebuffer = 4
+
+# Scenes with this extension are loaded with renderer.load_baked()
+baked_extension = '.crbake'
+
 class renderer:
 	ret_bitmap = None
+	_progress_q = None
+	_progress_socks = None
+	_progress_pending = ()
 	def __init__(self, path = None):
 		self.obj_ptr = _lib.new_renderer()
+		# Arrays lent to c-ray with mesh.bind_arrays(borrow=True), by mesh index. They have to
+		# live as long as the C scene does, which outlives any scene or mesh object here.
+		self._borrowed = {}
 		self.prefs = _pref(self.obj_ptr)
 		self.callbacks = _callbacks(self.obj_ptr)
 		self.interactive = False
 		if path != None:
-			_lib.load_json(self.obj_ptr, path)
+			if path.endswith(baked_extension):
+				self.load_baked(path)
+			else:
+				_lib.load_json(self.obj_ptr, path)
+
+	def load_baked(self, path):
+		"""
+		Load a scene written by write_baked(). It's mmap()'d, so there is no mesh parsing,
+		texture decoding or BVH building, and processes loading the same file share its memory.
+		"""
+		return _lib.load_baked(self.obj_ptr, path)
+
+	def write_baked(self, path):
+		"""
+		Write the loaded scene and render settings to path as a baked scene
+		"""
+		return _lib.write_baked(self.obj_ptr, path)
 
 	def close(self):
 		_lib.renderer_destroy(self.obj_ptr)
 		del(self.obj_ptr)
+		self._borrowed.clear()
+		if self._progress_socks is not None:
+			for sock in self._progress_socks:
+				sock.close()
+			self._progress_socks = None
 
 	def stop(self):
 		self.interactive = False
@@ -495,19 +690,134 @@ class renderer:
 	def render(self):
 		_lib.renderer_render(self.obj_ptr)
 
+	def _progress_queue(self):
+		# Status updates get pushed into a native queue from c-ray threads without taking the GIL,
+		# and c-ray pokes the write end of a socket pair to wake up progress()
+		if self._progress_q is None:
+			self._progress_socks = socket.socketpair()
+			for sock in self._progress_socks:
+				sock.setblocking(False)
+			self._progress_q = _lib.progress_queue_new(self._progress_socks[1].fileno())
+			self.callbacks._attach_progress_queue(self._progress_q)
+		return self._progress_q
+
+	def _progress_clear_wakeups(self):
+		try:
+			while self._progress_socks[0].recv(64):
+				pass
+		except BlockingIOError:
+			pass
+
+	async def render_async(self):
+		"""
+		Render without blocking the running asyncio event loop. Track it with renderer.progress()
+		"""
+		# Updates of an earlier render that weren't consumed would otherwise end progress() right away
+		q = self._progress_queue()
+		self._progress_clear_wakeups()
+		_lib.progress_queue_reset(q)
+		self._progress_pending = ()
+		loop = asyncio.get_running_loop()
+		await loop.run_in_executor(None, _lib.renderer_render, self.obj_ptr)
+
+	async def progress(self):
+		"""
+		Async generator of progress_update tuples for the current render, ending after the stop update:
+		task = asyncio.create_task(r.render_async())
+		async for update in r.progress():
+			print(update.completion)
+		await task
+		Updates may be dropped if the consumer falls far behind.
+		"""
+		q = self._progress_queue()
+		loop = asyncio.get_running_loop()
+		while True:
+			events, self._progress_pending = self._progress_pending, ()
+			if not events:
+				# sock_recv() works with both selector and proactor event loops
+				await loop.sock_recv(self._progress_socks[0], 64)
+				# Clear wakeups before draining, so anything pushed after this triggers a new one.
+				self._progress_clear_wakeups()
+				events = _lib.progress_queue_drain(q)
+			for i, event in enumerate(events):
+				update = progress_update(progress_kind(event[0]), *event[1:])
+				yield update
+				if update.kind == progress_kind.stop:
+					# Anything after the stop is from a later render, keep it for the next progress()
+					self._progress_pending = events[i + 1:]
+					return
+
 	def start_interactive(self):
 		self.interactive = True
 		_lib.renderer_start_interactive(self.obj_ptr)
 
 	def get_result(self):
 		# TODO: Would also be nice if the result object as well as renderer.prefs would have dims as a tuple/array? I think that's a nicer way to express those in python.
-		if self.ret_bitmap is not None:
-			return self.ret_bitmap
+		# The result buffer gets reallocated when the interactive renderer is resized, so
+		# don't hold on to a stale one here. The returned bitmap supports the buffer
+		# protocol, so np.asarray(renderer.get_result()) is a zero-copy (height, width, channels) view.
 		self.ret_bitmap = _lib.renderer_get_result(self.obj_ptr)
 		return self.ret_bitmap
 
+	def passes(self, poll_ms = 100):
+		"""
+		Generator of (pass, bitmap) tuples in interactive mode, one per finished pass.
+		Each bitmap is a consistent snapshot where every tile is from at least that pass,
+		and render threads keep going while it's being read. It is only valid until the
+		next iteration, so copy it (e.g. np.array(bitmap)) to hang on to it.
+		Ends once all samples are done or the interactive renderer is stopped.
+		"""
+		last = 0
+		while True:
+			ret = _lib.renderer_acquire_pass(self.obj_ptr, last, poll_ms)
+			if ret is None:
+				if not self.interactive:
+					return
+				continue
+			last, bitmap = ret
+			yield ret
+			if last >= self.prefs.samples:
+				return
+
+	def dirty_tiles(self):
+		"""
+		List of (x, y, width, height) rects of the result that changed since the last call,
+		with y counted from the bottom row, so np.asarray(bitmap)[y:y + height, x:x + width]
+		is the tile. Every tile is returned again after the result is cleared or resized.
+		"""
+		return [tile_rect(*rect) for rect in _lib.renderer_get_dirty_tiles(self.obj_ptr)]
+
+	def stats(self):
+		"""
+		Timings and peak memory use, as a dict like:
+		{
+			'timings': [{ 'phase': 'bvh_build', 'name': 'Plane', 'ms': 0.3, 'count': 1 }, ...],
+			'total_ms': { 'bvh_build': 0.3, ... },
+			'peak_bytes': { 'geometry': 2660, 'bvh': 696, ... },
+		}
+		There is one timing per phase and name, in the order they first finished. If a phase
+		ran several times for the same name, ms is the total of count runs. name is None for
+		phases that aren't about one file or mesh. Peak bytes include temporary buffers of
+		mesh loads, texture decodes and BVH builds.
+		"""
+		timings, peak_bytes = _lib.renderer_get_stats(self.obj_ptr)
+		out = { 'timings': [], 'total_ms': {}, 'peak_bytes': {} }
+		for p, name, us, count in timings:
+			key = phase(p).name
+			out['timings'].append({ 'phase': key, 'name': name, 'ms': us / 1000.0, 'count': count })
+			out['total_ms'][key] = out['total_ms'].get(key, 0.0) + us / 1000.0
+		for category, nbytes in zip(mem_category, peak_bytes):
+			out['peak_bytes'][category.name] = nbytes
+		return out
+
+	def add_timing(self, p, name, seconds):
+		"""
+		Record a timing for work done outside c-ray, like encoding, so it shows up in stats()
+		"""
+		_lib.renderer_add_timing(self.obj_ptr, p, name, int(seconds * 1000000))
+
 	def scene_get(self):
-		return scene(self.obj_ptr)
+		return scene(self.obj_ptr, self._borrowed)
 
 	def debug_dump(self):
 		_lib.debug_dump_state(self.obj_ptr)
@@ -527,6 +837,223 @@ class renderer:
 	def __exit__(self, exc_type, exc_value, traceback):
 		self.close()
 
+def encode_png(bitmap):
+	"""
+	Encode a float bitmap (e.g. renderer.get_result()) as an 8-bit sRGB PNG, returns bytes
+	"""
+	width, height, stride = bitmap.width, bitmap.height, bitmap.stride
+	pixels = bytearray(width * height * stride)
+	bitmap.to_srgb_u8(pixels)
+	row = width * stride
+	# Each row is prefixed with filter type 0 (none)
+	rows = b''.join(b'\x00' + pixels[y * row:(y + 1) * row] for y in range(height))
+	def chunk(kind, data):
+		return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+	color_type = { 1: 0, 2: 4, 3: 2, 4: 6 }[stride]
+	return b''.join((
+		b'\x89PNG\r\n\x1a\n',
+		chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)),
+		chunk(b'IDAT', zlib.compress(rows, 6)),
+		chunk(b'IEND', b''),
+	))
+
+def write_png(bitmap, path):
+	"""
+	Write a float bitmap (e.g. renderer.get_result()) to path as an 8-bit sRGB PNG
+	"""
+	with open(path, 'wb') as f:
+		f.write(encode_png(bitmap))
+
+class frame:
+	"""
+	Changes to apply before rendering one frame of an animation. See animation.frames()
+	"""
+	def __init__(self, index):
+		self.index = index
+		self.pose = None
+		self.samples = None
+		self.transforms = {}
+		self.materials = []
+
+	def camera_pose(self, position, euler, fov = None):
+		"""
+		Camera position (x, y, z) and orientation (roll, pitch, yaw) in radians, see camera.set_pose()
+		"""
+		self.pose = (position, euler, fov)
+
+	def instance_transform(self, instance_id, matrix):
+		"""
+		Row-major 4x4 transform for an instance, as nested sequences or 16 floats.
+		Instances loaded from a scene file are numbered in load order.
+		"""
+		if len(matrix) == 4:
+			matrix = [v for row in matrix for v in row]
+		if len(matrix) != 16:
+			raise ValueError("Expected a 4x4 matrix, got {} values".format(len(matrix)))
+		self.transforms[instance_id] = matrix
+
+	def material(self, material_set, material, shader):
+		"""
+		Replace material number material in material_set with shader, a node tree from c_ray.nodes
+		"""
+		self.materials.append((material_set, material, shader))
+
+	def set_samples(self, samples):
+		self.samples = samples
+
+class animation:
+	"""
+	Render a sequence of frames of one scene in a single process. The scene is loaded
+	once, so meshes, textures and mesh BVHs are reused between frames, and only the
+	top-level BVH gets rebuilt when instances move. For example:
+
+	with c_ray.animation('input/hdr.json') as anim:
+		def spin(f):
+			f.camera_pose((0.0, 0.1, -0.7), (0.0, math.radians(-f.index), 0.0))
+		anim.render(range(360), spin, 'output/spin/rendered_{:04d}.png')
+	"""
+	def __init__(self, path, camera_idx = 0):
+		self.renderer = renderer(path)
+		self.scene = self.renderer.scene_get()
+		self.renderer.prefs.cam_idx = camera_idx
+		# c-ray ignores indices of cameras the scene doesn't have
+		if self.renderer.prefs.cam_idx != camera_idx:
+			self.renderer.close()
+			raise ValueError("Scene {} has no camera {}".format(path, camera_idx))
+		self.camera = camera(self.scene.cr_ptr, camera_idx)
+
+	def close(self):
+		self.renderer.close()
+
+	def _apply(self, f):
+		if f.samples is not None:
+			self.renderer.prefs.samples = f.samples
+		if f.pose is not None:
+			position, euler, fov = f.pose
+			self.camera.set_pose(position, euler, fov)
+		if f.transforms:
+			ids = array('q', f.transforms.keys())
+			matrices = array('f', (v for m in f.transforms.values() for v in m))
+			self.scene.set_transforms(ids, matrices)
+		if f.materials:
+			ct.pythonapi.PyCapsule_New.argtypes = [ct.c_void_p, ct.c_char_p, ct.c_void_p]
+			ct.pythonapi.PyCapsule_New.restype = ct.py_object
+			for material_set, material, shader in f.materials:
+				capsule = ct.pythonapi.PyCapsule_New(ct.byref(shader.cr_struct), b'cray.shader_node', None)
+				_lib.material_update(self.scene.cr_ptr, material_set, material, capsule)
+
+	def frames(self, indices, update):
+		"""
+		Generator of (index, bitmap) tuples. update(frame) is called before rendering each
+		frame, with a frame object to record changes on. Changes carry over to later frames.
+		The bitmap is only valid until the next frame, copy it to hang on to it.
+		"""
+		for index in indices:
+			f = frame(index)
+			update(f)
+			self._apply(f)
+			self.renderer.render()
+			yield index, self.renderer.get_result()
+
+	def render(self, indices, update, output):
+		"""
+		Render frames and write each to output.format(index) as a PNG
+		"""
+		directory = os.path.dirname(output.format(0))
+		if directory:
+			os.makedirs(directory, exist_ok = True)
+		for index, bitmap in self.frames(indices, update):
+			start = time.monotonic()
+			write_png(bitmap, output.format(index))
+			self.renderer.add_timing(phase.encode, output.format(index), time.monotonic() - start)
+
+	def __enter__(self):
+		return self
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+# Per-process state of farm workers
+_farm_animation = None
+
+def _farm_worker_init(path, camera_idx, threads, level):
+	global _farm_animation
+	log_level_set(level)
+	_farm_animation = animation(path, camera_idx)
+	_farm_animation.renderer.prefs.threads = threads
+
+def _farm_worker_render(indices, update):
+	start = time.monotonic()
+	frames = [(index, encode_png(bitmap)) for index, bitmap in _farm_animation.frames(indices, update)]
+	return frames, time.monotonic() - start
+
+farm_stats = namedtuple('farm_stats', ['frames', 'seconds', 'render_seconds', 'frames_per_hour'])
+
+class farm:
+	"""
+	Render animation frames on a pool of worker processes. Each worker loads the scene
+	once, like animation does, and renders chunks of frames with a few threads. For small
+	frames, this keeps cores busy where one renderer would idle at the tail of every frame.
+
+	Pass in a baked scene (see renderer.write_baked()) to make the per-worker load nearly free, and to
+	have workers share one copy of mesh, BVH and texture data through the page cache.
+
+	Frames are rendered out of order in different processes, so update(frame) must be a
+	picklable module-level function that only depends on frame.index:
+
+	def spin(f):
+		f.camera_pose((0.0, 0.1, -0.7), (0.0, math.radians(-f.index), 0.0))
+	if __name__ == '__main__':
+		with c_ray.farm('input/hdr.json', workers = 4) as f:
+			print(f.render(range(360), spin, 'output/spin/rendered_{:04d}.png'))
+	"""
+	def __init__(self, path, workers = None, threads = None, camera_idx = 0, chunk = 4):
+		cores = os.cpu_count() or 1
+		self.workers = workers if workers else max(1, cores // 2)
+		self.threads = threads if threads else max(1, cores // self.workers)
+		self.chunk = chunk
+		self.pool = ProcessPoolExecutor(
+			max_workers = self.workers,
+			initializer = _farm_worker_init,
+			initargs = (path, camera_idx, self.threads, log_level_get()),
+		)
+
+	def close(self):
+		self.pool.shutdown()
+
+	def frames(self, indices, update):
+		"""
+		Generator of (index, png bytes) tuples, in the order frames finish
+		"""
+		self.render_seconds = 0.0
+		indices = list(indices)
+		chunks = [indices[i:i + self.chunk] for i in range(0, len(indices), self.chunk)]
+		futures = [self.pool.submit(_farm_worker_render, c, update) for c in chunks]
+		for future in as_completed(futures):
+			frames, seconds = future.result()
+			self.render_seconds += seconds
+			yield from frames
+
+	def render(self, indices, update, output):
+		"""
+		Render frames and write each to output.format(index) as a PNG. Returns farm_stats.
+		"""
+		directory = os.path.dirname(output.format(0))
+		if directory:
+			os.makedirs(directory, exist_ok = True)
+		start = time.monotonic()
+		count = 0
+		for index, png in self.frames(indices, update):
+			with open(output.format(index), 'wb') as f:
+				f.write(png)
+			count += 1
+		seconds = time.monotonic() - start
+		return farm_stats(count, seconds, self.render_seconds, count * 3600.0 / seconds if seconds > 0 else 0.0)
+
+	def __enter__(self):
+		return self
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
 def start_render_worker(port, thread_limit):
 	_lib.start_render_worker(port, thread_limit)
 
@@ -10,6 +10,9 @@ from . vector import _vector_op
 from . value import _math_op
 from . value import _component
 
+import hashlib
+from collections import OrderedDict
+
 def convert_background(nt):
 	if not nt:
 		print("No background shader set, bailing out")
@@ -39,6 +42,124 @@ def convert_node_tree(bl_depsgraph, name, nt):
 		return NodeShaderDiffuse(NodeColorConstant(cr_color(0.0, 0.0, 0.0, 1.0)))
 	return parse_node(root.inputs['Surface'].links[0].from_node)
 
+# Structural hashing of Blender node trees, so unchanged materials can skip conversion.
+# Only things the converter looks at matter: node types and their settings, socket
+# default values, links, image paths and node groups. UI state (location, selection,
+# etc.) lives in the base Node properties, which are skipped.
+
+_base_props = {}
+
+def _node_base_props(node):
+	rna = node.bl_rna
+	if rna.identifier not in _base_props:
+		props = set()
+		base = rna.base
+		while base:
+			props.update(p.identifier for p in base.properties)
+			base = base.base
+		_base_props[rna.identifier] = props
+	return _base_props[rna.identifier]
+
+def _value_key(value):
+	if isinstance(value, (str, int, float, bool)) or value is None:
+		return value
+	if isinstance(value, set):
+		return tuple(sorted(value))
+	try:
+		return tuple(_value_key(v) for v in value)
+	except TypeError:
+		return repr(value)
+
+def _struct_key(struct, skip, depth, trees):
+	items = []
+	for prop in struct.bl_rna.properties:
+		ident = prop.identifier
+		if ident == 'rna_type' or ident in skip:
+			continue
+		value = getattr(struct, ident, None)
+		match prop.type:
+			case 'POINTER':
+				items.append((ident, _pointer_key(value, depth, trees)))
+			case 'COLLECTION':
+				if depth > 0:
+					items.append((ident, tuple(_struct_key(item, (), depth - 1, trees) for item in value)))
+			case _:
+				items.append((ident, _value_key(value)))
+	return tuple(items)
+
+def _pointer_key(value, depth, trees):
+	if value is None:
+		return None
+	if hasattr(value, 'filepath_from_user'):
+		# Images, other state on them (GPU bindcode etc.) is irrelevant to us
+		return ('image', value.filepath_from_user())
+	if hasattr(value, 'nodes') and hasattr(value, 'links'):
+		return ('group', _tree_key(value, trees))
+	if depth > 0:
+		return _struct_key(value, (), depth - 1, trees)
+	return None
+
+def _tree_key(nt, trees):
+	# Node groups can be shared by many nodes, only walk each one once
+	if nt.name in trees:
+		return trees[nt.name]
+	trees[nt.name] = None
+	nodes = []
+	for node in sorted(nt.nodes, key=lambda n: n.name):
+		inputs = tuple(
+			(sock.identifier, _value_key(getattr(sock, 'default_value', None)))
+			for sock in node.inputs
+		)
+		# Some nodes (RGB, Value) keep their constant in an output socket
+		outputs = tuple(
+			(sock.identifier, _value_key(getattr(sock, 'default_value', None)))
+			for sock in node.outputs
+		)
+		nodes.append((node.name, node.bl_idname, _struct_key(node, _node_base_props(node), 2, trees), inputs, outputs))
+	links = tuple(sorted(
+		(link.from_node.name, link.from_socket.identifier, link.to_node.name, link.to_socket.identifier)
+		for link in nt.links
+	))
+	key = hashlib.blake2b(repr((tuple(nodes), links)).encode(), digest_size=16).hexdigest()
+	trees[nt.name] = key
+	return key
+
+def node_tree_hash(nt):
+	if not nt:
+		return None
+	return _tree_key(nt, {})
+
+class material_cache:
+	"""
+	Converted c-ray node trees, keyed by node_tree_hash(). Unchanged materials get their
+	existing converted tree back instead of being converted again. Least recently used
+	entries are evicted once there are more than capacity of them.
+	"""
+	def __init__(self, capacity = 4096):
+		self.capacity = capacity
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def convert(self, bl_depsgraph, name, nt):
+		"""
+		Returns a (hash, converted tree) tuple for the node tree of material name.
+		"""
+		key = node_tree_hash(nt)
+		if key in self.entries:
+			self.entries.move_to_end(key)
+			self.hits += 1
+			return key, self.entries[key]
+		self.misses += 1
+		converted = convert_node_tree(bl_depsgraph, name, nt)
+		self.entries[key] = converted
+		if len(self.entries) > self.capacity:
+			self.entries.popitem(last = False)
+		return key, converted
+
+	def clear(self):
+		self.entries.clear()
+
 warning_color = NodeColorCheckerboard(NodeColorConstant(cr_color(1.0, 0.0, 0.0, 0.0)), NodeColorConstant(cr_color(1.0, 1.0, 1.0, 1.0)), NodeValueConstant(100.0))
 
 # Blender's mix node (ShaderNodeMix) is internally shared among different types.
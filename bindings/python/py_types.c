@@ -8,6 +8,8 @@
 
 #include "py_types.h"
 #include <structmember.h>
+#include <math.h>
+#include <string.h>
 
 static PyMemberDef py_vector_members[] = {
 	{ "x", T_FLOAT, offsetof(py_vector, val.x), 0, "x" },
@@ -240,6 +242,176 @@ static PyGetSetDef py_bitmap_getters_setters[] = {
 };
 #undef X
 
+/*
+	Buffer protocol, so np.asarray(bitmap) is a zero-copy (height, width, channels)
+	view of the pixels. Note that the view points straight into the renderer's
+	result buffer, so it's only valid for as long as that buffer is.
+*/
+static int py_bitmap_getbuffer(PyObject *o, Py_buffer *view, int flags) {
+	py_bitmap *self = (py_bitmap *)o;
+	if (!view) {
+		PyErr_SetString(PyExc_ValueError, "NULL view in getbuffer");
+		return -1;
+	}
+	if (!self->ref || !self->ref->data.byte_ptr) {
+		PyErr_SetString(PyExc_BufferError, "bitmap has no data");
+		view->obj = NULL;
+		return -1;
+	}
+	const struct cr_bitmap *bm = self->ref;
+	const Py_ssize_t itemsize = bm->precision == cr_bm_float ? sizeof(float) : sizeof(unsigned char);
+	self->shape[0] = bm->height;
+	self->shape[1] = bm->width;
+	self->shape[2] = bm->stride;
+	self->strides[2] = itemsize;
+	self->strides[1] = itemsize * bm->stride;
+	self->strides[0] = itemsize * bm->stride * bm->width;
+
+	view->obj = o;
+	view->buf = bm->data.byte_ptr;
+	view->len = self->shape[0] * self->strides[0];
+	view->readonly = 0;
+	view->itemsize = itemsize;
+	view->format = (flags & PyBUF_FORMAT) ? (bm->precision == cr_bm_float ? "f" : "B") : NULL;
+	view->ndim = 3;
+	view->shape = (flags & PyBUF_ND) == PyBUF_ND ? self->shape : NULL;
+	view->strides = (flags & PyBUF_STRIDES) == PyBUF_STRIDES ? self->strides : NULL;
+	view->suboffsets = NULL;
+	view->internal = NULL;
+	if (!view->shape) view->ndim = 1;
+	Py_INCREF(o);
+	return 0;
+}
+
+static PyBufferProcs py_bitmap_buffer_procs = {
+	.bf_getbuffer = py_bitmap_getbuffer,
+	.bf_releasebuffer = NULL,
+};
+
+static inline float clamp01(float f) {
+	return f < 0.0f ? 0.0f : f > 1.0f ? 1.0f : f;
+}
+
+// Table of linear -> sRGB, indexed with 16-bit quantized linear values
+#define SRGB_LUT_SIZE 65536
+static unsigned char *srgb_lut = NULL;
+
+static void srgb_lut_init(void) {
+	if (srgb_lut) return;
+	srgb_lut = malloc(SRGB_LUT_SIZE);
+	for (size_t i = 0; i < SRGB_LUT_SIZE; ++i) {
+		float linear = (float)i / (float)(SRGB_LUT_SIZE - 1);
+		float srgb = linear <= 0.0031308f ? 12.92f * linear : 1.055f * powf(linear, 1.0f / 2.4f) - 0.055f;
+		srgb_lut[i] = (unsigned char)(clamp01(srgb) * 255.0f + 0.5f);
+	}
+}
+
+static void convert_srgb_u8(const float *in, unsigned char *out, size_t pixels, size_t channels) {
+	for (size_t i = 0; i < pixels; ++i) {
+		const float *px = in + i * channels;
+		unsigned char *dst = out + i * channels;
+		for (size_t c = 0; c < channels; ++c) {
+			if (c == 3) {
+				// Alpha stays linear
+				dst[c] = (unsigned char)(clamp01(px[c]) * 255.0f + 0.5f);
+				continue;
+			}
+			dst[c] = srgb_lut[(size_t)(clamp01(px[c]) * (SRGB_LUT_SIZE - 1) + 0.5f)];
+		}
+	}
+}
+
+// IEEE754 binary32 -> binary16, rounding to nearest even
+static inline uint16_t float_to_half(float f) {
+	uint32_t x;
+	memcpy(&x, &f, sizeof(x));
+	const uint32_t sign = (x >> 16) & 0x8000;
+	uint32_t mant = x & 0x007fffff;
+	int32_t exp = (int32_t)((x >> 23) & 0xff);
+	if (exp == 0xff) return sign | 0x7c00 | (mant ? 0x200 : 0); // inf/nan
+	exp = exp - 127 + 15;
+	if (exp >= 0x1f) return sign | 0x7c00; // overflow -> inf
+	if (exp <= 0) {
+		// Subnormal or zero
+		if (exp < -10) return sign;
+		mant |= 0x00800000;
+		const uint32_t shift = 14 - exp;
+		uint32_t half = mant >> shift;
+		const uint32_t rem = mant & ((1u << shift) - 1);
+		const uint32_t mid = 1u << (shift - 1);
+		if (rem > mid || (rem == mid && (half & 1))) half++;
+		return sign | half;
+	}
+	uint32_t half = sign | ((uint32_t)exp << 10) | (mant >> 13);
+	const uint32_t rem = mant & 0x1fff;
+	if (rem > 0x1000 || (rem == 0x1000 && (half & 1))) half++;
+	return half;
+}
+
+static void convert_half(const float *in, uint16_t *out, size_t count) {
+	for (size_t i = 0; i < count; ++i)
+		out[i] = float_to_half(in[i]);
+}
+
+enum py_bitmap_convert_type {
+	py_bm_srgb_u8,
+	py_bm_half,
+};
+
+static PyObject *py_bitmap_convert(py_bitmap *self, PyObject *args, enum py_bitmap_convert_type type) {
+	PyObject *out_obj;
+	if (!PyArg_ParseTuple(args, "O", &out_obj)) {
+		return NULL;
+	}
+	if (!self->ref || !self->ref->data.float_ptr) {
+		PyErr_SetString(PyExc_BufferError, "bitmap has no data");
+		return NULL;
+	}
+	if (self->ref->precision != cr_bm_float) {
+		PyErr_SetString(PyExc_TypeError, "bitmap is not float precision");
+		return NULL;
+	}
+	Py_buffer out;
+	if (PyObject_GetBuffer(out_obj, &out, PyBUF_WRITABLE | PyBUF_C_CONTIGUOUS) == -1) {
+		return NULL;
+	}
+	const struct cr_bitmap *bm = self->ref;
+	const size_t pixels = bm->width * bm->height;
+	const size_t elem_size = type == py_bm_half ? sizeof(uint16_t) : sizeof(unsigned char);
+	if ((size_t)out.len < pixels * bm->stride * elem_size) {
+		PyErr_Format(PyExc_BufferError, "output buffer too small, need %zu bytes, got %zd", pixels * bm->stride * elem_size, out.len);
+		PyBuffer_Release(&out);
+		return NULL;
+	}
+	if (type == py_bm_srgb_u8) srgb_lut_init();
+	Py_BEGIN_ALLOW_THREADS
+	switch (type) {
+		case py_bm_srgb_u8:
+			convert_srgb_u8(bm->data.float_ptr, out.buf, pixels, bm->stride);
+			break;
+		case py_bm_half:
+			convert_half(bm->data.float_ptr, out.buf, pixels * bm->stride);
+			break;
+	}
+	Py_END_ALLOW_THREADS
+	PyBuffer_Release(&out);
+	Py_RETURN_NONE;
+}
+
+static PyObject *py_bitmap_to_srgb_u8(py_bitmap *self, PyObject *args) {
+	return py_bitmap_convert(self, args, py_bm_srgb_u8);
+}
+
+static PyObject *py_bitmap_to_half(py_bitmap *self, PyObject *args) {
+	return py_bitmap_convert(self, args, py_bm_half);
+}
+
+static PyMethodDef py_bitmap_methods[] = {
+	{ "to_srgb_u8", (PyCFunction)py_bitmap_to_srgb_u8, METH_VARARGS, "Convert to 8-bit sRGB into a writable buffer of width * height * stride bytes" },
+	{ "to_half", (PyCFunction)py_bitmap_to_half, METH_VARARGS, "Convert to half-float into a writable buffer of width * height * stride * 2 bytes" },
+	{ NULL },
+};
+
 PyTypeObject type_py_bitmap = {
 	PyVarObject_HEAD_INIT(NULL, 0)
 	.tp_name = "c_ray.bitmap",
@@ -250,6 +422,8 @@ PyTypeObject type_py_bitmap = {
 	.tp_flags = Py_TPFLAGS_DEFAULT,
 	.tp_new = PyType_GenericNew,
 	.tp_getset = py_bitmap_getters_setters,
+	.tp_methods = py_bitmap_methods,
+	.tp_as_buffer = &py_bitmap_buffer_procs,
 	.tp_alloc = PyType_GenericAlloc,
 };
 
@@ -36,6 +36,9 @@ extern PyTypeObject type_py_bitmap;
 typedef struct {
 	PyObject_HEAD
 	struct cr_bitmap *ref;
+	// Buffer protocol, (height, width, channels)
+	Py_ssize_t shape[3];
+	Py_ssize_t strides[3];
 } py_bitmap;
 PyObject *py_bitmap_wrap(struct cr_bitmap *ref);
 
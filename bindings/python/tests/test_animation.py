@@ -0,0 +1,22 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from lib import c_ray
+
+# hdr.json has two cameras
+scene = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'input', 'hdr.json')
+
+class animation_camera(unittest.TestCase):
+	def test_camera_idx_selects_camera(self):
+		with c_ray.animation(scene, camera_idx = 1) as anim:
+			self.assertEqual(anim.renderer.prefs.cam_idx, 1)
+			self.assertEqual(anim.camera.cr_idx, 1)
+
+	def test_missing_camera_raises(self):
+		with self.assertRaises(ValueError):
+			c_ray.animation(scene, camera_idx = 5)
+
+if __name__ == '__main__':
+	unittest.main()
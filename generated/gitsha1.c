@@ -0,0 +1,15 @@
+//
+//  gitsha1.c
+//  c-ray
+//
+//  Created by Valtteri Koskivuori on 7.4.2019.
+//  Copyright © 2019-2020 Valtteri Koskivuori. All rights reserved.
+//
+
+// Autogenerated - Do not edit
+
+#define GIT_SHA1 "4eb4d806f772824dff9be98df94108b84a96237c"
+
+char *gitHash(void) {
+	return GIT_SHA1;
+}
@@ -59,6 +59,14 @@ enum cr_renderer_param {
 	cr_renderer_asset_path,
 	cr_renderer_node_list,
 	cr_renderer_blender_mode,
+	// String, since it's fractional, e.g. "0.01". Tiles stop early once their estimated noise
+	// drops below this. 0 (the default) renders every tile for the full sample count.
+	cr_renderer_adaptive_threshold,
+	// Num, samples every tile gets before adaptive sampling can stop it
+	cr_renderer_adaptive_min_samples,
+	// Num, stop rendering after this many milliseconds. Passes are then rendered across the whole
+	// image one at a time, like in interactive mode, up to the sample count. 0 (the default) disables.
+	cr_renderer_time_limit_ms,
 };
 
 enum cr_tile_state {
@@ -137,6 +145,55 @@ struct cr_bitmap {
 CR_EXPORT void cr_renderer_render(struct cr_renderer *r);
 CR_EXPORT void cr_renderer_start_interactive(struct cr_renderer *ext);
 CR_EXPORT struct cr_bitmap *cr_renderer_get_result(struct cr_renderer *r);
+// Interactive mode: Wait up to timeout_ms for a pass newer than after_pass to finish, and return
+// a snapshot of the result where every tile is from at least that pass. Its pass is stored in *pass.
+// Returns NULL on timeout. Render threads never wait on readers. The returned bitmap is owned by
+// c-ray and stays valid until the next call. Passes start over from 1 after a restart.
+CR_EXPORT const struct cr_bitmap *cr_renderer_acquire_pass(struct cr_renderer *ext, size_t after_pass, long timeout_ms, size_t *pass);
+// Copy up to max tiles of the result that were written to since they were last returned here into out,
+// and mark them clean. Returns the amount copied. Tile coordinates are top-down, like in cr_renderer_cb_info.
+// All tiles become dirty when the result is cleared or resized, so compare the result dims to catch the latter.
+CR_EXPORT size_t cr_renderer_get_dirty_tiles(struct cr_renderer *ext, struct cr_tile *out, size_t max);
+
+enum cr_phase {
+	cr_phase_json_parse = 0,
+	cr_phase_mesh_load,
+	cr_phase_bvh_build,
+	cr_phase_top_level_bvh,
+	cr_phase_render,
+	cr_phase_encode,
+};
+
+struct cr_timing {
+	enum cr_phase phase;
+	const char *name; // Mesh or file name, if applicable
+	uint64_t us; // Total of all count runs
+	uint64_t count; // Times this phase ran for name, e.g. BVH rebuilds in an interactive session
+};
+
+enum cr_mem_category {
+	cr_mem_geometry = 0,
+	cr_mem_bvh,
+	cr_mem_textures,
+	cr_mem_node_pool,
+	cr_mem_framebuffer,
+	cr_mem_category_count,
+};
+
+struct cr_renderer_stats {
+	const struct cr_timing *timings; // One per phase and name, in the order they first finished
+	size_t timing_count;
+	uint64_t peak_bytes[cr_mem_category_count]; // Including temporary buffers of loads and BVH builds
+};
+
+// Wall time of each load, BVH build and render, and peak memory use by category.
+// The timings array is owned by c-ray, and stays valid until the next call.
+CR_EXPORT struct cr_renderer_stats cr_renderer_get_stats(struct cr_renderer *ext);
+// Record a timing for phases that happen outside of c-ray, like JSON parsing and image encoding
+CR_EXPORT void cr_renderer_add_timing(struct cr_renderer *ext, enum cr_phase phase, const char *name, uint64_t us);
+// Count temporary memory of work done outside c-ray, like parsing mesh files, towards the peaks.
+// Pass the negated size once it's freed.
+CR_EXPORT void cr_renderer_add_scratch_memory(struct cr_renderer *ext, enum cr_mem_category category, int64_t bytes);
 
 // -- Scene --
 
@@ -179,6 +236,10 @@ struct cr_vertex_buf_param {
 	size_t normal_count;
 	struct cr_coord *tex_coords;
 	size_t tex_coord_count;
+	// If set, c-ray references the arrays above directly instead of copying them.
+	// The caller must then keep them alive and unmodified until the mesh is
+	// rebound or the scene is destroyed.
+	bool borrow;
 };
 
 struct cr_face {
@@ -194,8 +255,34 @@ CR_EXPORT cr_mesh cr_scene_get_mesh(struct cr_scene *s_ext, const char *name);
 
 CR_EXPORT void cr_mesh_bind_vertex_buf(struct cr_scene *s_ext, cr_mesh mesh, struct cr_vertex_buf_param buf);
 CR_EXPORT void cr_mesh_bind_faces(struct cr_scene *s_ext, cr_mesh mesh, struct cr_face *faces, size_t face_count);
+
+// Structure-of-arrays alternative to cr_face, for bulk ingestion from e.g. NumPy.
+// Each index array holds face_count * MAX_CRAY_VERTEX_COUNT ints, mat_idx holds face_count ints.
+// normal_idx, texture_idx and mat_idx are optional:
+// - No normal_idx -> faces have no vertex normals
+// - No texture_idx -> faces have no texture coordinates
+// - No mat_idx -> faces use material 0
+struct cr_face_index_param {
+	const int *vertex_idx;
+	const int *normal_idx;
+	const int *texture_idx;
+	const int *mat_idx;
+	size_t face_count;
+};
+
+CR_EXPORT void cr_mesh_bind_face_indices(struct cr_scene *s_ext, cr_mesh mesh, struct cr_face_index_param p);
 CR_EXPORT void cr_mesh_finalize(struct cr_scene *s_ext, cr_mesh mesh);
 
+// Replace the vertex positions, and optionally the normals, of a finalized mesh whose faces
+// stay the same, e.g. for deforming or animated geometry. Counts must match the current
+// vertex buffer. Instead of a rebuild, the mesh BVH is refitted to the new positions right
+// away, unless that makes it too slow to trace. Then it's rebuilt before returning, so the
+// vertices and the BVH are always swapped in together.
+// Borrowed vertex buffers are copied first, the caller's arrays are never written to.
+// Returns false if the counts don't match or the BVH can't be built, bind new buffers and
+// finalize the mesh again then.
+CR_EXPORT bool cr_mesh_update_vertices(struct cr_scene *s_ext, cr_mesh mesh, const struct cr_vector *vertices, size_t vertex_count, const struct cr_vector *normals, size_t normal_count);
+
 // -- Camera --
 // FIXME: Use cr_vector
 // TODO: Support quaternions, or maybe just a mtx4x4?
@@ -224,6 +311,20 @@ CR_EXPORT bool cr_camera_set_num_pref(struct cr_scene *ext, cr_camera c, enum cr
 CR_EXPORT double cr_camera_get_num_pref(struct cr_scene *ext, cr_camera c, enum cr_camera_param p);
 CR_EXPORT bool cr_camera_update(struct cr_scene *ext, cr_camera c);
 
+// Sets the whole pose at once, and recomputes the camera once, unlike cr_camera_set_num_pref() + cr_camera_update()
+// fov <= 0.0 and res_x/res_y == 0 leave the current values unchanged.
+struct cr_camera_pose_param {
+	struct cr_vector position;
+	float roll;
+	float pitch;
+	float yaw;
+	double fov;
+	size_t res_x;
+	size_t res_y;
+};
+
+CR_EXPORT bool cr_camera_set_pose(struct cr_scene *ext, cr_camera c, struct cr_camera_pose_param p);
+
 // -- Materials --
 #include "node.h"
 
@@ -243,6 +344,12 @@ enum cr_object_type {
 
 CR_EXPORT cr_instance cr_instance_new(struct cr_scene *s_ext, cr_object object, enum cr_object_type type);
 CR_EXPORT void cr_instance_set_transform(struct cr_scene *s_ext, cr_instance instance, float row_major[4][4]);
+
+// Batched variants for scenes with lots of instances.
+// cr_instance_new_n() creates count instances of object, with contiguous IDs. Returns the first ID, or -1.
+// cr_instance_set_transforms() sets transforms[i] for instances[i], and returns the amount of instances that changed.
+CR_EXPORT cr_instance cr_instance_new_n(struct cr_scene *s_ext, cr_object object, enum cr_object_type type, size_t count);
+CR_EXPORT size_t cr_instance_set_transforms(struct cr_scene *s_ext, const cr_instance *instances, float (*row_major)[4][4], size_t count);
 CR_EXPORT void cr_instance_transform(struct cr_scene *s_ext, cr_instance instance, float row_major[4][4]);
 CR_EXPORT bool cr_instance_bind_material_set(struct cr_scene *s_ext, cr_instance instance, cr_material_set set);
 
@@ -251,6 +358,11 @@ CR_EXPORT bool cr_scene_set_background(struct cr_scene *s_ext, struct cr_shader_
 CR_EXPORT void cr_start_render_worker(int port, size_t thread_limit);
 CR_EXPORT void cr_send_shutdown_to_workers(const char *node_list);
 CR_EXPORT bool cr_load_json(struct cr_renderer *r_ext, const char *file_path);
+// Baked scenes are a binary dump of a loaded scene that gets mmap()'d on load, skipping
+// mesh parsing, texture decoding and BVH builds. They only work with the c-ray build that wrote them.
+CR_EXPORT bool cr_write_baked(struct cr_renderer *r_ext, const char *file_path);
+// Load into a renderer with an empty scene
+CR_EXPORT bool cr_load_baked(struct cr_renderer *r_ext, const char *file_path);
 
 enum cr_log_level {
 	Silent = 0,
@@ -1144,11 +1144,11 @@ static void *v_threadpool_worker(void *arg) {
 		v_mutex_lock(pool->mutex);
 		pool->active_threads--;
 		if (!pool->stop_flag && pool->active_threads == 0 && !pool->first)
-			v_cond_signal(pool->work_ongoing);
+			v_cond_broadcast(pool->work_ongoing);
 		v_mutex_release(pool->mutex);
 	}
 	pool->alive_threads--;
-	v_cond_signal(pool->work_ongoing);
+	v_cond_broadcast(pool->work_ongoing);
 	v_mutex_release(pool->mutex);
 	return NULL;
 }
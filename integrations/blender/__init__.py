@@ -22,6 +22,7 @@ import bpy
 import numpy as np
 import time
 import datetime
+import hashlib
 import gpu
 from gpu_extras.presets import draw_texture_2d
 import threading
@@ -100,13 +101,84 @@ class CrayRenderSettings(bpy.types.PropertyGroup):
 	def unregister(cls):
 		del bpy.types.Scene.c_ray
 
-def mesh_triangulate(mesh):
-	import bmesh
-	bm = bmesh.new();
-	bm.from_mesh(mesh)
-	bmesh.ops.triangulate(bm, faces=bm.faces)
-	bm.to_mesh(mesh)
-	bm.free()
+# c-ray only supports triangles. Grab Blender's own triangulation in bulk
+# instead of rewriting the mesh, and return arrays for mesh.bind_arrays()
+def mesh_arrays(me):
+	me.calc_loop_triangles()
+	vertex_count = len(me.vertices)
+	loop_count = len(me.loops)
+	tri_count = len(me.loop_triangles)
+
+	vertices = np.empty(vertex_count * 3, dtype=np.float32)
+	me.vertices.foreach_get('co', vertices)
+	vertices.shape = (vertex_count, 3)
+	faces = np.empty(tri_count * 3, dtype=np.int32)
+	me.loop_triangles.foreach_get('vertices', faces)
+	faces.shape = (tri_count, 3)
+	# Normals and UVs are per loop (face corner)
+	loops = np.empty(tri_count * 3, dtype=np.int32)
+	me.loop_triangles.foreach_get('loops', loops)
+	loops.shape = (tri_count, 3)
+	material_idx = np.empty(tri_count, dtype=np.int32)
+	me.loop_triangles.foreach_get('material_index', material_idx)
+
+	normals = None
+	if len(me.corner_normals) == loop_count:
+		normals = np.empty(loop_count * 3, dtype=np.float32)
+		me.corner_normals.foreach_get('vector', normals)
+		normals.shape = (loop_count, 3)
+	uvs = None
+	if len(me.uv_layers) > 0:
+		# TODO: Do we dump all of these, or just the first one?
+		uvs = np.empty(loop_count * 2, dtype=np.float32)
+		me.uv_layers[0].data.foreach_get('uv', uvs)
+		uvs.shape = (loop_count, 2)
+	return vertices, faces, normals, uvs, material_idx, loops
+
+# Counts plus a hash of the evaluated buffers sync_mesh() uploads. Much cheaper
+# than to_mesh() and triangulating, so unchanged geometry can be skipped.
+# Returns (topology, fingerprint). The topology hash leaves out vertex positions, so
+# meshes that only deform keep it, and can be updated in place with update_vertices().
+def mesh_fingerprint(me):
+	counts = (len(me.vertices), len(me.loops), len(me.polygons), len(me.uv_layers))
+	h = hashlib.blake2b(repr(counts).encode(), digest_size=16)
+	vertex_index = np.empty(counts[1], dtype=np.int32)
+	me.loops.foreach_get('vertex_index', vertex_index)
+	h.update(vertex_index)
+	loop_total = np.empty(counts[2], dtype=np.int32)
+	me.polygons.foreach_get('loop_total', loop_total)
+	h.update(loop_total)
+	material_index = np.empty(counts[2], dtype=np.int32)
+	me.polygons.foreach_get('material_index', material_index)
+	h.update(material_index)
+	if counts[3] > 0:
+		uv = np.empty(counts[1] * 2, dtype=np.float32)
+		me.uv_layers[0].data.foreach_get('uv', uv)
+		h.update(uv)
+	topology = h.hexdigest()
+	co = np.empty(counts[0] * 3, dtype=np.float32)
+	me.vertices.foreach_get('co', co)
+	h.update(co)
+	return topology, h.hexdigest()
+
+# Vertex positions and corner normals, same layout as in mesh_arrays()
+def mesh_vertex_arrays(me):
+	vertices = np.empty(len(me.vertices) * 3, dtype=np.float32)
+	me.vertices.foreach_get('co', vertices)
+	vertices.shape = (len(me.vertices), 3)
+	normals = None
+	if len(me.corner_normals) == len(me.loops):
+		normals = np.empty(len(me.loops) * 3, dtype=np.float32)
+		me.corner_normals.foreach_get('vector', normals)
+		normals.shape = (len(me.loops), 3)
+	return vertices, normals
+
+# Objects without modifiers evaluate to their (possibly shared) mesh datablock,
+# so linked duplicates can share a cr_mesh. With modifiers, geometry is per-object.
+def mesh_data_key(bl_object):
+	if len(bl_object.modifiers) > 0:
+		return ('OBJECT', bl_object.name)
+	return ('DATA', bl_object.data.name)
 
 def to_cr_matrix(matrix):
 	cr_mtx = c_ray.cr_matrix()
@@ -115,20 +187,6 @@ def to_cr_matrix(matrix):
 			cr_mtx.mtx[i * 4 + j] = matrix[i][j]
 	return cr_mtx
 
-def to_cr_face(me, poly):
-	v_i = []
-	l_i = []
-	for loop_idx in range(poly.loop_start, poly.loop_start + poly.loop_total):
-		v_i.append(me.loops[loop_idx].vertex_index)
-		l_i.append(loop_idx)
-	cr_face = c_ray.cr_face()
-	cr_face.vertex_idx[:] = v_i
-	cr_face.texture_idx[:] = l_i
-	cr_face.normal_idx[:] = l_i
-	cr_face.mat_idx = poly.material_index
-	cr_face.has_normals = 0
-	return cr_face
-
 def cr_vertex_buf(scene, me):
 	verts = []
 	for v in me.vertices:
@@ -166,19 +224,51 @@ def on_status_update(cb_info, args):
 		print("Stopping c-ray")
 		cr_renderer.stop()
 
-def draw_direct(bitmap):
-	if not bitmap:
-		return
-	float_count = bitmap.width * bitmap.height * bitmap.stride
-	pixels = np.frombuffer(bitmap.data, np.float32)
-	pixels = gpu.types.Buffer('FLOAT', float_count, pixels)
-	texture = None
-	try:
-		texture = gpu.types.GPUTexture((bitmap.width, bitmap.height), format='RGBA32F', data=pixels)
-	except ValueError as error:
-		print("Texture creation didn't work: {} (width: {}, height: {})".format(error, bitmap.width, bitmap.height))
-	if texture:
-		draw_texture_2d(texture, (0, 0), texture.width, texture.height)
+# Persistent copy of the render result on the GPU. Blender can't upload to a region
+# of an existing GPUTexture, so tiles that changed get drawn into an offscreen instead.
+class viewport_texture:
+	def __init__(self):
+		self.offscreen = None
+		self.dims = (0, 0)
+
+	def free(self):
+		if self.offscreen:
+			self.offscreen.free()
+		self.offscreen = None
+		self.dims = (0, 0)
+
+	def update(self, cr_renderer):
+		bitmap = cr_renderer.get_result()
+		if not bitmap:
+			return None
+		tiles = cr_renderer.dirty_tiles()
+		dims = (bitmap.width, bitmap.height)
+		if not self.offscreen or self.dims != dims:
+			self.free()
+			try:
+				self.offscreen = gpu.types.GPUOffScreen(bitmap.width, bitmap.height, format='RGBA32F')
+			except ValueError as error:
+				print("Offscreen creation didn't work: {} (width: {}, height: {})".format(error, bitmap.width, bitmap.height))
+				return None
+			self.dims = dims
+			tiles = [c_ray.tile_rect(0, 0, bitmap.width, bitmap.height)]
+		if tiles:
+			pixels = np.asarray(bitmap)
+			projection = mathutils.Matrix.Translation((-1.0, -1.0, 0.0)) @ mathutils.Matrix.Diagonal((2.0 / bitmap.width, 2.0 / bitmap.height, 1.0, 1.0))
+			with self.offscreen.bind():
+				with gpu.matrix.push_pop():
+					gpu.matrix.load_matrix(mathutils.Matrix.Identity(4))
+					gpu.matrix.load_projection_matrix(projection)
+					gpu.state.blend_set('NONE')
+					for t in tiles:
+						# The result may have been resized after we grabbed it, the next update handles that.
+						if t.y < 0 or t.x + t.width > bitmap.width or t.y + t.height > bitmap.height:
+							continue
+						region = np.ascontiguousarray(pixels[t.y:t.y + t.height, t.x:t.x + t.width]).reshape(-1)
+						data = gpu.types.Buffer('FLOAT', region.size, region)
+						texture = gpu.types.GPUTexture((t.width, t.height), format='RGBA32F', data=data)
+						draw_texture_2d(texture, (t.x, t.y), t.width, t.height)
+		return self.offscreen.texture_color
 
 def status_update_interactive(cb_info, args):
 	tag_redraw, update_stats, prefs = args;
@@ -205,6 +295,18 @@ class CrayRender(bpy.types.RenderEngine):
 		self.old_zoom = 0
 		self.old_mtx = None
 		self.initial_sync = False
+		self.viewport = viewport_texture()
+		self.material_cache = material_cache()
+		# mesh_data_key() -> (fingerprint, cr_mesh)
+		self.mesh_data = {}
+		# mesh_data_key() -> topology hash of the uploaded mesh
+		self.mesh_topology = {}
+		# Object name -> (fingerprint, instance)
+		self.object_instances = {}
+		self.cr_materials = {}
+		self.material_hashes = {}
+		# (mesh name, material name) -> hash of the material last uploaded to that slot
+		self.applied_materials = {}
 		c_ray.log_level_set(c_ray.log_level.Debug)
 		print('c-ray initialized')
 
@@ -214,6 +316,7 @@ class CrayRender(bpy.types.RenderEngine):
 			if cr_renderer.interactive:
 				print('Stopping')
 				cr_renderer.stop()
+			getattr(self, 'viewport').free()
 			print('Closing')
 			cr_renderer.close()
 			print('Closed')
@@ -221,33 +324,79 @@ class CrayRender(bpy.types.RenderEngine):
 			print('Blender called __del__ on an uninitialized CrayRender')
 		print('c-ray deleted')
 
-	def sync_mesh(self, depsgraph, bl_mesh):
-		print("Syncing mesh {}".format(bl_mesh.name))
-		# dump(bl_mesh)
-		ob_for_convert = bl_mesh.evaluated_get(depsgraph)
+	def upload_mesh(self, bl_mesh, ob_for_convert, name):
 		try:
 			me = ob_for_convert.to_mesh()
 		except RuntimeError:
 			me = None
 		if me is None:
 			print("Whoops, mesh {} couldn't be converted".format(bl_mesh.name))
-			return
+			return None
+		vertices, faces, normals, uvs, material_idx, loops = mesh_arrays(me)
+		if len(faces) < 1:
+			print("Mesh {} has no faces, skipping".format(bl_mesh.name))
+			ob_for_convert.to_mesh_clear()
+			return None
+		print("Uploading mesh {}".format(name))
+		cr_mesh = self.cr_scene.mesh_new(name)
+		# Normals and UVs have one row per loop, so they're indexed with loops, not faces
+		cr_mesh.bind_arrays(vertices, faces,
+			normals=normals, uvs=uvs, material_idx=material_idx,
+			normal_idx=loops if normals is not None else None,
+			uv_idx=loops if uvs is not None else None)
+		cr_mesh.finalize()
+		# bind_arrays() copied everything, so the temporary mesh can go
+		ob_for_convert.to_mesh_clear()
+		return cr_mesh
 
-		cr_mesh = self.cr_scene.mesh_new(bl_mesh.name)
+	def sync_mesh(self, depsgraph, bl_mesh):
+		ob_for_convert = bl_mesh.evaluated_get(depsgraph)
+		topology, fingerprint = mesh_fingerprint(ob_for_convert.data)
+		synced = self.object_instances.get(bl_mesh.name)
+		if synced and synced[0] == fingerprint:
+			# Geometry didn't actually change, the existing instance is fine.
+			return
+		print("Syncing mesh {}".format(bl_mesh.name))
+		data_key = mesh_data_key(bl_mesh)
+		cached = self.mesh_data.get(data_key)
+		# Instance of the cached mesh this object already has, if any
+		cached_inst = synced[1] if synced and cached and synced[1].object is cached[1] else None
+		if cached_inst and cached[0] == fingerprint:
+			# Mesh data shared with an object that already updated it in place
+			self.object_instances[bl_mesh.name] = (fingerprint, cached_inst)
+			return
+		if cached_inst and self.mesh_topology.get(data_key) == topology:
+			# Only the vertices moved, e.g. an armature or cloth. Refitting beats a re-upload.
+			vertices, normals = mesh_vertex_arrays(ob_for_convert.data)
+			if cached[1].update_vertices(vertices, normals):
+				self.mesh_data[data_key] = (fingerprint, cached[1])
+				self.object_instances[bl_mesh.name] = (fingerprint, cached_inst)
+				return
+		if cached and cached[0] == fingerprint:
+			# Shared or unchanged mesh data, just needs a new instance.
+			cr_mesh = cached[1]
+		else:
+			cr_mesh = self.upload_mesh(bl_mesh, ob_for_convert, data_key[1])
+			if not cr_mesh:
+				return
+			self.mesh_data[data_key] = (fingerprint, cr_mesh)
+			self.mesh_topology[data_key] = topology
 		instances = []
 		new_inst = cr_mesh.instance_new()
 		new_inst.set_transform(to_cr_matrix(bl_mesh.matrix_world))
 		cr_mat_set = self.cr_scene.material_set_new(bl_mesh.name)
 		new_inst.bind_materials(cr_mat_set)
 		instances.append(new_inst)
+		self.object_instances[bl_mesh.name] = (fingerprint, new_inst)
 		if bl_mesh.is_instancer and bl_mesh.show_instancer_for_render:
 			for dup in depsgraph.object_instances:
 				if dup.parent and dup.parent.original == bl_mesh:
 					new_inst = cr_mesh.instance_new()
 					new_inst.set_transform(dup.matrix_world.copy())
-		if len(me.materials) < 1:
+		materials = ob_for_convert.data.materials
+		if len(materials) < 1:
 			cr_mat_set.add(None, "MissingMaterial")
-		for bl_mat in me.materials:
+		for bl_mat in materials:
 			if not bl_mat:
 				print("Huh, array contains NoneType?")
 				cr_mat_set.add(None, "MissingMaterial")
@@ -258,18 +407,10 @@ class CrayRender(bpy.types.RenderEngine):
 					cr_mat_set.add(None, bl_mat.name)
 				else:
 					cr_mat_set.add(self.cr_materials[bl_mat.name], bl_mat.name)
+					self.applied_materials[(bl_mesh.name, bl_mat.name)] = self.material_hashes[bl_mat.name]
 			else:
 				print("Material {} doesn't use nodes, do something about that".format(bl_mat.name))
 				cr_mat_set.add(None, bl_mat.name)
-		# c-ray only supports triangles
-		mesh_triangulate(me)
-		faces = []
-		for poly in me.polygons:
-			faces.append(to_cr_face(me, poly))
-		facebuf = (c_ray.cr_face * len(faces))(*faces)
-		cr_mesh.bind_faces(bytearray(facebuf), len(faces))
-		cr_mesh.bind_vertex_buf(me)
-		cr_mesh.finalize()
 
 	def sync_scene(self, depsgraph):
 		b_scene = depsgraph.scene
@@ -289,20 +430,12 @@ class CrayRender(bpy.types.RenderEngine):
 			mtx = ob_main.matrix_world
 			euler = mtx.to_euler('XYZ')
 			loc = mtx.to_translation()
-			cr_cam.opts.fov = math.degrees(bl_cam.angle)
-			cr_cam.opts.pose_x = loc[0]
-			cr_cam.opts.pose_y = loc[1]
-			cr_cam.opts.pose_z = loc[2]
-			cr_cam.opts.pose_roll = euler[0]
-			cr_cam.opts.pose_pitch = euler[1]
-			cr_cam.opts.pose_yaw = euler[2]
-
 			scale = b_scene.render.resolution_percentage / 100.0
 			size_x = int(b_scene.render.resolution_x * scale)
 			size_y = int(b_scene.render.resolution_y * scale)
-			cr_cam.opts.res_x = size_x
-			cr_cam.opts.res_y = size_y
-			cr_cam.opts.blender_coord = 1
+			with cr_cam.batch():
+				cr_cam.opts.blender_coord = 1
+				cr_cam.set_pose(loc, euler, fov=math.degrees(bl_cam.angle), res=(size_x, size_y))
 			# if bl_cam.dof.use_dof:
 			# 	cr_cam.opts.fstops = bl_cam.dof.aperture_fstop
 			# 	if bl_cam.dof.focus_object:
@@ -317,19 +450,18 @@ class CrayRender(bpy.types.RenderEngine):
 			# 	else:
 			# 		cr_cam.opts.focus_distance = bl_cam.dof.focus_distance
 
-		# Convert Cycles materials into c-ray node graphs
-		self.cr_materials = {}
+		# Convert Cycles materials into c-ray node graphs. Unchanged ones come from the cache.
+		misses = self.material_cache.misses
 		for bl_mat in bpy.data.materials:
-			print("Converting {}".format(bl_mat.name))
-			self.cr_materials[bl_mat.name] = convert_node_tree(depsgraph, bl_mat.name, bl_mat.node_tree)
+			key, cr_mat = self.material_cache.convert(depsgraph, bl_mat.name, bl_mat.node_tree)
+			self.cr_materials[bl_mat.name] = cr_mat
+			self.material_hashes[bl_mat.name] = key
+		print("Converted {} of {} materials".format(self.material_cache.misses - misses, len(bpy.data.materials)))
 		
 		# Sync meshes
 		for idx, ob_main in enumerate(objects):
 			if ob_main.type != 'MESH':
 				continue
-			if ob_main.name in self.cr_scene.meshes:
-				print("Mesh '{}' already synced, skipping".format(ob_main.name))
-				break
 			self.sync_mesh(depsgraph, ob_main)
 		# Set background shader
 		bl_nodetree = bpy.data.worlds[0].node_tree
@@ -379,13 +511,17 @@ class CrayRender(bpy.types.RenderEngine):
 		new_dims = (context.region.width, context.region.height)
 		if not self.old_dims or self.old_dims != new_dims:
 			cr_cam = self.cr_scene.cameras[context.scene.camera.name]
-			cr_cam.opts.res_x = context.region.width
-			cr_cam.opts.res_y = context.region.height
+			with cr_cam.batch():
+				cr_cam.opts.res_x = context.region.width
+				cr_cam.opts.res_y = context.region.height
 			self.cr_renderer.restart()
 			self.old_dims = new_dims
+		texture = self.viewport.update(self.cr_renderer)
+		if not texture:
+			return
 		gpu.state.blend_set('ALPHA_PREMULT')
 		self.bind_display_space_shader(depsgraph.scene)
-		draw_direct(self.cr_renderer.get_result())
+		draw_texture_2d(texture, (0, 0), texture.width, texture.height)
 		self.unbind_display_space_shader()
 		gpu.state.blend_set('NONE')
 
@@ -398,12 +534,16 @@ class CrayRender(bpy.types.RenderEngine):
 			if mat:
 				mat_set = self.cr_scene.material_sets[mesh.name]
 				key = mat.name
-				mat_set.update(key, convert_node_tree(depsgraph, key, mat.node_tree))
-				print("Mesh {} material {} updated".format(mesh.name, key))
-		if update.is_updated_transform:
-			# FIXME: How do I get the actual instance index from Blender?
-			# Just grabbing the first one for now.
-			inst = self.cr_scene.meshes[mesh.name].instances[-1]
+				mat_hash, cr_mat = self.material_cache.convert(depsgraph, key, mat.node_tree)
+				self.cr_materials[key] = cr_mat
+				self.material_hashes[key] = mat_hash
+				# Shading updates fire for all sorts of things, only re-upload if the tree changed.
+				if self.applied_materials.get((mesh.name, key)) != mat_hash:
+					mat_set.update(key, cr_mat)
+					self.applied_materials[(mesh.name, key)] = mat_hash
+					print("Mesh {} material {} updated".format(mesh.name, key))
+		if update.is_updated_transform and mesh.name in self.object_instances:
+			inst = self.object_instances[mesh.name][1]
 			inst.set_transform(to_cr_matrix(mesh.matrix_world))
 
 	def partial_update(self, depsgraph):
@@ -457,17 +597,9 @@ class CrayRender(bpy.types.RenderEngine):
 		else:
 			if self.old_zoom:
 				new_fov -= (self.old_zoom - 32)
-		cr_cam.opts.fov = new_fov
-		cr_cam.opts.pose_x = loc[0]
-		cr_cam.opts.pose_y = loc[1]
-		cr_cam.opts.pose_z = loc[2]
-		cr_cam.opts.pose_roll = euler[0]
-		cr_cam.opts.pose_pitch = euler[1]
-		cr_cam.opts.pose_yaw = euler[2]
-
-		cr_cam.opts.res_x = context.region.width
-		cr_cam.opts.res_y = context.region.height
-		cr_cam.opts.blender_coord = 1
+		with cr_cam.batch():
+			cr_cam.opts.blender_coord = 1
+			cr_cam.set_pose(loc, euler, fov=new_fov, res=(context.region.width, context.region.height))
 
 		if self.cr_renderer.interactive == True:
 			self.cr_renderer.restart()
@@ -479,7 +611,7 @@ class CrayRender(bpy.types.RenderEngine):
 			self.cr_renderer.start_interactive()
 
 	def display_bitmap(self, bm):
-		floats = np.frombuffer(bm.data, np.float32)
+		floats = np.asarray(bm).reshape(-1)
 		if (major, minor) < (4, 1):
 			# convert [r,g,b,a,r,g,b,a,...] to [(r,g,b,a),(r,g,b,a),...]
 			# For context, see f1516d46a570, 8a4ce9b3fd07c66, and https://developer.blender.org/docs/release_notes/4.1/python_api/#foreach
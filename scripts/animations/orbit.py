@@ -1,29 +1,30 @@
 #!/usr/local/bin/python3
 
-import json
 import sys
-from subprocess import *
 from math import *
 
-filename = 'input/hdr.json'
-
-with open(filename) as f:
-    data = json.load(f)
+# Run from the repository root, after 'make pylib'
+sys.path.insert(0, 'bindings/python')
+from lib import c_ray
 
-data["scene"]["outputFilePath"] = "output/orbit/"
-data["renderer"]["sampleCount"] = 3
-#data["camera"]["transforms"][0]["z"] = 0
+filename = 'input/hdr.json'
 
 r = 0.05
 
-for i in range(360):
-    data["scene"]["count"] = i
-    #rotate
-    data["camera"]["transforms"][2]["degrees"] = -i
-    #move
-    data["camera"]["transforms"][0]["x"] += cos(radians(i))*r
-    data["camera"]["transforms"][0]["z"] += sin(radians(i))*r
+# The scene is loaded once, and every frame is rendered in this process
+with c_ray.animation(filename) as anim:
+	anim.renderer.prefs.samples = 3
+	opts = anim.camera.opts
+	x, y, z = opts.pose_x, opts.pose_y, opts.pose_z
+	roll, pitch = opts.pose_roll, opts.pose_pitch
+
+	def orbit(frame):
+		global x, z
+		i = frame.index
+		#move
+		x += cos(radians(i))*r
+		z += sin(radians(i))*r
+		#rotate, like the rotateZ transform of the camera in the scene file
+		frame.camera_pose((x, y, z), (roll, pitch, radians(-i)))
 
-    proc = Popen('./bin/c-ray ', stdin=PIPE, shell=True)
-    proc.stdin.write(json.dumps(data).encode())
-    proc.communicate()
+	anim.render(range(360), orbit, 'output/orbit/rendered_{:04d}.png')
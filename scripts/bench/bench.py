@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+# Render a fixed set of scenes with fixed settings through the Python bindings, and
+# keep a history of the results so throughput regressions show up.
+# Build the bindings first with 'make pylib', then run from anywhere:
+#   scripts/bench/bench.py                  Run the default suite, append to the history
+#   scripts/bench/bench.py --save-baseline  Also store this run as the baseline to compare against
+#   scripts/bench/bench.py -t 10            Fail if any scene is more than 10% slower than the baseline
+# Without --baseline, each scene is compared to its last run in the history with the same settings.
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'bindings', 'python'))
+from lib import c_ray
+from generators import root, generators
+
+# Reference scenes from input/
+default_scenes = [
+	'hdr.json',
+	'glowmetal.json',
+	'refraction.json',
+	'venus.json',
+	'uvsphere.json',
+]
+
+# Synthetic scenes as (generator, seed, size)
+default_synthetic = [
+	('lots_of_instances', 1337, 10000),
+	('spheres', 1337, 2000),
+]
+
+def scene_key(name, seed = None, size = None):
+	return name if seed is None else '{}:{}:{}'.format(name, seed, size)
+
+def git_revision():
+	try:
+		return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=root, stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+def render(path, settings):
+	"""
+	Load and render one scene, returns a dict of results
+	"""
+	load_start = time.monotonic()
+	r = c_ray.renderer(path)
+	load_s = time.monotonic() - load_start
+	try:
+		r.prefs.threads = settings['threads']
+		r.prefs.samples = settings['samples']
+		r.prefs.bounces = settings['bounces']
+		r.prefs.img_width = settings['width']
+		r.prefs.img_height = settings['height']
+		render_start = time.monotonic()
+		r.render()
+		render_s = time.monotonic() - render_start
+		stats = r.stats()
+	finally:
+		r.close()
+	total_ms = stats['total_ms']
+	# BVH builds and texture decodes run in the background during load, so render_s includes
+	# waiting for those. Throughput is only measured over the actual render phase.
+	render_ms = total_ms.get('render', render_s * 1000.0)
+	samples = settings['samples'] * settings['width'] * settings['height']
+	return {
+		'load_ms': load_s * 1000.0,
+		'bvh_build_ms': total_ms.get('bvh_build', 0.0),
+		'top_level_bvh_ms': total_ms.get('top_level_bvh', 0.0),
+		'render_ms': render_ms,
+		'wall_ms': (load_s + render_s) * 1000.0,
+		'samples_per_sec': samples / (render_ms / 1000.0) if render_ms > 0 else 0.0,
+		'peak_bytes': stats['peak_bytes'],
+	}
+
+def render_synthetic(name, seed, size, settings):
+	data = generators[name](random.Random(seed), size)
+	# Scenes load assets relative to the file, so this has to live in input/
+	fd, path = tempfile.mkstemp(prefix='bench_', suffix='.json', dir=os.path.join(root, 'input'))
+	try:
+		with os.fdopen(fd, 'w') as f:
+			json.dump(data, f)
+		return render(path, settings)
+	finally:
+		os.remove(path)
+
+def run_suite(scenes, synthetic, settings, repeat):
+	results = {}
+	jobs = [(scene_key(s), lambda s=s: render(os.path.join(root, 'input', s), settings)) for s in scenes]
+	jobs += [(scene_key(*g), lambda g=g: render_synthetic(*g, settings)) for g in synthetic]
+	for key, job in jobs:
+		print('{:<36}'.format(key), end='', flush=True)
+		# Keep the fastest of the repeats, it's the least affected by whatever else the machine is doing
+		best = None
+		for i in range(repeat):
+			result = job()
+			if best is None or result['samples_per_sec'] > best['samples_per_sec']:
+				best = result
+		results[key] = best
+		print('{:>10.1f} ms load {:>10.1f} ms render {:>8.3f} Msamples/s'.format(best['load_ms'], best['render_ms'], best['samples_per_sec'] / 1e6))
+	return results
+
+def load_history(path):
+	if not os.path.isfile(path):
+		return []
+	with open(path) as f:
+		return json.load(f)
+
+def history_baseline(history, run):
+	"""
+	Latest result for each scene from earlier runs on this host with the same settings
+	"""
+	baseline = {}
+	for h in history:
+		if h['settings'] == run['settings'] and h['host'] == run['host']:
+			baseline.update(h['results'])
+	return baseline
+
+def compare(run, baseline, threshold):
+	"""
+	Returns a list of (scene, baseline samples/s, current samples/s, change %) for scenes
+	that slowed down by more than threshold percent
+	"""
+	regressions = []
+	for key, result in run['results'].items():
+		base = baseline.get(key)
+		if not base or not base['samples_per_sec']:
+			print('{:<36}{:>10}'.format(key, 'new'))
+			continue
+		change = (result['samples_per_sec'] - base['samples_per_sec']) / base['samples_per_sec'] * 100.0
+		flag = ''
+		if change < -threshold:
+			regressions.append((key, base['samples_per_sec'], result['samples_per_sec'], change))
+			flag = '  REGRESSION'
+		print('{:<36}{:>+9.1f}%{}'.format(key, change, flag))
+	return regressions
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Render a fixed set of scenes and check for throughput regressions')
+	parser.add_argument('scenes', nargs='*', help='Scenes in input/ to render instead of the default set')
+	parser.add_argument('--threads', type=int, default=4)
+	parser.add_argument('--samples', type=int, default=16)
+	parser.add_argument('--bounces', type=int, default=8)
+	parser.add_argument('--width', type=int, default=320)
+	parser.add_argument('--height', type=int, default=200)
+	parser.add_argument('--repeat', type=int, default=1, help='Render each scene this many times and keep the best')
+	parser.add_argument('--no-synthetic', action='store_true', help='Skip generated scenes')
+	parser.add_argument('--history', default=os.path.join(root, 'output', 'bench_history.json'), help='JSON file to append results to')
+	parser.add_argument('--baseline', help='JSON file with a baseline run. Defaults to the last run in the history with the same settings')
+	parser.add_argument('--save-baseline', nargs='?', const=os.path.join(root, 'output', 'bench_baseline.json'), help='Write this run out as a baseline')
+	parser.add_argument('-t', '--threshold', type=float, default=5.0, help='Fail if throughput drops by more than this many percent')
+	args = parser.parse_args()
+
+	c_ray.log_level_set(c_ray.log_level.Silent)
+	settings = {
+		'threads': args.threads,
+		'samples': args.samples,
+		'bounces': args.bounces,
+		'width': args.width,
+		'height': args.height,
+	}
+	scenes = args.scenes if args.scenes else default_scenes
+	synthetic = [] if args.no_synthetic else default_synthetic
+
+	print('c-ray {} ({}), {} threads, {} samples, {}x{}'.format(c_ray.version.semantic, c_ray.version.githash, args.threads, args.samples, args.width, args.height))
+	run = {
+		'date': datetime.datetime.now().replace(microsecond=0).isoformat(),
+		'revision': git_revision(),
+		'host': platform.node(),
+		'settings': settings,
+		'results': run_suite(scenes, synthetic, settings, args.repeat),
+	}
+
+	history = load_history(args.history)
+	if args.baseline:
+		with open(args.baseline) as f:
+			baseline_run = json.load(f)
+		baseline = baseline_run['results']
+		source = 'baseline from {} ({})'.format(baseline_run['date'], baseline_run.get('revision'))
+		if baseline_run['settings'] != settings:
+			print('\nWarning: baseline was rendered with different settings: {}'.format(baseline_run['settings']))
+	else:
+		baseline = history_baseline(history, run)
+		source = 'previous runs in {}'.format(args.history)
+
+	history.append(run)
+	os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+	with open(args.history, 'w') as f:
+		json.dump(history, f, indent=1)
+	if args.save_baseline:
+		with open(args.save_baseline, 'w') as f:
+			json.dump(run, f, indent=1)
+
+	if not baseline:
+		print('\nNo baseline to compare against yet')
+		sys.exit(0)
+	print('\nCompared to {}:'.format(source))
+	regressions = compare(run, baseline, args.threshold)
+	if regressions:
+		print('\n{} scene(s) slowed down by more than {}%'.format(len(regressions), args.threshold))
+		sys.exit(1)
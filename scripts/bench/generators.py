@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+# Synthetic scene generators for bench.py
+# Each one takes a random.Random and a size, and returns a scene description dict.
+# Scenes reference assets relative to input/, so bench.py writes them out there before loading.
+
+import copy
+import json
+import os
+
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+def lots_of_instances(rng, count):
+	"""
+	Same as scripts/scenes/lots_of_instances, count randomly placed and colored Venus instances
+	"""
+	with open(os.path.join(root, 'scripts', 'scenes', 'lots_of_instances', 'hdr.json')) as f:
+		data = json.load(f)
+	data["scene"]["primitives"] = []
+	instancelist = data["scene"]["meshes"][1]["pick_instances"]
+	for i in range(count):
+		skel = copy.deepcopy(instancelist[0])
+		skel["for"] = "Venus"
+		skel["materials"][0]["color"] = {'type': 'hsl', 'h': rng.uniform(0, 360), 's': 100, 'l': 75}
+		skel["transforms"][1]["X"] = rng.uniform(0, 10) - 5
+		skel["transforms"][1]["Y"] = rng.uniform(0, 10) - 5
+		skel["transforms"][1]["Z"] = rng.uniform(0, 40) - 2.5
+		skel["transforms"].append({"type": "rotateX", "degrees": rng.uniform(0, 360)})
+		skel["transforms"].append({"type": "rotateY", "degrees": rng.uniform(0, 360)})
+		skel["transforms"].append({"type": "rotateZ", "degrees": rng.uniform(0, 360)})
+		instancelist.append(skel)
+	return data
+
+def spheres(rng, count):
+	"""
+	count randomly sized spheres with random materials scattered over the ground plane in hdr.json
+	"""
+	with open(os.path.join(root, 'input', 'hdr.json')) as f:
+		data = json.load(f)
+	data["scene"]["meshes"] = [m for m in data["scene"]["meshes"] if m["fileName"] == "shapes/gridplane.obj"]
+	primitives = []
+	for i in range(count):
+		radius = rng.uniform(0.005, 0.02)
+		sphere = {
+			"type": "sphere",
+			"radius": radius,
+			"material": {
+				"type": rng.choice(["diffuse", "metal", "glass", "plastic"]),
+				"color": {'type': 'hsl', 'h': rng.uniform(0, 360), 's': 80, 'l': 60},
+				"roughness": rng.uniform(0, 0.2),
+				"IOR": 1.45,
+			},
+			"instances": [{
+				"transforms": [{
+					"type": "translate",
+					"x": rng.uniform(-0.4, 0.4),
+					"y": radius,
+					"z": rng.uniform(-0.2, 0.6),
+				}]
+			}]
+		}
+		primitives.append(sphere)
+	data["scene"]["primitives"] = primitives
+	return data
+
+generators = {
+	'lots_of_instances': lots_of_instances,
+	'spheres': spheres,
+}
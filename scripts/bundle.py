@@ -6,6 +6,8 @@
 # This script will receive a given .json scene description, and generate
 # a .zip bundle of that description and all the assets it references.
 # This way you can share scenes you've created for c-ray in a more portable way.
+# With --bake, it instead loads the scene and writes it out as a single baked .crbake
+# file that loads near instantly, but only with the same c-ray build (see c_ray.renderer.write_baked)
 
 import sys
 import os
@@ -49,11 +51,28 @@ def copy_file(src, dest):
 	print('Copying ' + src + ' to ' + dest)
 	shutil.copy2(src, dest)
 
+def bake(filename):
+	sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'bindings', 'python'))
+	from lib import c_ray
+	destPath = os.path.splitext(os.path.basename(filename))[0] + c_ray.baked_extension
+	print("Baking file", filename)
+	r = c_ray.renderer(filename)
+	ok = r.write_baked(destPath)
+	r.close()
+	if not ok:
+		print('Failed to bake ' + filename)
+		exit(1)
+	print('\n\nBaked scene ' + destPath + ' created!')
+	print('Load it with c_ray.renderer(\'' + destPath + '\')')
+
 if __name__ == '__main__':
 	# Do the thing
 	print("C-ray scene bundler v0.1")
+	if len(sys.argv) == 3 and sys.argv[1] == '--bake':
+		bake(sys.argv[2])
+		exit()
 	if len(sys.argv) != 2:
-		print("Usage: ", str(sys.argv[0]), "<somefile>.json")
+		print("Usage: ", str(sys.argv[0]), "[--bake] <somefile>.json")
 		exit()
 	print("Packing file", str(sys.argv[1]))
 	filename = sys.argv[1]
@@ -9,6 +9,7 @@
 #include "../includes.h"
 
 #include <v.h>
+#include <stdio.h>
 #include <c-ray/c-ray.h>
 
 #include "json_loader.h"
@@ -113,6 +114,21 @@ void parse_prefs(struct cr_renderer *ext, const cJSON *data) {
 	if (cJSON_IsNumber(height)) {
 		cr_renderer_set_num_pref(ext, cr_renderer_override_height, height->valueint);
 	}
+
+	const cJSON *adaptive_threshold = cJSON_GetObjectItem(data, "adaptiveThreshold");
+	if (cJSON_IsNumber(adaptive_threshold)) {
+		char buf[32];
+		snprintf(buf, sizeof(buf), "%g", adaptive_threshold->valuedouble);
+		cr_renderer_set_str_pref(ext, cr_renderer_adaptive_threshold, buf);
+	}
+
+	const cJSON *adaptive_min_samples = cJSON_GetObjectItem(data, "adaptiveMinSamples");
+	if (cJSON_IsNumber(adaptive_min_samples) && adaptive_min_samples->valueint > 0)
+		cr_renderer_set_num_pref(ext, cr_renderer_adaptive_min_samples, adaptive_min_samples->valueint);
+
+	const cJSON *time_limit = cJSON_GetObjectItem(data, "timeLimitMs");
+	if (cJSON_IsNumber(time_limit) && time_limit->valuedouble >= 0)
+		cr_renderer_set_num_pref(ext, cr_renderer_time_limit_ms, time_limit->valuedouble);
 }
 
 float getRadians(const cJSON *object) {
@@ -296,9 +312,16 @@ static void parse_mesh(struct cr_renderer *r, const cJSON *data, int idx, int me
 	free(full_path);
 	long ms = us / 1000;
 	logr(debug, "Parsing file %-35s took %li %s\n", file_name, ms > 0 ? ms : us, ms > 0 ? "ms" : "μs");
+	cr_renderer_add_timing(r, cr_phase_mesh_load, file_name, us);
 
 	if (!v_arr_len(result.meshes)) return;
 
+	// The parse result sticks around until every mesh in it has been copied into the scene
+	int64_t parse_bytes = vbuf_bytes(&result.geometry);
+	for (size_t i = 0; i < v_arr_len(result.meshes); ++i)
+		parse_bytes += v_arr_len(result.meshes[i].faces) * sizeof(*result.meshes[i].faces);
+	cr_renderer_add_scratch_memory(r, cr_mem_geometry, parse_bytes);
+
 	struct cr_vertex_buf_param vbuf = {
 		.vertices = (struct cr_vector *)result.geometry.vertices,
 		.vertex_count = v_arr_len(result.geometry.vertices),
@@ -386,6 +409,7 @@ static void parse_mesh(struct cr_renderer *r, const cJSON *data, int idx, int me
 	}
 	
 done:
+	cr_renderer_add_scratch_memory(r, cr_mem_geometry, -parse_bytes);
 
 	// FIXME: impl elem_free
 	for (size_t i = 0; i < v_arr_len(result.meshes); ++i)
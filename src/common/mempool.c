@@ -45,6 +45,13 @@ void *allocBlock(struct block **head, size_t size) {
 	return ptr;
 }
 
+size_t totalBlockSize(const struct block *head) {
+	size_t bytes = 0;
+	for (; head; head = head->prev)
+		bytes += head->capacity;
+	return bytes;
+}
+
 void destroyBlocks(struct block *head) {
 	size_t numDestroyed = 0;
 	size_t bytesfreed = 0;
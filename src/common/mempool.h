@@ -16,3 +16,6 @@ struct block *newBlock(struct block *prev, size_t initialSize);
 void *allocBlock(struct block **head, size_t size);
 
 void destroyBlocks(struct block *head);
+
+// Total capacity of all blocks, in bytes
+size_t totalBlockSize(const struct block *head);
@@ -145,6 +145,12 @@ bool tex_uses_alpha(const struct texture *t) {
 	return false;
 }
 
+size_t tex_bytes(const struct texture *t) {
+	if (!t || t->precision == none) return 0;
+	const size_t prim_size = t->precision == char_p ? sizeof(char) : sizeof(float);
+	return t->width * t->height * t->channels * prim_size;
+}
+
 void tex_clear(struct texture *t) {
 	if (!t) return;
 	size_t prim_size = t->precision == char_p ? sizeof(char) : sizeof(float);
@@ -154,7 +160,7 @@ void tex_clear(struct texture *t) {
 
 void tex_destroy(struct texture *t) {
 	if (t) {
-		free(t->data.byte_p);
+		if (!t->borrowed) free(t->data.byte_p);
 		free(t);
 		t = NULL;
 	}
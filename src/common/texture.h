@@ -34,6 +34,7 @@ struct texture {
 	size_t channels;
 	size_t width;
 	size_t height;
+	bool borrowed; // data isn't owned by this texture, e.g. it's in a baked scene
 };
 
 struct texture_asset {
@@ -65,6 +66,9 @@ void tex_to_srgb(struct texture *t);
 
 bool tex_uses_alpha(const struct texture *t);
 
+/// Size of the pixel data of a texture, in bytes
+size_t tex_bytes(const struct texture *t);
+
 void tex_clear(struct texture *t);
 
 /// Deallocate a given texture
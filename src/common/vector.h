@@ -44,9 +44,37 @@ struct vertex_buffer {
 	struct vector *vertices;
 	struct vector *normals;
 	struct coord *texture_coords;
+	// If set, the arrays above are plain arrays owned by the API caller, instead of
+	// v_arr, so use the counts below. Use the vbuf_*_count() helpers to get lengths.
+	bool borrowed;
+	size_t vertex_count;
+	size_t normal_count;
+	size_t texture_coord_count;
 };
 
+static inline size_t vbuf_vertex_count(const struct vertex_buffer *buf) {
+	return buf->borrowed ? buf->vertex_count : v_arr_len(buf->vertices);
+}
+
+static inline size_t vbuf_normal_count(const struct vertex_buffer *buf) {
+	return buf->borrowed ? buf->normal_count : v_arr_len(buf->normals);
+}
+
+static inline size_t vbuf_texture_coord_count(const struct vertex_buffer *buf) {
+	return buf->borrowed ? buf->texture_coord_count : v_arr_len(buf->texture_coords);
+}
+
+static inline size_t vbuf_bytes(const struct vertex_buffer *buf) {
+	return vbuf_vertex_count(buf) * sizeof(*buf->vertices)
+		+ vbuf_normal_count(buf) * sizeof(*buf->normals)
+		+ vbuf_texture_coord_count(buf) * sizeof(*buf->texture_coords);
+}
+
 static inline void vertex_buf_free(struct vertex_buffer *buf) {
+	if (buf->borrowed) {
+		*buf = (struct vertex_buffer){ 0 };
+		return;
+	}
 	v_arr_free(buf->vertices);
 	v_arr_free(buf->normals);
 	v_arr_free(buf->texture_coords);
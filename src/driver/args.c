@@ -43,6 +43,8 @@ static void printUsage(const char *progname) {
 	printf("    [--shutdown]     -> Use in conjunction with a node list to send a shutdown command to a list of clients\n");
 	printf("    [--asset-path]   -> Specify an asset path to load assets from, useful in scripts\n");
 	printf("    [--no-sdl]       -> Disable render preview window\n");
+	printf("    [--stats <path>] -> Write timings and peak memory use to <path> as JSON\n");
+	printf("    [--time-limit <ms>] -> Render in passes until <ms> milliseconds have passed. -s sets the max sample count\n");
 	// printf("    [--test]         -> Run the test suite\n"); // FIXME
 	term_restore();
 	exit(0);
@@ -87,6 +89,14 @@ struct driver_args *args_parse(int argc, char **argv) {
 			}
 			continue;
 		}
+		if (stringEquals(argv[i], "--stats")) {
+			if (argv[i + 1]) {
+				setDatabaseString(args, "stats_path", argv[i + 1]);
+				// Skip it, it may be an existing file from a previous run
+				i++;
+			}
+			continue;
+		}
 
 		if (alternatePath) {
 			free(alternatePath);
@@ -130,6 +140,15 @@ struct driver_args *args_parse(int argc, char **argv) {
 			}
 		}
 
+		if (stringEquals(argv[i], "--time-limit")) {
+			char *limitStr = argv[i + 1];
+			if (limitStr && atoi(limitStr) > 0) {
+				setDatabaseInt(args, "time_limit_override", atoi(limitStr));
+			} else {
+				logr(warning, "Invalid --time-limit parameter given!\n");
+			}
+		}
+
 		if (stringEquals(argv[i], "-d")) {
 			char *dimstr = argv[i + 1];
 			int width = 0;
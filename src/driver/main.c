@@ -9,6 +9,7 @@
 #include <c-ray/c-ray.h>
 #include <errno.h>
 #include <signal.h>
+#include <stdio.h>
 #include <v.h>
 
 #include <imagefile.h>
@@ -138,6 +139,49 @@ static void status(struct cr_renderer_cb_info *state, void *user_data) {
 	}
 }
 
+static void write_stats(struct cr_renderer *r, const char *path) {
+	static const char *phases[] = {
+		[cr_phase_json_parse] = "json_parse",
+		[cr_phase_mesh_load] = "mesh_load",
+		[cr_phase_bvh_build] = "bvh_build",
+		[cr_phase_top_level_bvh] = "top_level_bvh",
+		[cr_phase_render] = "render",
+		[cr_phase_encode] = "encode",
+	};
+	static const char *categories[] = {
+		[cr_mem_geometry] = "geometry",
+		[cr_mem_bvh] = "bvh",
+		[cr_mem_textures] = "textures",
+		[cr_mem_node_pool] = "node_pool",
+		[cr_mem_framebuffer] = "framebuffer",
+	};
+	struct cr_renderer_stats stats = cr_renderer_get_stats(r);
+	cJSON *out = cJSON_CreateObject();
+	cJSON *timings = cJSON_AddArrayToObject(out, "timings");
+	for (size_t i = 0; i < stats.timing_count; ++i) {
+		cJSON *timing = cJSON_CreateObject();
+		cJSON_AddStringToObject(timing, "phase", phases[stats.timings[i].phase]);
+		if (stats.timings[i].name) cJSON_AddStringToObject(timing, "name", stats.timings[i].name);
+		cJSON_AddNumberToObject(timing, "us", stats.timings[i].us);
+		cJSON_AddNumberToObject(timing, "count", stats.timings[i].count);
+		cJSON_AddItemToArray(timings, timing);
+	}
+	cJSON *peak_bytes = cJSON_AddObjectToObject(out, "peak_bytes");
+	for (size_t i = 0; i < cr_mem_category_count; ++i)
+		cJSON_AddNumberToObject(peak_bytes, categories[i], stats.peak_bytes[i]);
+	char *data = cJSON_Print(out);
+	cJSON_Delete(out);
+	FILE *f = fopen(path, "w");
+	if (f) {
+		fputs(data, f);
+		fclose(f);
+		logr(info, "Wrote stats to %s\n", path);
+	} else {
+		logr(warning, "Can't write stats to %s: %s\n", path, strerror(errno));
+	}
+	free(data);
+}
+
 int main(int argc, char *argv[]) {
 	term_init();
 	atexit(term_restore);
@@ -182,7 +226,8 @@ int main(int argc, char *argv[]) {
 	logr(info, "%s of input JSON loaded from %s, parsing.\n", human_file_size(v_arr_len(input_bytes), size_buf), args_is_set(opts, "inputFile") ? "file" : "stdin");
 	v_timer json_timer = v_timer_start();
 	cJSON *input_json = cJSON_ParseWithLength((const char *)input_bytes, v_arr_len(input_bytes));
-	size_t json_ms = v_timer_get_ms(json_timer);
+	size_t json_us = v_timer_get_us(json_timer);
+	size_t json_ms = json_us / 1000;
 	if (!input_json) {
 		const char *errptr = cJSON_GetErrorPtr();
 		if (errptr) {
@@ -194,6 +239,7 @@ int main(int argc, char *argv[]) {
 	logr(info, "JSON parse took %zums\n", json_ms);
 
 	v_arr_free(input_bytes);
+	cr_renderer_add_timing(renderer, cr_phase_json_parse, args_is_set(opts, "inputFile") ? args_path(opts) : NULL, json_us);
 
 	if (args_is_set(opts, "nodes_list")) {
 		cr_renderer_set_str_pref(renderer, cr_renderer_node_list, args_string(opts, "nodes_list"));
@@ -230,6 +276,16 @@ int main(int argc, char *argv[]) {
 		}
 	}
 	
+	if (args_is_set(opts, "time_limit_override")) {
+		if (args_is_set(opts, "is_worker")) {
+			logr(warning, "Can't set a time limit when in worker mode\n");
+		} else {
+			int limit = args_int(opts, "time_limit_override");
+			logr(info, "Limiting render time to %ims\n", limit);
+			cr_renderer_set_num_pref(renderer, cr_renderer_time_limit_ms, limit);
+		}
+	}
+	
 	if (args_is_set(opts, "dims_override")) {
 		if (args_is_set(opts, "is_worker")) {
 			logr(warning, "Can't override dimensions when in worker mode\n");
@@ -343,10 +399,15 @@ int main(int argc, char *argv[]) {
 			},
 			.t = cr_renderer_get_result(renderer)
 		};
+		v_timer encode_timer = v_timer_start();
 		writeImage(&file);
+		cr_renderer_add_timing(renderer, cr_phase_encode, output_name, v_timer_get_us(encode_timer));
 		logr(info, "Render finished, exiting.\n");
 	}
 	
+	if (args_is_set(opts, "stats_path"))
+		write_stats(renderer, args_string(opts, "stats_path"));
+
 	if (output_path) free(output_path);
 	if (output_name) free(output_name);
 
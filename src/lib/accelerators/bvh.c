@@ -16,6 +16,7 @@
 #include <datatypes/poly.h>
 #include <renderer/instance.h>
 #include <common/vector.h>
+#include <v.h>
 
 #include <limits.h>
 #include <assert.h>
@@ -23,6 +24,25 @@
 #include <stdlib.h>
 #include <math.h>
 
+// SSE is part of the x86-64 baseline. AVX is only used if the CPU running this supports it.
+#if defined(__x86_64__) || defined(_M_X64)
+#define HAVE_SSE 1
+#include <xmmintrin.h>
+#endif
+#if defined(__x86_64__) && (defined(__GNUC__) || defined(__clang__))
+#define HAVE_AVX 1
+#include <immintrin.h>
+#define TARGET_AVX __attribute__((target("avx")))
+#endif
+
+// The traversal loop is instantiated once per instruction set, and the node tests have to be
+// inlined into it to be worth anything.
+#if defined(__GNUC__) || defined(__clang__)
+#define ALWAYS_INLINE inline __attribute__((always_inline))
+#else
+#define ALWAYS_INLINE inline
+#endif
+
 /*
  * This BVH builder is based on "On fast Construction of SAH-based Bounding Volume Hierarchies",
  * by I. Wald. The general idea is to approximate the SAH by subdividing each axis in several
@@ -38,6 +58,11 @@
 #define BIN_COUNT        32   // Number of bins to use to approximate the SAH
 #define ROBUST_TRAVERSAL 0    // Set to 1 in order to use a fully robust algo. (from T. Ize's "Robust BVH Ray Traversal")
 #define MAX_LEAF_SIZE    ((1 << PRIM_COUNT_BITS) - 1)
+#define PARALLEL_BUILD_MIN (1 << 16) // Subtrees with at least this many primitives are built by separate threads
+#define BUILD_CHUNK_SIZE   (1 << 15) // Primitives per task when binning and computing bounds in parallel
+#define MAX_REFIT_COST   1.5f // Rebuild a BVH instead of refitting it once its SAH cost grows by this factor
+#define WIDE_BVH_WIDTH   8    // Max children of a node in the collapsed BVH used to trace single rays
+#define WIDE_STACK_SIZE  ((MAX_BVH_DEPTH + 1) * (WIDE_BVH_WIDTH - 1) + 1)
 
 typedef size_t index_t;
 typedef bool (*intersect_leaf_fn_t)(
@@ -46,6 +71,13 @@ typedef bool (*intersect_leaf_fn_t)(
 	const struct lightRay *,
 	size_t, size_t,
 	struct hitRecord *);
+// Returns the lanes that found a closer hit
+typedef lane_mask (*intersect_leaf_packet_fn_t)(
+	const void *,
+	const struct bvh *,
+	const struct ray_packet *,
+	lane_mask,
+	size_t, size_t);
 
 // This structure has the same size as `index_type`
 struct bvh_index {
@@ -58,10 +90,30 @@ struct bvh_node {
 	struct bvh_index index; // Indices pointing to primitives and children (if any)
 };
 
+// Node of the collapsed BVH. Child bounds are stored per plane, so all children can be tested
+// with a few SIMD instructions. Unused slots have inverted bounds that no ray can hit.
+struct wide_bvh_node {
+	float bounds[6][WIDE_BVH_WIDTH];           // Child bounds (min x, max x, min y, max y, ...)
+	struct bvh_index children[WIDE_BVH_WIDTH]; // Leaves index primitives like in bvh_node, inner children index wide nodes
+};
+
+// Instruction set used to test wide nodes, picked at runtime
+enum bvh_simd {
+	bvh_simd_none, // No wide nodes, the binary BVH is traversed instead
+	bvh_simd_sse,
+	bvh_simd_avx,
+};
+
 struct bvh {
 	struct bvh_node *nodes;
 	size_t *prim_indices;
 	size_t node_count;
+	size_t prim_count;
+	float build_cost; // SAH cost after the last full build, see refit_bvh_generic()
+	struct wide_bvh_node *wide_nodes; // Collapsed from nodes, see collapse_bvh()
+	size_t wide_node_count;
+	enum bvh_simd simd;
+	bool borrowed; // nodes and prim_indices point into a baked scene, see bvh_wrap()
 };
 
 // Bin used to approximate the SAH.
@@ -103,6 +155,20 @@ static inline float robust_max(float a, float b) { return a > b ? a : b; }
 static inline float safe_inverse(float x) { return fabsf(x) <= FLT_EPSILON ? 1.f / FLT_EPSILON : 1.f / x; }
 #endif
 
+// Index of the lowest set bit, mask must not be 0
+static inline unsigned lowest_bit(unsigned mask) {
+#if defined(__GNUC__) || defined(__clang__)
+	return __builtin_ctz(mask);
+#else
+	unsigned i = 0;
+	while (!(mask & 1)) {
+		mask >>= 1;
+		i++;
+	}
+	return i;
+#endif
+}
+
 static inline unsigned find_largest_axis(const struct vector *v) {
 	if (v->y >= v->z && v->y >= v->x) return 1;
 	if (v->z >= v->y && v->z >= v->x) return 2;
@@ -315,14 +381,204 @@ static inline size_t fallback_split(
 	return (begin + end) / 2;
 }
 
+// Subtrees of one build that were handed to the pool and haven't finished yet. The pool is
+// shared with other builds, so v_threadpool_wait() can't tell when this one is done.
+struct pending_subtrees {
+	size_t count;
+	v_mutex *lock;
+	v_cond *done;
+};
+
+// Shared by all threads working on one BVH build
+struct build_context {
+	struct bvh *bvh;
+	const struct boundingBox *bboxes;
+	const struct vector *centers;
+	v_threadpool *pool; // Threads for large builds, NULL when building serially
+	size_t threads;
+	struct pending_subtrees *pending;
+};
+
+/*
+ * A loop over fixed-size chunks of a range, that threads in the build pool can help with. The
+ * thread that starts it works on chunks too, and only waits for chunks other threads are still
+ * busy with, so it never waits for a pool thread to become free. Helper tasks that get to run
+ * after all chunks are taken just drop their reference, and the last one out frees the job.
+ */
+struct chunked_job {
+	void (*run)(const void *arg, size_t begin, size_t end, size_t chunk);
+	const void *arg;
+	size_t begin, end;
+	size_t chunk_count;
+	size_t next_chunk;
+	size_t chunks_done;
+	size_t refs;
+	v_mutex *lock;
+	v_cond *finished;
+};
+
+static inline size_t chunk_count(size_t begin, size_t end) {
+	return (end - begin + BUILD_CHUNK_SIZE - 1) / BUILD_CHUNK_SIZE;
+}
+
+// Called with the lock held
+static void chunked_job_release(struct chunked_job *job) {
+	const bool last = --job->refs == 0;
+	v_mutex_release(job->lock);
+	if (!last)
+		return;
+	v_cond_destroy(job->finished);
+	v_mutex_destroy(job->lock);
+	free(job);
+}
+
+// Runs chunks until there are none left, returns with the lock held
+static void chunked_job_work(struct chunked_job *job) {
+	v_mutex_lock(job->lock);
+	while (job->next_chunk < job->chunk_count) {
+		const size_t chunk = job->next_chunk++;
+		v_mutex_release(job->lock);
+		const size_t begin = job->begin + chunk * BUILD_CHUNK_SIZE;
+		const size_t end = min(begin + BUILD_CHUNK_SIZE, job->end);
+		job->run(job->arg, begin, end, chunk);
+		v_mutex_lock(job->lock);
+		if (++job->chunks_done == job->chunk_count)
+			v_cond_broadcast(job->finished);
+	}
+}
+
+static void chunked_job_task(void *arg) {
+	struct chunked_job *job = arg;
+	chunked_job_work(job);
+	chunked_job_release(job);
+}
+
+// Calls run for each chunk of [begin, end), and returns when all of them are done
+static void run_chunked(
+	const struct build_context *ctx,
+	void (*run)(const void *, size_t, size_t, size_t),
+	const void *arg,
+	size_t begin, size_t end)
+{
+	const size_t chunks = chunk_count(begin, end);
+	const size_t helpers = min(chunks - 1, ctx->threads);
+	struct chunked_job *job = malloc(sizeof(*job));
+	*job = (struct chunked_job){
+		.run = run,
+		.arg = arg,
+		.begin = begin,
+		.end = end,
+		.chunk_count = chunks,
+		.refs = helpers + 1,
+		.lock = v_mutex_create(),
+		.finished = v_cond_create(),
+	};
+	for (size_t i = 0; i < helpers; ++i)
+		v_threadpool_enqueue(ctx->pool, chunked_job_task, job);
+	chunked_job_work(job);
+	while (job->chunks_done < job->chunk_count)
+		v_cond_wait(job->finished, job->lock);
+	chunked_job_release(job);
+}
+
+struct bbox_chunks {
+	const struct build_context *ctx;
+	struct boundingBox *partial;
+};
+
+static void compute_bbox_chunk(const void *arg, size_t begin, size_t end, size_t chunk) {
+	const struct bbox_chunks *c = arg;
+	c->partial[chunk] = compute_bbox(c->ctx->bboxes, c->ctx->bvh->prim_indices, begin, end);
+}
+
+// Same as compute_bbox(), split over the build threads for large ranges
+static struct boundingBox compute_bbox_parallel(const struct build_context *ctx, size_t begin, size_t end) {
+	const size_t chunks = chunk_count(begin, end);
+	if (!ctx->pool || chunks < 2)
+		return compute_bbox(ctx->bboxes, ctx->bvh->prim_indices, begin, end);
+	struct bbox_chunks c = { ctx, malloc(sizeof(*c.partial) * chunks) };
+	run_chunked(ctx, compute_bbox_chunk, &c, begin, end);
+	// Bounding box unions are exact, so this is the same as a serial pass
+	struct boundingBox bbox = emptyBBox;
+	for (size_t i = 0; i < chunks; ++i)
+		extendBBox(&bbox, &c.partial[i]);
+	free(c.partial);
+	return bbox;
+}
+
+struct bin_chunks {
+	const struct build_context *ctx;
+	const float *bin_scale;
+	const float *bin_offset;
+	struct bin (*partial)[3][BIN_COUNT];
+};
+
+static void fill_bins_chunk(const void *arg, size_t begin, size_t end, size_t chunk) {
+	const struct bin_chunks *c = arg;
+	setup_bins(c->partial[chunk]);
+	fill_bins(c->partial[chunk], c->ctx->bvh->prim_indices, c->ctx->centers, c->bin_scale, c->bin_offset, c->ctx->bboxes, begin, end);
+}
+
+// Same as fill_bins(), split over the build threads for large ranges
+static void fill_bins_parallel(
+	const struct build_context *ctx,
+	struct bin bins[3][BIN_COUNT],
+	const float *bin_scale,
+	const float *bin_offset,
+	size_t begin, size_t end)
+{
+	setup_bins(bins);
+	const size_t chunks = chunk_count(begin, end);
+	if (!ctx->pool || chunks < 2) {
+		fill_bins(bins, ctx->bvh->prim_indices, ctx->centers, bin_scale, bin_offset, ctx->bboxes, begin, end);
+		return;
+	}
+	struct bin_chunks c = { ctx, bin_scale, bin_offset, malloc(sizeof(*c.partial) * chunks) };
+	run_chunked(ctx, fill_bins_chunk, &c, begin, end);
+	for (size_t i = 0; i < chunks; ++i) {
+		for (unsigned axis = 0; axis < 3; ++axis) {
+			for (size_t j = 0; j < BIN_COUNT; ++j)
+				merge_bin(&bins[axis][j], &c.partial[i][axis][j]);
+		}
+	}
+	free(c.partial);
+}
+
 static void build_bvh_recursive(
+	const struct build_context *ctx,
 	size_t node_id,
-	struct bvh *bvh,
-	const struct boundingBox *bboxes,
-	const struct vector *centers,
+	size_t *next_node,
+	size_t begin, size_t end,
+	size_t depth);
+
+struct subtree_task {
+	const struct build_context *ctx;
+	size_t node_id;
+	size_t next_node;
+	size_t begin, end;
+	size_t depth;
+};
+
+static void build_subtree_task(void *arg) {
+	struct subtree_task *task = arg;
+	struct pending_subtrees *pending = task->ctx->pending;
+	build_bvh_recursive(task->ctx, task->node_id, &task->next_node, task->begin, task->end, task->depth);
+	free(task);
+	v_mutex_lock(pending->lock);
+	if (--pending->count == 0)
+		v_cond_broadcast(pending->done);
+	v_mutex_release(pending->lock);
+}
+
+static void build_bvh_recursive(
+	const struct build_context *ctx,
+	size_t node_id,
+	size_t *next_node,
 	size_t begin, size_t end,
 	size_t depth)
 {
+	struct bvh *bvh = ctx->bvh;
+	const struct vector *centers = ctx->centers;
 	const size_t prim_count = end - begin;
 	struct bvh_node *node = &bvh->nodes[node_id];
 
@@ -343,8 +599,7 @@ static void build_bvh_recursive(
 		-node_bbox.min.y * bin_scale[1],
 		-node_bbox.min.z * bin_scale[2]
 	};
-	setup_bins(bins);
-	fill_bins(bins, bvh->prim_indices, centers, bin_scale, bin_offset, bboxes, begin, end);
+	fill_bins_parallel(ctx, bins, bin_scale, bin_offset, begin, end);
 	const struct split split = find_best_split(bins);
 
 	const float leaf_cost = compute_half_node_area(node) * (prim_count - TRAVERSAL_COST);
@@ -361,29 +616,182 @@ static void build_bvh_recursive(
 			right_begin = fallback_split(bvh->prim_indices, &node_extents, centers, begin, end);
 	}
 
-	const size_t first_child = bvh->node_count;
-	bvh->node_count += 2;
+	const size_t first_child = *next_node;
+	*next_node += 2;
 
 	// Compute the bounding box of the children
-	const struct boundingBox left_bbox  = compute_bbox(bboxes, bvh->prim_indices, begin, right_begin);
-	const struct boundingBox right_bbox = compute_bbox(bboxes, bvh->prim_indices, right_begin, end);
+	const struct boundingBox left_bbox  = compute_bbox_parallel(ctx, begin, right_begin);
+	const struct boundingBox right_bbox = compute_bbox_parallel(ctx, right_begin, end);
 	store_bbox_to_node(&bvh->nodes[first_child + 0], &left_bbox);
 	store_bbox_to_node(&bvh->nodes[first_child + 1], &right_bbox);
 	node->index = make_inner_index(first_child);
 
-	build_bvh_recursive(first_child + 0, bvh, bboxes, centers, begin, right_begin, depth + 1);
-	build_bvh_recursive(first_child + 1, bvh, bboxes, centers, right_begin, end, depth + 1);
+	if (ctx->pool && prim_count >= PARALLEL_BUILD_MIN) {
+		// Hand the left subtree to another thread. Neither side knows how many nodes the other
+		// one will use, so each gets a range big enough for the worst case: The descendants of
+		// a node with N primitives take up at most 2 * N - 2 nodes. compact_bvh() removes the
+		// gaps this leaves once the build is done.
+		struct subtree_task *task = malloc(sizeof(*task));
+		*task = (struct subtree_task){ ctx, first_child + 0, *next_node, begin, right_begin, depth + 1 };
+		size_t right_next_node = *next_node + 2 * (right_begin - begin) - 2;
+		v_mutex_lock(ctx->pending->lock);
+		ctx->pending->count++;
+		v_mutex_release(ctx->pending->lock);
+		v_threadpool_enqueue(ctx->pool, build_subtree_task, task);
+		build_bvh_recursive(ctx, first_child + 1, &right_next_node, right_begin, end, depth + 1);
+		return;
+	}
+
+	build_bvh_recursive(ctx, first_child + 0, next_node, begin, right_begin, depth + 1);
+	build_bvh_recursive(ctx, first_child + 1, next_node, right_begin, end, depth + 1);
 	return;
 
 make_leaf:
 	node->index = make_leaf_index(begin, prim_count);
 }
 
-// Builds a BVH using the provided callback to obtain bounding boxes and centers for each primitive
+static enum bvh_simd detect_simd(void) {
+#if HAVE_AVX && !ROBUST_TRAVERSAL
+	if (__builtin_cpu_supports("avx"))
+		return bvh_simd_avx;
+#endif
+#if HAVE_SSE && !ROBUST_TRAVERSAL
+	return bvh_simd_sse;
+#else
+	return bvh_simd_none;
+#endif
+}
+
+static void collapse_bvh_recursive(struct bvh *bvh, size_t wide_id, const struct bvh_node *node) {
+	// Starting from just this node, keep replacing the inner child with the largest surface area
+	// by its two children, until the wide node is full or only leaves are left.
+	const struct bvh_node *children[WIDE_BVH_WIDTH] = { node };
+	size_t count = 1;
+	while (count < WIDE_BVH_WIDTH) {
+		size_t largest = count;
+		float largest_area = -1.f;
+		for (size_t i = 0; i < count; ++i) {
+			if (children[i]->index.prim_count > 0)
+				continue;
+			const float area = compute_half_node_area(children[i]);
+			if (area > largest_area) {
+				largest = i;
+				largest_area = area;
+			}
+		}
+		if (largest == count)
+			break;
+		const index_t first_child = children[largest]->index.first_child_or_prim;
+		children[largest] = &bvh->nodes[first_child + 0];
+		children[count++] = &bvh->nodes[first_child + 1];
+	}
+
+	struct wide_bvh_node *wide = &bvh->wide_nodes[wide_id];
+	for (size_t i = 0; i < WIDE_BVH_WIDTH; ++i) {
+		if (i >= count) {
+			for (unsigned j = 0; j < 6; j += 2) {
+				wide->bounds[j + 0][i] = INFINITY;
+				wide->bounds[j + 1][i] = -INFINITY;
+			}
+			wide->children[i] = make_inner_index(0);
+			continue;
+		}
+		for (unsigned j = 0; j < 6; ++j)
+			wide->bounds[j][i] = children[i]->bounds[j];
+		wide->children[i] = children[i]->index.prim_count > 0 ? children[i]->index : make_inner_index(bvh->wide_node_count++);
+	}
+	for (size_t i = 0; i < count; ++i) {
+		if (children[i]->index.prim_count == 0)
+			collapse_bvh_recursive(bvh, wide->children[i].first_child_or_prim, children[i]);
+	}
+}
+
+// Builds the wide BVH used to trace single rays from the binary one
+static void collapse_bvh(struct bvh *bvh) {
+	bvh->simd = detect_simd();
+	if (bvh->simd == bvh_simd_none || bvh->node_count < 1)
+		return;
+	// Every wide node takes in at least one binary inner node, except for a root that is a leaf
+	bvh->wide_nodes = malloc(sizeof(struct wide_bvh_node) * (bvh->node_count / 2 + 1));
+	bvh->wide_node_count = 1;
+	collapse_bvh_recursive(bvh, 0, &bvh->nodes[0]);
+	bvh->wide_nodes = realloc(bvh->wide_nodes, sizeof(struct wide_bvh_node) * bvh->wide_node_count);
+}
+
+static size_t count_nodes_recursive(const struct bvh_node *nodes, size_t node_id) {
+	const struct bvh_node *node = &nodes[node_id];
+	if (node->index.prim_count > 0)
+		return 1;
+	const size_t first_child = node->index.first_child_or_prim;
+	return 1 + count_nodes_recursive(nodes, first_child + 0) + count_nodes_recursive(nodes, first_child + 1);
+}
+
+// Copies nodes over in the order a serial build would have allocated them in
+static void compact_bvh_recursive(const struct bvh_node *nodes, struct bvh_node *out, size_t *next_node, size_t node_id, size_t out_id) {
+	const struct bvh_node *node = &nodes[node_id];
+	memcpy(out[out_id].bounds, node->bounds, sizeof(node->bounds));
+	if (node->index.prim_count > 0) {
+		out[out_id].index = node->index;
+		return;
+	}
+	const size_t first_child = node->index.first_child_or_prim;
+	const size_t out_first_child = *next_node;
+	*next_node += 2;
+	out[out_id].index = make_inner_index(out_first_child);
+	compact_bvh_recursive(nodes, out, next_node, first_child + 0, out_first_child + 0);
+	compact_bvh_recursive(nodes, out, next_node, first_child + 1, out_first_child + 1);
+}
+
+// Parallel builds leave gaps between subtrees, squeeze them out
+static void compact_bvh(struct bvh *bvh) {
+	bvh->node_count = count_nodes_recursive(bvh->nodes, 0);
+	struct bvh_node *nodes = malloc(sizeof(struct bvh_node) * bvh->node_count);
+	size_t next_node = 1;
+	compact_bvh_recursive(bvh->nodes, nodes, &next_node, 0, 0);
+	free(bvh->nodes);
+	bvh->nodes = nodes;
+}
+
+struct prim_setup {
+	const void *user_data;
+	void (*get_bbox_and_center)(const void *, unsigned, struct boundingBox *, struct vector *);
+	struct boundingBox *bboxes;
+	struct vector *centers;
+	size_t *prim_indices;
+};
+
+static void setup_prims_chunk(const void *arg, size_t begin, size_t end, size_t chunk) {
+	(void)chunk;
+	const struct prim_setup *setup = arg;
+	for (size_t i = begin; i < end; ++i) {
+		setup->get_bbox_and_center(setup->user_data, i, &setup->bboxes[i], &setup->centers[i]);
+		setup->prim_indices[i] = i;
+	}
+}
+
+// SAH cost of the whole tree, relative to the area of the root
+static float bvh_sah_cost(const struct bvh *bvh) {
+	if (bvh->node_count < 1)
+		return 0.0f;
+	const float root_area = compute_half_node_area(&bvh->nodes[0]);
+	if (root_area <= 0.0f)
+		return 0.0f;
+	float cost = 0.0f;
+	for (size_t i = 0; i < bvh->node_count; ++i) {
+		const struct bvh_node *node = &bvh->nodes[i];
+		const float area = compute_half_node_area(node);
+		cost += node->index.prim_count > 0 ? area * node->index.prim_count : area * TRAVERSAL_COST;
+	}
+	return cost / root_area;
+}
+
+// Builds a BVH using the provided callback to obtain bounding boxes and centers for each primitive.
+// Large builds get help from pool, which must not be the pool the caller is running in.
 static inline struct bvh *build_bvh_generic(
 	const void *user_data,
 	void (*get_bbox_and_center)(const void *, unsigned, struct boundingBox *, struct vector *),
-	size_t count)
+	size_t count,
+	v_threadpool *pool)
 {
 	if (count < 1)
 		return calloc(1, sizeof(struct bvh));
@@ -392,46 +800,109 @@ static inline struct bvh *build_bvh_generic(
 	struct boundingBox *bboxes = malloc(sizeof(struct boundingBox) * count);
 	size_t *prim_indices = malloc(sizeof(size_t) * count);
 
-	for (unsigned i = 0; i < count; ++i) {
-		get_bbox_and_center(user_data, i, &bboxes[i], &centers[i]);
-		prim_indices[i] = i;
+	struct bvh *bvh = malloc(sizeof(struct bvh));
+	struct pending_subtrees pending = { 0 };
+	struct build_context ctx = {
+		.bvh = bvh,
+		.bboxes = bboxes,
+		.centers = centers,
+		.pool = count >= PARALLEL_BUILD_MIN ? pool : NULL,
+		.threads = v_sys_get_cores(),
+		.pending = &pending,
+	};
+	if (ctx.pool) {
+		pending.lock = v_mutex_create();
+		pending.done = v_cond_create();
 	}
 
+	// With no pool, this and the bounds below just run serially
+	const struct prim_setup setup = { user_data, get_bbox_and_center, bboxes, centers, prim_indices };
+	if (ctx.pool)
+		run_chunked(&ctx, setup_prims_chunk, &setup, 0, count);
+	else
+		setup_prims_chunk(&setup, 0, count, 0);
+
 	// Binary tree property: total number of nodes (inner + leaves) = 2 * number of leaves - 1
 	const size_t max_nodes = 2 * count - 1;
-	const struct boundingBox root_bbox = compute_bbox(bboxes, prim_indices, 0, count);
+	bvh->prim_indices = prim_indices;
+	const struct boundingBox root_bbox = compute_bbox_parallel(&ctx, 0, count);
 
-	struct bvh *bvh = malloc(sizeof(struct bvh));
-	bvh->node_count = 1; // For the root
 	bvh->nodes = malloc(sizeof(struct bvh_node) * max_nodes);
-	bvh->prim_indices = prim_indices;
+	bvh->prim_count = count;
+	bvh->wide_nodes = NULL;
+	bvh->wide_node_count = 0;
+	bvh->borrowed = false;
 	store_bbox_to_node(&bvh->nodes[0], &root_bbox);
 
-	build_bvh_recursive(0, bvh, bboxes, centers, 0, count, 0);
-
-	// Shrink array of nodes (since some leaves may contain more than 1 primitive)
-	bvh->nodes = realloc(bvh->nodes, sizeof(struct bvh_node) * bvh->node_count);
+	size_t next_node = 1; // For the root
+	build_bvh_recursive(&ctx, 0, &next_node, 0, count, 0);
+
+	if (ctx.pool) {
+		v_mutex_lock(pending.lock);
+		while (pending.count)
+			v_cond_wait(pending.done, pending.lock);
+		v_mutex_release(pending.lock);
+		v_cond_destroy(pending.done);
+		v_mutex_destroy(pending.lock);
+		compact_bvh(bvh);
+	} else {
+		// Shrink array of nodes (since some leaves may contain more than 1 primitive)
+		bvh->node_count = next_node;
+		bvh->nodes = realloc(bvh->nodes, sizeof(struct bvh_node) * bvh->node_count);
+	}
 	free(centers);
 	free(bboxes);
+	bvh->build_cost = bvh_sah_cost(bvh);
+	collapse_bvh(bvh);
 	return bvh;
 }
 
+// Ray setup for intersect_node(), shared by all the nodes a ray is tested against
+struct node_ray {
+	struct vector inv_dir;
+	struct vector start;
+	int octant[3];
+};
+
+static inline struct node_ray make_node_ray(const struct lightRay *ray) {
+	struct node_ray out = {
+		.octant = {
+			signbit(ray->direction.x) ? 1 : 0,
+			signbit(ray->direction.y) ? 1 : 0,
+			signbit(ray->direction.z) ? 1 : 0
+		},
+	};
+#if ROBUST_TRAVERSAL
+	out.inv_dir = (struct vector){ 1.f / ray->direction.x, 1.f / ray->direction.y, 1.f / ray->direction.z };
+	out.start = ray->start;
+#else
+	out.inv_dir = (struct vector){
+		safe_inverse(ray->direction.x),
+		safe_inverse(ray->direction.y),
+		safe_inverse(ray->direction.z)
+	};
+	out.start = vec_negate(vec_mul(ray->start, out.inv_dir));
+#endif
+	return out;
+}
+
 // TODO: Add [tmin, tmax] to the lightRay structure for more efficient culling.
 #if ROBUST_TRAVERSAL
-static inline bool intersect_node(
-	const struct bvh_node *node,
-	const struct vector *inv_dir,
-	const struct vector *start,
-	const int *octant,
+static inline bool intersect_box(
+	const float *bounds,
+	const struct node_ray *ray,
 	float max_dist,
 	float *t_entry)
 {
-	float tmin_x = (node->bounds[0 +     octant[0]] - start->x) * inv_dir->x;
-	float tmax_x = (node->bounds[0 + 1 - octant[0]] - start->x) * inv_dir->x;
-	float tmin_y = (node->bounds[2 +     octant[1]] - start->y) * inv_dir->y;
-	float tmax_y = (node->bounds[2 + 1 - octant[1]] - start->y) * inv_dir->y;
-	float tmin_z = (node->bounds[4 +     octant[2]] - start->z) * inv_dir->z;
-	float tmax_z = (node->bounds[4 + 1 - octant[2]] - start->z) * inv_dir->z;
+	const struct vector *inv_dir = &ray->inv_dir;
+	const struct vector *start = &ray->start;
+	const int *octant = ray->octant;
+	float tmin_x = (bounds[0 +     octant[0]] - start->x) * inv_dir->x;
+	float tmax_x = (bounds[0 + 1 - octant[0]] - start->x) * inv_dir->x;
+	float tmin_y = (bounds[2 +     octant[1]] - start->y) * inv_dir->y;
+	float tmax_y = (bounds[2 + 1 - octant[1]] - start->y) * inv_dir->y;
+	float tmin_z = (bounds[4 +     octant[2]] - start->z) * inv_dir->z;
+	float tmax_z = (bounds[4 + 1 - octant[2]] - start->z) * inv_dir->z;
 	float tmin = robust_max(tmin_x, robust_max(tmin_y, robust_max(tmin_z, 0.f)));
 	float tmax = robust_min(tmax_x, robust_min(tmax_y, robust_min(tmax_z, max_dist)));
 	tmax *= 1.00000024f; // See T. Ize's "Robust BVH Ray Traversal" article.
@@ -439,20 +910,21 @@ static inline bool intersect_node(
 	return tmin <= tmax;
 }
 #else
-static inline bool intersect_node(
-	const struct bvh_node *node,
-	const struct vector *inv_dir,
-	const struct vector *scaled_start,
-	const int *octant,
+static inline bool intersect_box(
+	const float *bounds,
+	const struct node_ray *ray,
 	float max_dist,
 	float *t_entry)
 {
-	float tmin_x = fast_mul_add(node->bounds[0 +     octant[0]], inv_dir->x, scaled_start->x);
-	float tmax_x = fast_mul_add(node->bounds[0 + 1 - octant[0]], inv_dir->x, scaled_start->x);
-	float tmin_y = fast_mul_add(node->bounds[2 +     octant[1]], inv_dir->y, scaled_start->y);
-	float tmax_y = fast_mul_add(node->bounds[2 + 1 - octant[1]], inv_dir->y, scaled_start->y);
-	float tmin_z = fast_mul_add(node->bounds[4 +     octant[2]], inv_dir->z, scaled_start->z);
-	float tmax_z = fast_mul_add(node->bounds[4 + 1 - octant[2]], inv_dir->z, scaled_start->z);
+	const struct vector *inv_dir = &ray->inv_dir;
+	const struct vector *scaled_start = &ray->start;
+	const int *octant = ray->octant;
+	float tmin_x = fast_mul_add(bounds[0 +     octant[0]], inv_dir->x, scaled_start->x);
+	float tmax_x = fast_mul_add(bounds[0 + 1 - octant[0]], inv_dir->x, scaled_start->x);
+	float tmin_y = fast_mul_add(bounds[2 +     octant[1]], inv_dir->y, scaled_start->y);
+	float tmax_y = fast_mul_add(bounds[2 + 1 - octant[1]], inv_dir->y, scaled_start->y);
+	float tmin_z = fast_mul_add(bounds[4 +     octant[2]], inv_dir->z, scaled_start->z);
+	float tmax_z = fast_mul_add(bounds[4 + 1 - octant[2]], inv_dir->z, scaled_start->z);
 	float tmin = robust_max(tmin_x, robust_max(tmin_y, robust_max(tmin_z, 0.f)));
 	float tmax = robust_min(tmax_x, robust_min(tmax_y, robust_min(tmax_z, max_dist)));
 	*t_entry = tmin;
@@ -460,6 +932,94 @@ static inline bool intersect_node(
 }
 #endif
 
+static inline bool intersect_node(
+	const struct bvh_node *node,
+	const struct node_ray *ray,
+	float max_dist,
+	float *t_entry)
+{
+	return intersect_box(node->bounds, ray, max_dist, t_entry);
+}
+
+// Tests a ray against all children of a wide node. Returns a mask of the children that were hit,
+// and stores their entry distances in t_entry.
+typedef unsigned (*intersect_wide_node_fn_t)(
+	const struct wide_bvh_node *,
+	const struct node_ray *,
+	float,
+	float *);
+
+/*
+ * These compute exactly what intersect_box() does for each child, with the same rounding: The
+ * multiply and add are separate, and min/max return their second operand when either side is NaN,
+ * just like robust_min() and robust_max(). So they find the same hits as the binary traversal.
+ */
+#if HAVE_SSE && !ROBUST_TRAVERSAL
+static ALWAYS_INLINE unsigned intersect_wide_node_sse(
+	const struct wide_bvh_node *node,
+	const struct node_ray *ray,
+	float max_dist,
+	float *t_entry)
+{
+	const int *octant = ray->octant;
+	const __m128 inv_x = _mm_set1_ps(ray->inv_dir.x);
+	const __m128 inv_y = _mm_set1_ps(ray->inv_dir.y);
+	const __m128 inv_z = _mm_set1_ps(ray->inv_dir.z);
+	const __m128 start_x = _mm_set1_ps(ray->start.x);
+	const __m128 start_y = _mm_set1_ps(ray->start.y);
+	const __m128 start_z = _mm_set1_ps(ray->start.z);
+	const __m128 zero = _mm_setzero_ps();
+	const __m128 dist = _mm_set1_ps(max_dist);
+	unsigned mask = 0;
+	for (size_t i = 0; i < WIDE_BVH_WIDTH; i += 4) {
+		__m128 tmin_x = _mm_add_ps(_mm_mul_ps(_mm_loadu_ps(&node->bounds[0 +     octant[0]][i]), inv_x), start_x);
+		__m128 tmax_x = _mm_add_ps(_mm_mul_ps(_mm_loadu_ps(&node->bounds[0 + 1 - octant[0]][i]), inv_x), start_x);
+		__m128 tmin_y = _mm_add_ps(_mm_mul_ps(_mm_loadu_ps(&node->bounds[2 +     octant[1]][i]), inv_y), start_y);
+		__m128 tmax_y = _mm_add_ps(_mm_mul_ps(_mm_loadu_ps(&node->bounds[2 + 1 - octant[1]][i]), inv_y), start_y);
+		__m128 tmin_z = _mm_add_ps(_mm_mul_ps(_mm_loadu_ps(&node->bounds[4 +     octant[2]][i]), inv_z), start_z);
+		__m128 tmax_z = _mm_add_ps(_mm_mul_ps(_mm_loadu_ps(&node->bounds[4 + 1 - octant[2]][i]), inv_z), start_z);
+		__m128 tmin = _mm_max_ps(tmin_x, _mm_max_ps(tmin_y, _mm_max_ps(tmin_z, zero)));
+		__m128 tmax = _mm_min_ps(tmax_x, _mm_min_ps(tmax_y, _mm_min_ps(tmax_z, dist)));
+		_mm_storeu_ps(&t_entry[i], tmin);
+		mask |= (unsigned)_mm_movemask_ps(_mm_cmple_ps(tmin, tmax)) << i;
+	}
+	return mask;
+}
+#endif
+
+#if HAVE_AVX && !ROBUST_TRAVERSAL
+TARGET_AVX static ALWAYS_INLINE unsigned intersect_wide_node_avx(
+	const struct wide_bvh_node *node,
+	const struct node_ray *ray,
+	float max_dist,
+	float *t_entry)
+{
+	const int *octant = ray->octant;
+	const __m256 inv_x = _mm256_set1_ps(ray->inv_dir.x);
+	const __m256 inv_y = _mm256_set1_ps(ray->inv_dir.y);
+	const __m256 inv_z = _mm256_set1_ps(ray->inv_dir.z);
+	const __m256 start_x = _mm256_set1_ps(ray->start.x);
+	const __m256 start_y = _mm256_set1_ps(ray->start.y);
+	const __m256 start_z = _mm256_set1_ps(ray->start.z);
+	const __m256 zero = _mm256_setzero_ps();
+	const __m256 dist = _mm256_set1_ps(max_dist);
+	unsigned mask = 0;
+	for (size_t i = 0; i < WIDE_BVH_WIDTH; i += 8) {
+		__m256 tmin_x = _mm256_add_ps(_mm256_mul_ps(_mm256_loadu_ps(&node->bounds[0 +     octant[0]][i]), inv_x), start_x);
+		__m256 tmax_x = _mm256_add_ps(_mm256_mul_ps(_mm256_loadu_ps(&node->bounds[0 + 1 - octant[0]][i]), inv_x), start_x);
+		__m256 tmin_y = _mm256_add_ps(_mm256_mul_ps(_mm256_loadu_ps(&node->bounds[2 +     octant[1]][i]), inv_y), start_y);
+		__m256 tmax_y = _mm256_add_ps(_mm256_mul_ps(_mm256_loadu_ps(&node->bounds[2 + 1 - octant[1]][i]), inv_y), start_y);
+		__m256 tmin_z = _mm256_add_ps(_mm256_mul_ps(_mm256_loadu_ps(&node->bounds[4 +     octant[2]][i]), inv_z), start_z);
+		__m256 tmax_z = _mm256_add_ps(_mm256_mul_ps(_mm256_loadu_ps(&node->bounds[4 + 1 - octant[2]][i]), inv_z), start_z);
+		__m256 tmin = _mm256_max_ps(tmin_x, _mm256_max_ps(tmin_y, _mm256_max_ps(tmin_z, zero)));
+		__m256 tmax = _mm256_min_ps(tmax_x, _mm256_min_ps(tmax_y, _mm256_min_ps(tmax_z, dist)));
+		_mm256_storeu_ps(&t_entry[i], tmin);
+		mask |= (unsigned)_mm256_movemask_ps(_mm256_cmp_ps(tmin, tmax, _CMP_LE_OQ)) << i;
+	}
+	return mask;
+}
+#endif
+
 static inline bool traverse_bvh_generic(
 	const void *user_data,
 	const struct bvh *bvh,
@@ -476,28 +1036,7 @@ static inline bool traverse_bvh_generic(
 	struct bvh_index top = bvh->nodes[0].index;
 	size_t stack_size = 0;
 
-	// Precompute ray octant and inverse direction
-	int octant[] = {
-		signbit(ray->direction.x) ? 1 : 0,
-		signbit(ray->direction.y) ? 1 : 0,
-		signbit(ray->direction.z) ? 1 : 0
-	};
-
-#if ROBUST_TRAVERSAL
-	struct vector inv_dir = {
-		1.f / ray->direction.x,
-		1.f / ray->direction.y,
-		1.f / ray->direction.z
-	};
-	struct vector start = ray->start;
-#else
-	struct vector inv_dir = {
-		safe_inverse(ray->direction.x),
-		safe_inverse(ray->direction.y),
-		safe_inverse(ray->direction.z)
-	};
-	struct vector start = vec_negate(vec_mul(ray->start, inv_dir));
-#endif
+	const struct node_ray node_ray = make_node_ray(ray);
 	float max_dist = isect->distance;
 	bool was_hit = false;
 
@@ -508,8 +1047,8 @@ static inline bool traverse_bvh_generic(
 			const struct bvh_node *right_node = &bvh->nodes[first_child + 1];
 
 			float t_left, t_right;
-			bool hit_left  = intersect_node(left_node, &inv_dir, &start, octant, max_dist, &t_left);
-			bool hit_right = intersect_node(right_node, &inv_dir, &start, octant, max_dist, &t_right);
+			bool hit_left  = intersect_node(left_node, &node_ray, max_dist, &t_left);
+			bool hit_right = intersect_node(right_node, &node_ray, max_dist, &t_right);
 
 			if (hit_left) {
 				struct bvh_index first = left_node->index;
@@ -548,6 +1087,319 @@ pop:
 	return was_hit;
 }
 
+/*
+ * Single rays are traced through a wide BVH, collapsed from the binary one after it's built.
+ * Each wide node takes the place of up to WIDE_BVH_WIDTH - 1 binary inner nodes, so a ray visits
+ * far fewer nodes, and all children of a node are tested at once. Children that were hit are
+ * visited closest first, like with the binary BVH.
+ */
+static ALWAYS_INLINE bool traverse_wide_bvh_generic(
+	const void *user_data,
+	const struct bvh *bvh,
+	intersect_leaf_fn_t intersect_leaf,
+	intersect_wide_node_fn_t intersect_children,
+	const struct lightRay *ray,
+	struct hitRecord *isect)
+{
+	if (bvh->node_count < 1) {
+		isect->instIndex = -1;
+		return false;
+	}
+
+	struct bvh_index stack[WIDE_STACK_SIZE];
+	struct bvh_index top = make_inner_index(0);
+	size_t stack_size = 0;
+
+	const struct node_ray node_ray = make_node_ray(ray);
+	float max_dist = isect->distance;
+	bool was_hit = false;
+
+	while (true) {
+		while (likely(top.prim_count == 0)) {
+			const struct wide_bvh_node *node = &bvh->wide_nodes[top.first_child_or_prim];
+			float t_entry[WIDE_BVH_WIDTH];
+			unsigned mask = intersect_children(node, &node_ray, max_dist, t_entry);
+			if (!mask)
+				goto pop;
+
+			const unsigned first = lowest_bit(mask);
+			mask &= mask - 1;
+			if (likely(!mask)) {
+				top = node->children[first];
+				continue;
+			}
+
+			// Sort the children that were hit, farthest first
+			unsigned order[WIDE_BVH_WIDTH] = { first };
+			size_t hit_count = 1;
+			for (; mask; mask &= mask - 1) {
+				const unsigned i = lowest_bit(mask);
+				size_t j = hit_count++;
+				for (; j > 0 && t_entry[order[j - 1]] < t_entry[i]; --j)
+					order[j] = order[j - 1];
+				order[j] = i;
+			}
+			// Go to the closest one, and push the rest on the stack so the next closest is popped first
+			for (size_t i = 0; i < hit_count - 1; ++i)
+				stack[stack_size++] = node->children[order[i]];
+			top = node->children[order[hit_count - 1]];
+		}
+
+		if (intersect_leaf(
+			user_data, bvh, ray,
+			top.first_child_or_prim,
+			top.first_child_or_prim + top.prim_count,
+			isect))
+		{
+			max_dist = isect->distance;
+			was_hit = true;
+		}
+
+pop:
+		if (unlikely(stack_size == 0))
+			break;
+		top = stack[--stack_size];
+	}
+	return was_hit;
+}
+
+#if HAVE_SSE && !ROBUST_TRAVERSAL
+static bool traverse_wide_bvh_sse(
+	const void *user_data,
+	const struct bvh *bvh,
+	intersect_leaf_fn_t intersect_leaf,
+	const struct lightRay *ray,
+	struct hitRecord *isect)
+{
+	return traverse_wide_bvh_generic(user_data, bvh, intersect_leaf, intersect_wide_node_sse, ray, isect);
+}
+#endif
+
+#if HAVE_AVX && !ROBUST_TRAVERSAL
+TARGET_AVX static bool traverse_wide_bvh_avx(
+	const void *user_data,
+	const struct bvh *bvh,
+	intersect_leaf_fn_t intersect_leaf,
+	const struct lightRay *ray,
+	struct hitRecord *isect)
+{
+	return traverse_wide_bvh_generic(user_data, bvh, intersect_leaf, intersect_wide_node_avx, ray, isect);
+}
+#endif
+
+static inline bool traverse_bvh(
+	const void *user_data,
+	const struct bvh *bvh,
+	intersect_leaf_fn_t intersect_leaf,
+	const struct lightRay *ray,
+	struct hitRecord *isect)
+{
+	switch (bvh->simd) {
+#if HAVE_AVX && !ROBUST_TRAVERSAL
+	case bvh_simd_avx:
+		return traverse_wide_bvh_avx(user_data, bvh, intersect_leaf, ray, isect);
+#endif
+#if HAVE_SSE && !ROBUST_TRAVERSAL
+	case bvh_simd_sse:
+		return traverse_wide_bvh_sse(user_data, bvh, intersect_leaf, ray, isect);
+#endif
+	default:
+		return traverse_bvh_generic(user_data, bvh, intersect_leaf, ray, isect);
+	}
+}
+
+// A node and the first lane of the packet that hits it
+struct packet_entry {
+	const struct bvh_node *node;
+	size_t first;
+};
+
+// Bounds of ray origins and inverse directions over all active lanes. Only usable if all of
+// them are in the same octant, so they agree on which slab planes are near.
+struct packet_interval {
+	bool valid;
+	int octant[3];
+	float inv_min[3], inv_max[3];
+	float org_min[3], org_max[3];
+	float max_dist;
+};
+
+static inline struct packet_interval packet_interval_init(const struct node_ray *lanes, const struct ray_packet *packet, lane_mask active) {
+	struct packet_interval iv = { .valid = false };
+	bool first = true;
+	for (size_t i = 0; i < packet->count; ++i) {
+		if (!(active & lane_bit(i)))
+			continue;
+		const float inv[] = { lanes[i].inv_dir.x, lanes[i].inv_dir.y, lanes[i].inv_dir.z };
+		const struct vector *start = &packet->rays[i].start;
+		const float org[] = { start->x, start->y, start->z };
+		if (first) {
+			for (unsigned a = 0; a < 3; ++a) {
+				iv.octant[a] = lanes[i].octant[a];
+				iv.inv_min[a] = iv.inv_max[a] = inv[a];
+				iv.org_min[a] = iv.org_max[a] = org[a];
+			}
+			first = false;
+			continue;
+		}
+		for (unsigned a = 0; a < 3; ++a) {
+			if (iv.octant[a] != lanes[i].octant[a])
+				return iv;
+			iv.inv_min[a] = robust_min(iv.inv_min[a], inv[a]);
+			iv.inv_max[a] = robust_max(iv.inv_max[a], inv[a]);
+			iv.org_min[a] = robust_min(iv.org_min[a], org[a]);
+			iv.org_max[a] = robust_max(iv.org_max[a], org[a]);
+		}
+	}
+	iv.valid = !first;
+	iv.max_dist = FLT_MAX;
+	return iv;
+}
+
+// Farthest any active lane can still find a closer hit at
+static inline void packet_interval_update(struct packet_interval *iv, const struct ray_packet *packet, lane_mask active) {
+	float max_dist = 0.f;
+	for (size_t i = 0; i < packet->count; ++i) {
+		if (active & lane_bit(i))
+			max_dist = robust_max(max_dist, packet->isects[i]->distance);
+	}
+	iv->max_dist = max_dist;
+}
+
+// Lowest and highest value of a * b, for a in [a_min, a_max] and b in [b_min, b_max]
+static inline float interval_mul_min(float a_min, float a_max, float b_min, float b_max) {
+	return robust_min(robust_min(a_min * b_min, a_min * b_max), robust_min(a_max * b_min, a_max * b_max));
+}
+
+static inline float interval_mul_max(float a_min, float a_max, float b_min, float b_max) {
+	return robust_max(robust_max(a_min * b_min, a_min * b_max), robust_max(a_max * b_min, a_max * b_max));
+}
+
+// Returns false if no lane can hit the node, using interval arithmetic over the whole packet.
+// Rounding is a bit different from intersect_node(), so this errs on the side of a hit.
+static inline bool packet_may_hit(const struct bvh_node *node, const struct packet_interval *iv) {
+	if (!iv->valid)
+		return true;
+	float entry = 0.f;
+	float exit = iv->max_dist;
+	for (unsigned a = 0; a < 3; ++a) {
+		const float near = node->bounds[2 * a +     iv->octant[a]];
+		const float far  = node->bounds[2 * a + 1 - iv->octant[a]];
+		// Slab distances are (plane - origin) / direction
+		entry = robust_max(entry, interval_mul_min(near - iv->org_max[a], near - iv->org_min[a], iv->inv_min[a], iv->inv_max[a]));
+		exit  = robust_min(exit,  interval_mul_max(far  - iv->org_max[a], far  - iv->org_min[a], iv->inv_min[a], iv->inv_max[a]));
+	}
+	return entry - fabsf(entry) * 1e-5f <= exit + fabsf(exit) * 1e-5f;
+}
+
+// Returns the first active lane at or after first that hits the node, or packet->count if none do
+static inline size_t first_lane_hit(
+	const struct bvh_node *node,
+	const struct node_ray *lanes,
+	const struct ray_packet *packet,
+	const struct packet_interval *iv,
+	lane_mask active,
+	size_t first,
+	float *t_entry)
+{
+	if (!packet_may_hit(node, iv))
+		return packet->count;
+	for (size_t i = first; i < packet->count; ++i) {
+		if (!(active & lane_bit(i)))
+			continue;
+		if (intersect_node(node, &lanes[i], packet->isects[i]->distance, t_entry))
+			return i;
+	}
+	return packet->count;
+}
+
+/*
+ * Packet traversal in the style of Wald et al. "Interactive Rendering with Coherent Ray Tracing".
+ * A node is descended into if any active lane hits it, and rather than testing every lane against
+ * every node, only the first lane that hits is searched for. Lanes before it missed the node, and
+ * for coherent rays the lanes after it very likely hit it too, so most node visits cost a single
+ * ray-box test. Nodes that the whole packet misses are mostly culled with a single interval test
+ * over the packet instead of a test per lane. Leaves are tested per lane, so lanes only intersect
+ * primitives in leaves they hit.
+ */
+static inline lane_mask traverse_bvh_packet_generic(
+	const void *user_data,
+	const struct bvh *bvh,
+	intersect_leaf_packet_fn_t intersect_leaf,
+	const struct ray_packet *packet,
+	lane_mask active)
+{
+	if (bvh->node_count < 1)
+		return 0;
+
+	struct node_ray lanes[RAY_PACKET_SIZE];
+	for (size_t i = 0; i < packet->count; ++i) {
+		if (active & lane_bit(i))
+			lanes[i] = make_node_ray(&packet->rays[i]);
+	}
+
+	struct packet_interval iv = packet_interval_init(lanes, packet, active);
+	packet_interval_update(&iv, packet, active);
+
+	struct packet_entry stack[MAX_BVH_DEPTH + 1];
+	struct packet_entry top = { &bvh->nodes[0], 0 };
+	size_t stack_size = 0;
+	lane_mask was_hit = 0;
+
+	while (true) {
+		while (likely(top.node->index.prim_count == 0)) {
+			index_t first_child = top.node->index.first_child_or_prim;
+			const struct bvh_node *left_node  = &bvh->nodes[first_child + 0];
+			const struct bvh_node *right_node = &bvh->nodes[first_child + 1];
+
+			float t_left = FLT_MAX, t_right = FLT_MAX;
+			struct packet_entry left  = { left_node,  first_lane_hit(left_node,  lanes, packet, &iv, active, top.first, &t_left) };
+			struct packet_entry right = { right_node, first_lane_hit(right_node, lanes, packet, &iv, active, top.first, &t_right) };
+			const bool hit_left  = left.first < packet->count;
+			const bool hit_right = right.first < packet->count;
+
+			if (hit_left) {
+				if (hit_right) {
+					// Go to whichever child the first lanes found closer, and push the other on the stack.
+					if (t_left > t_right) {
+						struct packet_entry tmp = left;
+						left = right;
+						right = tmp;
+					}
+					stack[stack_size++] = right;
+				}
+				top = left;
+			} else if (likely(hit_right))
+				top = right;
+			else
+				goto pop;
+		}
+
+		lane_mask leaf_lanes = 0;
+		for (size_t i = top.first; i < packet->count; ++i) {
+			float t_entry;
+			if ((active & lane_bit(i)) && intersect_node(top.node, &lanes[i], packet->isects[i]->distance, &t_entry))
+				leaf_lanes |= lane_bit(i);
+		}
+		if (leaf_lanes) {
+			const lane_mask hit = intersect_leaf(
+				user_data, bvh, packet, leaf_lanes,
+				top.node->index.first_child_or_prim,
+				top.node->index.first_child_or_prim + top.node->index.prim_count);
+			if (hit) {
+				was_hit |= hit;
+				packet_interval_update(&iv, packet, active);
+			}
+		}
+
+pop:
+		if (unlikely(stack_size == 0))
+			break;
+		top = stack[--stack_size];
+	}
+	return was_hit;
+}
+
 static void get_poly_bbox_and_center(const void *userData, unsigned i, struct boundingBox *bbox, struct vector *center) {
 	const struct mesh *mesh = userData;
 	struct vector v0 = mesh->vbuf.vertices[mesh->polygons[i].vertexIndex[0]];
@@ -603,6 +1455,59 @@ static inline bool intersect_top_level_leaf(
 	return found;
 }
 
+static inline lane_mask intersect_bottom_level_leaf_packet(
+	const void *user_data,
+	const struct bvh *bvh,
+	const struct ray_packet *packet,
+	lane_mask active,
+	size_t begin, size_t end)
+{
+	const struct mesh *mesh = user_data;
+	lane_mask found = 0;
+	for (size_t i = begin; i < end; ++i) {
+		struct poly *p = &mesh->polygons[bvh->prim_indices[i]];
+		for (size_t lane = 0; lane < packet->count; ++lane) {
+			if (!(active & lane_bit(lane)))
+				continue;
+			if (rayIntersectsWithPolygon(mesh, &packet->rays[lane], p, packet->isects[lane])) {
+				packet->isects[lane]->polygon = p;
+				found |= lane_bit(lane);
+			}
+		}
+	}
+	return found;
+}
+
+static inline lane_mask intersect_top_level_leaf_packet(
+	const void *user_data,
+	const struct bvh *bvh,
+	const struct ray_packet *packet,
+	lane_mask active,
+	size_t begin, size_t end)
+{
+	const struct instance *instances = user_data;
+	lane_mask found = 0;
+	for (size_t i = begin; i < end; ++i) {
+		size_t prim_index = bvh->prim_indices[i];
+		const struct instance *instance = &instances[prim_index];
+		lane_mask hit = 0;
+		if (instance->intersectPacketFn) {
+			hit = instance->intersectPacketFn(instance, packet, active);
+		} else {
+			for (size_t lane = 0; lane < packet->count; ++lane) {
+				if ((active & lane_bit(lane)) && instance->intersectFn(instance, &packet->rays[lane], packet->isects[lane], packet->samplers[lane]))
+					hit |= lane_bit(lane);
+			}
+		}
+		for (size_t lane = 0; lane < packet->count; ++lane) {
+			if (hit & lane_bit(lane))
+				packet->isects[lane]->instIndex = prim_index;
+		}
+		found |= hit;
+	}
+	return found;
+}
+
 struct boundingBox get_root_bbox(const struct bvh *bvh) {
 	return load_bbox_from_node(&bvh->nodes[0]);
 }
@@ -647,12 +1552,74 @@ struct boundingBox get_transformed_root_bbox(const struct bvh *bvh, const struct
 	return bbox;
 }
 
-struct bvh *build_mesh_bvh(const struct mesh *mesh) {
-	return build_bvh_generic(mesh, get_poly_bbox_and_center, v_arr_len(mesh->polygons));
+struct bvh *build_mesh_bvh(const struct mesh *mesh, v_threadpool *pool) {
+	return build_bvh_generic(mesh, get_poly_bbox_and_center, v_arr_len(mesh->polygons), pool);
 }
 
-struct bvh *build_top_level_bvh(const struct instance *instances) {
-	return build_bvh_generic(instances, get_instance_bbox_and_center, v_arr_len(instances));
+struct bvh *build_top_level_bvh(const struct instance *instances, v_threadpool *pool) {
+	return build_bvh_generic(instances, get_instance_bbox_and_center, v_arr_len(instances), pool);
+}
+
+// Refits a copy of a BVH to the current bounds of its primitives. Returns NULL if it needs a rebuild instead.
+static struct bvh *refit_bvh_generic(
+	const struct bvh *bvh,
+	const void *user_data,
+	void (*get_bbox_and_center)(const void *, unsigned, struct boundingBox *, struct vector *),
+	size_t count)
+{
+	if (!bvh || !count || count != bvh->prim_count)
+		return NULL;
+
+	struct boundingBox *bboxes = malloc(sizeof(struct boundingBox) * count);
+	for (size_t i = 0; i < count; ++i) {
+		struct vector center;
+		get_bbox_and_center(user_data, i, &bboxes[i], &center);
+	}
+
+	struct bvh *new = malloc(sizeof(struct bvh));
+	*new = (struct bvh){
+		.nodes = malloc(sizeof(struct bvh_node) * bvh->node_count),
+		.prim_indices = malloc(sizeof(size_t) * count),
+		.node_count = bvh->node_count,
+		.prim_count = count,
+		.build_cost = bvh->build_cost,
+	};
+	memcpy(new->prim_indices, bvh->prim_indices, sizeof(size_t) * count);
+
+	// Children are always stored after their parent, so walking the nodes
+	// backwards refits both children before the node that contains them.
+	for (size_t i = bvh->node_count; i-- > 0;) {
+		struct bvh_node *node = &new->nodes[i];
+		node->index = bvh->nodes[i].index;
+		const size_t first = node->index.first_child_or_prim;
+		struct boundingBox bbox;
+		if (node->index.prim_count > 0) {
+			bbox = compute_bbox(bboxes, new->prim_indices, first, first + node->index.prim_count);
+		} else {
+			bbox = load_bbox_from_node(&new->nodes[first + 0]);
+			const struct boundingBox right_bbox = load_bbox_from_node(&new->nodes[first + 1]);
+			extendBBox(&bbox, &right_bbox);
+		}
+		store_bbox_to_node(node, &bbox);
+	}
+	free(bboxes);
+
+	// Primitives that moved far from where the tree was built for leave nodes overlapping
+	// a lot. Past some point, a rebuild pays for itself in faster traversal.
+	if (bvh_sah_cost(new) > bvh->build_cost * MAX_REFIT_COST) {
+		destroy_bvh(new);
+		return NULL;
+	}
+	collapse_bvh(new);
+	return new;
+}
+
+struct bvh *refit_mesh_bvh(const struct bvh *bvh, const struct mesh *mesh) {
+	return refit_bvh_generic(bvh, mesh, get_poly_bbox_and_center, v_arr_len(mesh->polygons));
+}
+
+struct bvh *refit_top_level_bvh(const struct bvh *bvh, const struct instance *instances) {
+	return refit_bvh_generic(bvh, instances, get_instance_bbox_and_center, v_arr_len(instances));
 }
 
 bool traverse_bottom_level_bvh(
@@ -662,7 +1629,7 @@ bool traverse_bottom_level_bvh(
 	sampler *sampler)
 {
 	(void)sampler;
-	return traverse_bvh_generic(mesh, mesh->bvh, intersect_bottom_level_leaf, ray, isect);
+	return traverse_bvh(mesh, mesh->bvh, intersect_bottom_level_leaf, ray, isect);
 }
 
 bool traverse_top_level_bvh(
@@ -672,15 +1639,77 @@ bool traverse_top_level_bvh(
 	struct hitRecord *isect,
 	sampler *sampler)
 {
-	return traverse_bvh_generic(
+	return traverse_bvh(
 		&(struct top_level_data) { instances, sampler },
 		bvh, intersect_top_level_leaf, ray, isect);
 }
 
+lane_mask traverse_bottom_level_bvh_packet(
+	const struct mesh *mesh,
+	const struct ray_packet *packet,
+	lane_mask active)
+{
+	return traverse_bvh_packet_generic(mesh, mesh->bvh, intersect_bottom_level_leaf_packet, packet, active);
+}
+
+lane_mask traverse_top_level_bvh_packet(
+	const struct instance *instances,
+	const struct bvh *bvh,
+	const struct ray_packet *packet,
+	lane_mask active)
+{
+	return traverse_bvh_packet_generic(instances, bvh, intersect_top_level_leaf_packet, packet, active);
+}
+
+size_t bvh_node_size(void) {
+	return sizeof(struct bvh_node);
+}
+
+const void *bvh_nodes(const struct bvh *bvh, size_t *count) {
+	*count = bvh->node_count;
+	return bvh->nodes;
+}
+
+const size_t *bvh_prim_indices(const struct bvh *bvh) {
+	return bvh->prim_indices;
+}
+
+size_t bvh_wide_node_bytes(const struct bvh *bvh) {
+	return bvh->wide_node_count * sizeof(struct wide_bvh_node);
+}
+
+size_t bvh_bytes(const struct bvh *bvh) {
+	if (!bvh) return 0;
+	const size_t prim_bytes = bvh->node_count ? bvh->prim_count * sizeof(size_t) : 0;
+	return bvh->node_count * sizeof(struct bvh_node) + prim_bytes + bvh_wide_node_bytes(bvh);
+}
+
+size_t bvh_build_bytes(size_t count) {
+	// Centers, bounding boxes, primitive indices and the worst case node array of build_bvh_generic()
+	return count * (sizeof(struct vector) + sizeof(struct boundingBox) + sizeof(size_t) + 2 * sizeof(struct bvh_node));
+}
+
+struct bvh *bvh_wrap(const void *nodes, size_t node_count, const size_t *prim_indices, size_t prim_count) {
+	struct bvh *bvh = malloc(sizeof(struct bvh));
+	bvh->nodes = (struct bvh_node *)nodes;
+	bvh->prim_indices = (size_t *)prim_indices;
+	bvh->node_count = node_count;
+	bvh->prim_count = prim_count;
+	bvh->wide_nodes = NULL;
+	bvh->wide_node_count = 0;
+	bvh->borrowed = true;
+	bvh->build_cost = bvh_sah_cost(bvh);
+	collapse_bvh(bvh);
+	return bvh;
+}
+
 void destroy_bvh(struct bvh *bvh) {
 	if (!bvh) return;
-	if (bvh->nodes) free(bvh->nodes);
-	if (bvh->prim_indices) free(bvh->prim_indices);
+	if (!bvh->borrowed) {
+		if (bvh->nodes) free(bvh->nodes);
+		if (bvh->prim_indices) free(bvh->prim_indices);
+	}
+	if (bvh->wide_nodes) free(bvh->wide_nodes);
 	free(bvh);
 }
 
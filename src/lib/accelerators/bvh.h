@@ -10,9 +10,11 @@
 
 #include <renderer/samplers/sampler.h>
 #include <renderer/instance.h>
+#include <datatypes/lightray.h>
 
 #include <stdbool.h>
 #include <stddef.h>
+#include <v.h>
 
 struct lightRay;
 struct hitRecord;
@@ -32,12 +34,31 @@ struct boundingBox get_transformed_root_bbox(const struct bvh *bvh, const struct
 /// Builds a BVH for a given mesh
 /// @param mesh Mesh containing polygons to process
 /// @param count Amount of polygons given
-struct bvh *build_mesh_bvh(const struct mesh *mesh);
+/// @param pool Threads that help with large builds, can be shared by concurrent builds. It must
+/// not be the pool the caller runs in. NULL builds on the calling thread only.
+struct bvh *build_mesh_bvh(const struct mesh *mesh, v_threadpool *pool);
+
+/// Refits a copy of a mesh BVH to moved vertices, which is a lot cheaper than a rebuild
+/// when the polygons stay the same.
+/// @param bvh BVH built for this mesh, or refitted by this function
+/// @param mesh Mesh with the new vertex positions
+/// @return The refitted BVH, or NULL if the polygon count changed or the refitted tree would
+/// be too slow to traverse. Build a new one with build_mesh_bvh() in that case.
+struct bvh *refit_mesh_bvh(const struct bvh *bvh, const struct mesh *mesh);
 
 /// Builds a top-level BVH for a given set of instances
 /// @param instances Instances to build a top-level BVH for
 /// @param instanceCount Amount of instances
-struct bvh *build_top_level_bvh(const struct instance *instances);
+/// @param pool Threads that help with large builds, same as for build_mesh_bvh()
+struct bvh *build_top_level_bvh(const struct instance *instances, v_threadpool *pool);
+
+/// Refits a copy of a top-level BVH to the current bounds of the instances, which is a lot
+/// cheaper than a rebuild when only transforms have changed.
+/// @param bvh Top-level BVH built by build_top_level_bvh() or refitted by this function
+/// @param instances Same instances the BVH was built for
+/// @return The refitted BVH, or NULL if instances were added or the refitted tree would be too
+/// slow to traverse. Build a new one with build_top_level_bvh() in that case.
+struct bvh *refit_top_level_bvh(const struct bvh *bvh, const struct instance *instances);
 
 /// Intersect a ray with a scene top-level BVH
 bool traverse_top_level_bvh(
@@ -53,5 +74,42 @@ bool traverse_bottom_level_bvh(
 	struct hitRecord *isect,
 	sampler *sampler);
 
+/// Intersect the active lanes of a ray packet with a scene top-level BVH.
+/// Each lane behaves as if it was traced on its own with traverse_top_level_bvh().
+/// Returns the lanes that hit something.
+lane_mask traverse_top_level_bvh_packet(
+	const struct instance *instances,
+	const struct bvh *bvh,
+	const struct ray_packet *packet,
+	lane_mask active);
+
+lane_mask traverse_bottom_level_bvh_packet(
+	const struct mesh *mesh,
+	const struct ray_packet *packet,
+	lane_mask active);
+
+/// Size of a single BVH node, as laid out in the array returned by bvh_nodes()
+size_t bvh_node_size(void);
+
+/// Returns the node array of the given BVH, and stores the amount of nodes in count
+const void *bvh_nodes(const struct bvh *bvh, size_t *count);
+
+/// Returns the primitive index array of the given BVH. It has one entry per primitive.
+const size_t *bvh_prim_indices(const struct bvh *bvh);
+
+/// Size in bytes of the wide nodes collapsed from the BVH to trace single rays with SIMD.
+/// These are rebuilt on load, and aren't part of bvh_nodes().
+size_t bvh_wide_node_bytes(const struct bvh *bvh);
+
+/// Total size in bytes of the nodes, primitive indices and wide nodes of the given BVH
+size_t bvh_bytes(const struct bvh *bvh);
+
+/// Approximate peak memory use of a BVH build over count primitives, for memory stats
+size_t bvh_build_bytes(size_t count);
+
+/// Wraps node and primitive index arrays previously obtained from a BVH, without copying them.
+/// The arrays must outlive the returned BVH, destroy_bvh() won't free them.
+struct bvh *bvh_wrap(const void *nodes, size_t node_count, const size_t *prim_indices, size_t prim_count);
+
 /// Frees the memory allocated by the given BVH
 void destroy_bvh(struct bvh *);
@@ -31,6 +31,8 @@
 #include <protocol/server.h>
 #include <protocol/worker.h>
 #include <protocol/protocol.h>
+#include <protocol/baked.h>
+#include <renderer/stats.h>
 
 #ifdef CRAY_DEBUG_ENABLED
 #define DEBUG "D"
@@ -119,6 +121,14 @@ bool cr_renderer_set_num_pref(struct cr_renderer *ext, enum cr_renderer_param p,
 			r->prefs.blender_mode = num;
 			return true;
 		}
+		case cr_renderer_adaptive_min_samples: {
+			r->prefs.adaptive_min_samples = num;
+			return true;
+		}
+		case cr_renderer_time_limit_ms: {
+			r->prefs.time_limit_ms = num;
+			return true;
+		}
 		default: return false;
 	}
 	return false;
@@ -153,6 +163,11 @@ bool cr_renderer_set_str_pref(struct cr_renderer *ext, enum cr_renderer_param p,
 			r->prefs.node_list = stringCopy(str);
 			return true;
 		}
+		case cr_renderer_adaptive_threshold: {
+			float threshold = str ? strtof(str, NULL) : 0.0f;
+			r->prefs.adaptive_threshold = threshold > 0.0f ? threshold : 0.0f;
+			return true;
+		}
 		default: return false;
 	}
 	return false;
@@ -183,6 +198,10 @@ const char *cr_renderer_get_str_pref(struct cr_renderer *ext, enum cr_renderer_p
 	struct renderer *r = (struct renderer *)ext;
 	switch (p) {
 		case cr_renderer_asset_path: return r->scene->asset_path;
+		case cr_renderer_adaptive_threshold: {
+			snprintf(r->pref_str, sizeof(r->pref_str), "%g", (double)r->prefs.adaptive_threshold);
+			return r->pref_str;
+		}
 		default: return NULL;
 	}
 	return NULL;
@@ -199,6 +218,9 @@ uint64_t cr_renderer_get_num_pref(struct cr_renderer *ext, enum cr_renderer_para
 		case cr_renderer_tile_height: return r->prefs.tileHeight;
 		case cr_renderer_override_width: return r->prefs.override_width;
 		case cr_renderer_override_height: return r->prefs.override_height;
+		case cr_renderer_override_cam: return r->prefs.selected_camera;
+		case cr_renderer_adaptive_min_samples: return r->prefs.adaptive_min_samples;
+		case cr_renderer_time_limit_ms: return r->prefs.time_limit_ms;
 		default: return 0; // TODO
 	}
 	return 0;
@@ -251,9 +273,14 @@ struct bvh_build_task_arg {
 void bvh_build_task(void *arg) {
 	// Mesh array may get realloc'd at any time, so we use a copy of mesh while working
 	struct bvh_build_task_arg *bt = (struct bvh_build_task_arg *)arg;
+	struct stats *stats = bt->scene->stats;
+	const int64_t scratch = bvh_build_bytes(v_arr_len(bt->mesh.polygons));
+	stats_add_memory(stats, cr_mem_bvh, 0, scratch);
 	v_timer timer = v_timer_start();
-	struct bvh *bvh = build_mesh_bvh(&bt->mesh);
-	long ms = v_timer_get_ms(timer);
+	struct bvh *bvh = build_mesh_bvh(&bt->mesh, bt->scene->bvh_builder);
+	long us = v_timer_get_us(timer);
+	long ms = us / 1000;
+	stats_add_memory(stats, cr_mem_bvh, bvh_bytes(bvh), -scratch);
 	if (!bvh) {
 		logr(debug, "BVH build FAILED for %s\n", bt->mesh.name);
 		free(bt);
@@ -266,6 +293,8 @@ void bvh_build_task(void *arg) {
 	v_rwlock_unlock(bt->scene->bvh_lock);
 	//!//!//!//!//!//!//!//!//!//!//!//!
 	logr(debug, "BVH %s for %s (%lums)\n", old_bvh ? "updated" : "built", bt->mesh.name, ms);
+	stats_add_timing(stats, cr_phase_bvh_build, bt->mesh.name, us);
+	stats_add_memory(stats, cr_mem_bvh, -(int64_t)bvh_bytes(old_bvh), 0);
 	destroy_bvh(old_bvh);
 	free(bt);
 }
@@ -276,6 +305,17 @@ void cr_mesh_bind_vertex_buf(struct cr_scene *s_ext, cr_mesh mesh, struct cr_ver
 	if ((size_t)mesh > v_arr_len(scene->meshes) - 1) return;
 	struct mesh *m = &scene->meshes[mesh];
 	struct vertex_buffer new = { 0 };
+	if (buf.borrow) {
+		new.borrowed = true;
+		new.vertices = (struct vector *)buf.vertices;
+		new.vertex_count = buf.vertices ? buf.vertex_count : 0;
+		new.normals = (struct vector *)buf.normals;
+		new.normal_count = buf.normals ? buf.normal_count : 0;
+		new.texture_coords = (struct coord *)buf.tex_coords;
+		new.texture_coord_count = buf.tex_coords ? buf.tex_coord_count : 0;
+		m->vbuf = new;
+		return;
+	}
 	if (buf.vertices && buf.vertex_count)
 		v_arr_add_n(new.vertices, buf.vertices, buf.vertex_count);
 	if (buf.normals && buf.normal_count)
@@ -283,6 +323,7 @@ void cr_mesh_bind_vertex_buf(struct cr_scene *s_ext, cr_mesh mesh, struct cr_ver
 	if (buf.tex_coords && buf.tex_coord_count)
 		v_arr_add_n(new.texture_coords, buf.tex_coords, buf.tex_coord_count);
 	m->vbuf = new;
+	stats_add_memory(scene->stats, cr_mem_geometry, vbuf_bytes(&new), 0);
 }
 
 void cr_mesh_bind_faces(struct cr_scene *s_ext, cr_mesh mesh, struct cr_face *faces, size_t face_count) {
@@ -291,6 +332,27 @@ void cr_mesh_bind_faces(struct cr_scene *s_ext, cr_mesh mesh, struct cr_face *fa
 	if ((size_t)mesh > v_arr_len(scene->meshes) - 1) return;
 	struct mesh *m = &scene->meshes[mesh];
 	v_arr_add_n(m->polygons, faces, face_count);
+	stats_add_memory(scene->stats, cr_mem_geometry, face_count * sizeof(*m->polygons), 0);
+}
+
+void cr_mesh_bind_face_indices(struct cr_scene *s_ext, cr_mesh mesh, struct cr_face_index_param p) {
+	if (!s_ext || !p.vertex_idx || !p.face_count) return;
+	struct world *scene = (struct world *)s_ext;
+	if ((size_t)mesh > v_arr_len(scene->meshes) - 1) return;
+	struct mesh *m = &scene->meshes[mesh];
+	for (size_t i = 0; i < p.face_count; ++i) {
+		struct poly poly = { 0 };
+		for (size_t j = 0; j < MAX_CRAY_VERTEX_COUNT; ++j) {
+			const size_t idx = i * MAX_CRAY_VERTEX_COUNT + j;
+			poly.vertexIndex[j] = p.vertex_idx[idx];
+			poly.normalIndex[j] = p.normal_idx ? p.normal_idx[idx] : -1;
+			poly.textureIndex[j] = p.texture_idx ? p.texture_idx[idx] : -1;
+		}
+		poly.materialIndex = p.mat_idx ? p.mat_idx[i] : 0;
+		poly.hasNormals = !!p.normal_idx;
+		v_arr_add(m->polygons, poly);
+	}
+	stats_add_memory(scene->stats, cr_mem_geometry, p.face_count * sizeof(*m->polygons), 0);
 }
 
 void cr_mesh_finalize(struct cr_scene *s_ext, cr_mesh mesh) {
@@ -305,6 +367,71 @@ void cr_mesh_finalize(struct cr_scene *s_ext, cr_mesh mesh) {
 	v_threadpool_enqueue(scene->bg_worker, bvh_build_task, arg);
 }
 
+// Borrowed arrays belong to the API caller or a baked scene, take copies before modifying them
+static void vertex_buf_make_owned(struct vertex_buffer *buf) {
+	if (!buf->borrowed) return;
+	struct vertex_buffer owned = { 0 };
+	if (buf->vertices && buf->vertex_count)
+		v_arr_add_n(owned.vertices, buf->vertices, buf->vertex_count);
+	if (buf->normals && buf->normal_count)
+		v_arr_add_n(owned.normals, buf->normals, buf->normal_count);
+	if (buf->texture_coords && buf->texture_coord_count)
+		v_arr_add_n(owned.texture_coords, buf->texture_coords, buf->texture_coord_count);
+	*buf = owned;
+}
+
+bool cr_mesh_update_vertices(struct cr_scene *s_ext, cr_mesh mesh, const struct cr_vector *vertices, size_t vertex_count, const struct cr_vector *normals, size_t normal_count) {
+	if (!s_ext || !vertices) return false;
+	struct world *scene = (struct world *)s_ext;
+	if ((size_t)mesh > v_arr_len(scene->meshes) - 1) return false;
+	// A BVH build for this mesh may still be reading the current vertices
+	v_threadpool_wait(scene->bg_worker);
+	struct mesh *m = &scene->meshes[mesh];
+	if (vertex_count != vbuf_vertex_count(&m->vbuf)) return false;
+	if (normals && normal_count != vbuf_normal_count(&m->vbuf)) return false;
+
+	// Render threads may still be tracing this mesh, so refit or rebuild against the new
+	// vertices first, and then swap both in at once.
+	struct mesh updated = *m;
+	updated.vbuf.vertices = (struct vector *)vertices;
+	v_timer timer = v_timer_start();
+	struct bvh *bvh = m->bvh ? refit_mesh_bvh(m->bvh, &updated) : NULL;
+	const bool refitted = bvh;
+	if (!bvh) {
+		// Polygons moved too far for the old tree to be any good
+		if (m->bvh) logr(debug, "BVH refit rejected for %s, rebuilding\n", m->name);
+		const int64_t scratch = bvh_build_bytes(v_arr_len(m->polygons));
+		stats_add_memory(scene->stats, cr_mem_bvh, 0, scratch);
+		bvh = build_mesh_bvh(&updated, scene->bvh_builder);
+		stats_add_memory(scene->stats, cr_mem_bvh, 0, -scratch);
+	}
+	long us = v_timer_get_us(timer);
+	if (!bvh) {
+		logr(debug, "BVH build FAILED for %s\n", m->name);
+		return false;
+	}
+
+	//!//!//!//!//!//!//!//!//!//!//!//!
+	v_rwlock_write_lock(scene->bvh_lock);
+	if (m->vbuf.borrowed)
+		stats_add_memory(scene->stats, cr_mem_geometry, vbuf_bytes(&m->vbuf), 0);
+	vertex_buf_make_owned(&m->vbuf);
+	memcpy(m->vbuf.vertices, vertices, sizeof(*m->vbuf.vertices) * vertex_count);
+	if (normals && normal_count)
+		memcpy(m->vbuf.normals, normals, sizeof(*m->vbuf.normals) * normal_count);
+	struct bvh *old_bvh = m->bvh;
+	m->bvh = bvh;
+	v_rwlock_unlock(scene->bvh_lock);
+	//!//!//!//!//!//!//!//!//!//!//!//!
+	scene->top_level_dirty = true;
+
+	logr(debug, "BVH %s for %s (%lums)\n", refitted ? "refitted" : "rebuilt", m->name, us / 1000);
+	stats_add_timing(scene->stats, cr_phase_bvh_build, m->name, us);
+	stats_add_memory(scene->stats, cr_mem_bvh, bvh_bytes(bvh) - (int64_t)bvh_bytes(old_bvh), 0);
+	destroy_bvh(old_bvh);
+	return true;
+}
+
 cr_mesh cr_scene_mesh_new(struct cr_scene *s_ext, const char *name) {
 	if (!s_ext) return -1;
 	struct world *scene = (struct world *)s_ext;
@@ -328,7 +455,11 @@ cr_mesh cr_scene_get_mesh(struct cr_scene *s_ext, const char *name) {
 }
 
 cr_instance cr_instance_new(struct cr_scene *s_ext, cr_object object, enum cr_object_type type) {
-	if (!s_ext) return -1;
+	return cr_instance_new_n(s_ext, object, type, 1);
+}
+
+cr_instance cr_instance_new_n(struct cr_scene *s_ext, cr_object object, enum cr_object_type type, size_t count) {
+	if (!s_ext || !count) return -1;
 	struct world *scene = (struct world *)s_ext;
 	struct instance new;
 	switch (type) {
@@ -342,7 +473,10 @@ cr_instance cr_instance_new(struct cr_scene *s_ext, cr_object object, enum cr_ob
 			return -1;
 	}
 	scene->top_level_dirty = true;
-	return v_arr_add(scene->instances, new);
+	cr_instance first = v_arr_add(scene->instances, new);
+	for (size_t i = 1; i < count; ++i)
+		v_arr_add(scene->instances, new);
+	return first;
 }
 
 static inline struct matrix4x4 mtx_convert(float row_major[4][4]) {
@@ -356,18 +490,36 @@ static inline struct matrix4x4 mtx_convert(float row_major[4][4]) {
 	};
 }
 
-void cr_instance_set_transform(struct cr_scene *s_ext, cr_instance instance, float row_major[4][4]) {
-	if (!s_ext) return;
-	struct world *scene = (struct world *)s_ext;
-	if ((size_t)instance > v_arr_len(scene->instances) - 1) return;
-	struct instance *i = &scene->instances[instance];
+static bool instance_set_transform(struct instance *i, float row_major[4][4]) {
 	struct matrix4x4 mtx = mtx_convert(row_major);
-	if (memcmp(&i->composite, &mtx, sizeof(mtx)) == 0) return;
+	if (memcmp(&i->composite, &mtx, sizeof(mtx)) == 0) return false;
 	i->composite = (struct transform){
 		.A = mtx,
 		.Ainv = mat_invert(mtx)
 	};
-	scene->top_level_dirty = true;
+	return true;
+}
+
+void cr_instance_set_transform(struct cr_scene *s_ext, cr_instance instance, float row_major[4][4]) {
+	if (!s_ext) return;
+	struct world *scene = (struct world *)s_ext;
+	if ((size_t)instance > v_arr_len(scene->instances) - 1) return;
+	if (instance_set_transform(&scene->instances[instance], row_major))
+		scene->top_level_dirty = true;
+}
+
+size_t cr_instance_set_transforms(struct cr_scene *s_ext, const cr_instance *instances, float (*row_major)[4][4], size_t count) {
+	if (!s_ext || !instances || !row_major) return 0;
+	struct world *scene = (struct world *)s_ext;
+	const size_t instance_count = v_arr_len(scene->instances);
+	size_t changed = 0;
+	for (size_t i = 0; i < count; ++i) {
+		if (instances[i] < 0 || (size_t)instances[i] >= instance_count) continue;
+		changed += instance_set_transform(&scene->instances[instances[i]], row_major[i]);
+	}
+	// Flag once, so the top-level BVH only gets rebuilt once for the whole batch
+	if (changed) scene->top_level_dirty = true;
+	return changed;
 }
 
 void cr_instance_transform(struct cr_scene *s_ext, cr_instance instance, float row_major[4][4]) {
@@ -545,6 +697,23 @@ bool cr_camera_update(struct cr_scene *ext, cr_camera c) {
 	return true;
 }
 
+bool cr_camera_set_pose(struct cr_scene *ext, cr_camera c, struct cr_camera_pose_param p) {
+	if (c < 0 || !ext) return false;
+	struct world *scene = (struct world *)ext;
+	if ((size_t)c > v_arr_len(scene->cameras) - 1) return false;
+	struct camera *cam = &scene->cameras[c];
+	cam->position = (struct vector){ p.position.x, p.position.y, p.position.z };
+	cam->orientation.roll = p.roll;
+	cam->orientation.pitch = p.pitch;
+	cam->orientation.yaw = p.yaw;
+	if (p.fov > 0.0) cam->FOV = p.fov;
+	if (p.res_x) cam->width = p.res_x;
+	if (p.res_y) cam->height = p.res_y;
+	cam_update_pose(cam, &cam->orientation, &cam->position);
+	cam_recompute_optics(cam);
+	return true;
+}
+
 bool cr_camera_remove(struct cr_scene *s, cr_camera c) {
 	//TODO
 	(void)s;
@@ -876,6 +1045,8 @@ void cr_renderer_restart_interactive(struct cr_renderer *ext) {
 	r->state.finishedPasses = 1;
 	v_mutex_lock(r->state.current_set->tile_mutex);
 	tex_clear(r->state.result_buf);
+	snapshots_reset(r->state.snapshots, r->state.result_buf->width, r->state.result_buf->height, r->state.current_set->tiles);
+	tile_dirty_reset(r->state.dirty_tiles, r->state.current_set->tiles);
 	r->state.current_set->finished = 0;
 	for (size_t i = 0; i < r->prefs.threads; ++i) {
 		// FIXME: Use array for workers
@@ -895,6 +1066,37 @@ struct cr_bitmap *cr_renderer_get_result(struct cr_renderer *ext) {
 	return (struct cr_bitmap *)r->state.result_buf;
 }
 
+const struct cr_bitmap *cr_renderer_acquire_pass(struct cr_renderer *ext, size_t after_pass, long timeout_ms, size_t *pass) {
+	if (!ext) return NULL;
+	struct renderer *r = (struct renderer *)ext;
+	if (!r->prefs.interactive) return NULL;
+	return (const struct cr_bitmap *)snapshots_acquire(r->state.snapshots, after_pass, timeout_ms, pass);
+}
+
+size_t cr_renderer_get_dirty_tiles(struct cr_renderer *ext, struct cr_tile *out, size_t max) {
+	if (!ext || !out || !max) return 0;
+	struct renderer *r = (struct renderer *)ext;
+	struct render_tile *tiles = calloc(max, sizeof(*tiles));
+	size_t count = tile_dirty_collect(r->state.dirty_tiles, tiles, max);
+	for (size_t i = 0; i < count; ++i) {
+		out[i] = (struct cr_tile){
+			.w = tiles[i].width,
+			.h = tiles[i].height,
+			.start_x = tiles[i].begin.x,
+			.start_y = tiles[i].begin.y,
+			.end_x = tiles[i].end.x,
+			.end_y = tiles[i].end.y,
+			.state = (enum cr_tile_state)tiles[i].state,
+			.network_renderer = tiles[i].network_renderer,
+			.index = tiles[i].index,
+			.total_samples = tiles[i].total_samples,
+			.completed_samples = tiles[i].completed_samples,
+		};
+	}
+	free(tiles);
+	return count;
+}
+
 void cr_start_render_worker(int port, size_t thread_limit) {
 	worker_start(port, thread_limit);
 }
@@ -910,11 +1112,41 @@ bool cr_load_json(struct cr_renderer *r_ext, const char *file_path) {
 	char *asset_path = get_file_path(file_path);
 	cr_renderer_set_str_pref(r_ext, cr_renderer_asset_path, asset_path);
 	free(asset_path);
+	v_timer timer = v_timer_start();
 	cJSON *input = cJSON_ParseWithLength((const char *)input_bytes, v_arr_len(input_bytes));
-	if (parse_json(r_ext, input) < 0) {
-		return false;
-	}
-	return true;
+	cr_renderer_add_timing(r_ext, cr_phase_json_parse, file_path, v_timer_get_us(timer));
+	v_arr_free(input_bytes);
+	int ret = parse_json(r_ext, input);
+	cJSON_Delete(input);
+	return ret >= 0;
+}
+
+struct cr_renderer_stats cr_renderer_get_stats(struct cr_renderer *ext) {
+	if (!ext) return (struct cr_renderer_stats){ 0 };
+	struct renderer *r = (struct renderer *)ext;
+	return stats_get(r->scene->stats);
+}
+
+void cr_renderer_add_timing(struct cr_renderer *ext, enum cr_phase phase, const char *name, uint64_t us) {
+	if (!ext) return;
+	struct renderer *r = (struct renderer *)ext;
+	stats_add_timing(r->scene->stats, phase, name, us);
+}
+
+void cr_renderer_add_scratch_memory(struct cr_renderer *ext, enum cr_mem_category category, int64_t bytes) {
+	if (!ext || category >= cr_mem_category_count) return;
+	struct renderer *r = (struct renderer *)ext;
+	stats_add_memory(r->scene->stats, category, 0, bytes);
+}
+
+bool cr_write_baked(struct cr_renderer *r_ext, const char *file_path) {
+	if (!r_ext || !file_path) return false;
+	return baked_write((struct renderer *)r_ext, file_path);
+}
+
+bool cr_load_baked(struct cr_renderer *r_ext, const char *file_path) {
+	if (!r_ext || !file_path) return false;
+	return baked_load((struct renderer *)r_ext, file_path);
 }
 
 void cr_log_level_set(enum cr_log_level level) {
@@ -28,6 +28,40 @@ struct lightRay {
 	enum ray_type type : 8;
 };
 
+// Camera rays are traced in packets of RAY_PACKET_DIM x RAY_PACKET_DIM pixels. Neighboring
+// camera rays visit mostly the same BVH nodes, so the packet shares those node visits.
+#define RAY_PACKET_DIM 4
+#define RAY_PACKET_SIZE (RAY_PACKET_DIM * RAY_PACKET_DIM)
+
+struct hitRecord;
+struct sampler;
+
+// Lane i of a packet is bit (1 << i) of a lane mask
+typedef uint32_t lane_mask;
+
+struct ray_packet {
+	struct lightRay rays[RAY_PACKET_SIZE];
+	struct hitRecord *isects[RAY_PACKET_SIZE];
+	struct sampler *samplers[RAY_PACKET_SIZE];
+	size_t count;
+};
+
+static inline lane_mask lane_bit(size_t lane) {
+	return (lane_mask)1 << lane;
+}
+
+static inline size_t lane_count(lane_mask mask) {
+	size_t count = 0;
+	for (; mask; mask &= mask - 1)
+		count++;
+	return count;
+}
+
+// Mask with the first count lanes set
+static inline lane_mask lanes_first(size_t count) {
+	return count >= sizeof(lane_mask) * 8 ? ~(lane_mask)0 : lane_bit(count) - 1;
+}
+
 static inline struct vector alongRay(const struct lightRay *ray, float t) {
 	return vec_add(ray->start, vec_scale(ray->direction, t));
 }
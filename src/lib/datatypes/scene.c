@@ -16,6 +16,8 @@
 #include <common/textbuffer.h>
 #include <common/node_parse.h>
 #include <common/texture.h>
+#include <protocol/baked.h>
+#include <renderer/stats.h>
 #include "camera.h"
 #include "mesh.h"
 
@@ -31,11 +33,18 @@ struct world *scene_new(void) {
 	s->storage.node_table = newHashtable(compareNodes, &s->storage.node_pool);
 	s->bvh_lock = v_rwlock_create();
 	s->bg_worker = v_threadpool_create(v_sys_get_cores());
+	s->bvh_builder = v_threadpool_create(v_sys_get_cores());
+	s->stats = stats_new();
 	return s;
 }
 
 void scene_destroy(struct world *scene) {
 	if (scene) {
+		// Let BVH builds and texture decodes finish first, they write into the meshes and textures.
+		// Builds can leave idle helper tasks in the build pool, so that gets drained too.
+		v_threadpool_wait(scene->bg_worker);
+		v_threadpool_wait(scene->bvh_builder);
+
 		// FIXME: elem_free
 		// scene->textures.elem_free = tex_asset_free;
 		for (size_t i = 0; i < v_arr_len(scene->textures); ++i)
@@ -53,6 +62,7 @@ void scene_destroy(struct world *scene) {
 		v_rwlock_unlock(scene->bvh_lock);
 
 		v_threadpool_destroy(scene->bg_worker);
+		v_threadpool_destroy(scene->bvh_builder);
 		v_rwlock_destroy(scene->bvh_lock);
 
 		destroyHashtable(scene->storage.node_table);
@@ -70,6 +80,8 @@ void scene_destroy(struct world *scene) {
 		v_arr_free(scene->instances);
 		v_arr_free(scene->spheres);
 		if (scene->asset_path) free(scene->asset_path);
+		baked_unmap(scene->baked);
+		stats_destroy(scene->stats);
 		free(scene);
 	}
 }
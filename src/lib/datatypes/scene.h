@@ -18,6 +18,8 @@
 struct renderer;
 struct hashtable;
 struct file_cache;
+struct baked_map;
+struct stats;
 
 struct node_storage {
 	// Scene asset memory pool, currently used for nodes only.
@@ -41,6 +43,8 @@ struct world {
 	struct bvh *topLevel; // FIXME: Move to state?
 	bool top_level_dirty;
 	v_threadpool *bg_worker;
+	// Helps with large BVH builds. Separate from bg_worker, since mesh builds run there
+	v_threadpool *bvh_builder;
 
 	struct sphere *spheres;
 	struct camera *cameras;
@@ -51,6 +55,12 @@ struct world {
 	bool use_blender_coordinates;
 
 	char *asset_path;
+
+	// Meshes and textures of a baked scene point into this, see baked.h
+	struct baked_map *baked;
+
+	struct stats *stats; // FIXME: Move to state? BVH build tasks only see the scene
+
 };
 
 struct world *scene_new(void);
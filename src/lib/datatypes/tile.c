@@ -16,35 +16,99 @@
 #include <vendored/pcg_basic.h>
 #include <string.h>
 
+// How many times tile_split_tail() quarters the tail of the queue
+#define TILE_SPLIT_LEVELS 2
+
+#ifdef WINDOWS
+#define fetch_increment(p) ((size_t)InterlockedIncrement64((volatile LONG64 *)(p)) - 1)
+#define load_relaxed(p) ((size_t)InterlockedCompareExchange64((volatile LONG64 *)(p), 0, 0))
+#define state_load(p) ((enum tile_state)InterlockedCompareExchange((volatile LONG *)(p), 0, 0))
+#define state_publish(p, v) InterlockedExchange((volatile LONG *)(p), (LONG)(v))
+#else
+#define fetch_increment(p) __atomic_fetch_add((p), 1, __ATOMIC_RELAXED)
+#define load_relaxed(p) __atomic_load_n((p), __ATOMIC_RELAXED)
+#define state_load(p) __atomic_load_n((p), __ATOMIC_ACQUIRE)
+#define state_publish(p, v) __atomic_store_n((p), (v), __ATOMIC_RELEASE)
+#endif
+
 static void tiles_reorder(struct render_tile **tiles, enum render_order tileOrder);
 
+static struct render_tile *tile_claim(struct tile_set *set, bool network) {
+	// The tile array doesn't change while threads are rendering, so claiming an index is all it takes
+	const size_t idx = fetch_increment(&set->finished);
+	if (idx < v_arr_len(set->tiles)) {
+		struct render_tile *tile = &set->tiles[idx];
+		tile->index = idx;
+		tile->workers = 1;
+		tile->network_renderer = network;
+		// tile_steal() only looks at rendering tiles, so the rest has to be in place before this
+		state_publish(&tile->state, rendering);
+		return tile;
+	}
+	struct render_tile *tile = NULL;
+	v_mutex_lock(set->tile_mutex);
+	// If a network worker disappeared during render, finish those tiles here at the end
+	for (size_t t = 0; t < v_arr_len(set->tiles); ++t) {
+		if (set->tiles[t].state == rendering && set->tiles[t].network_renderer) {
+			tile = &set->tiles[t];
+			tile->network_renderer = network;
+			tile->index = t;
+			tile->workers = 1;
+			break;
+		}
+	}
+	v_mutex_release(set->tile_mutex);
+	return tile;
+}
+
 struct render_tile *tile_next(struct tile_set *set) {
+	return tile_claim(set, false);
+}
+
+struct render_tile *tile_next_network(struct tile_set *set) {
+	return tile_claim(set, true);
+}
+
+struct render_tile *tile_steal(struct tile_set *set) {
 	struct render_tile *tile = NULL;
+	size_t most_left = 1;
 	v_mutex_lock(set->tile_mutex);
-	if (set->finished < v_arr_len(set->tiles)) {
-		tile = &set->tiles[set->finished];
-		tile->state = rendering;
-		tile->index = set->finished++;
-	} else {
-		// If a network worker disappeared during render, finish those tiles locally here at the end
-		for (size_t t = 0; t < v_arr_len(set->tiles); ++t) {
-			if (set->tiles[t].state == rendering && set->tiles[t].network_renderer) {
-				set->tiles[t].network_renderer = false;
-				tile = &set->tiles[t];
-				tile->state = rendering;
-				tile->index = t;
-				break;
-			}
+	for (size_t t = 0; t < v_arr_len(set->tiles); ++t) {
+		struct render_tile *candidate = &set->tiles[t];
+		// Network workers render their tiles in one go elsewhere
+		if (state_load(&candidate->state) != rendering || candidate->network_renderer) continue;
+		const size_t claimed = load_relaxed(&candidate->claimed_samples);
+		const size_t left = candidate->total_samples > claimed ? candidate->total_samples - claimed : 0;
+		if (left > most_left) {
+			most_left = left;
+			tile = candidate;
 		}
 	}
+	if (tile) tile->workers++;
 	v_mutex_release(set->tile_mutex);
 	return tile;
 }
 
+bool tile_claim_sample(struct render_tile *tile, size_t *sample) {
+	const size_t idx = fetch_increment(&tile->claimed_samples);
+	if (idx >= tile->total_samples) return false;
+	*sample = idx;
+	return true;
+}
+
+void tile_sample_done(struct render_tile *tile) {
+	fetch_increment(&tile->completed_samples);
+}
+
 struct render_tile *tile_next_interactive(struct renderer *r, struct tile_set *set) {
 	struct render_tile *tile = NULL;
 	v_mutex_lock(set->tile_mutex);
 	again:
+	// Time-limited renders stop handing out tiles at the deadline, threads finish the ones they have
+	if (renderer_time_is_up(r)) {
+		v_mutex_release(set->tile_mutex);
+		return NULL;
+	}
 	if (r->state.finishedPasses < r->prefs.sampleCount + 1) {
 		if (set->finished < v_arr_len(set->tiles)) {
 			tile = &set->tiles[set->finished];
@@ -64,7 +128,8 @@ struct render_tile *tile_next_interactive(struct renderer *r, struct tile_set *s
 	}
 	if (!tile) {
 		// FIXME: shared state to indicate pause instead of accessing worker state
-		if (r->state.s != r_rendering || r->state.workers[0].paused) {
+		// Unlike interactive renders, time-limited ones are done once all passes are.
+		if (r->state.s != r_rendering || r->state.workers[0].paused || !r->prefs.interactive) {
 			v_mutex_release(set->tile_mutex);
 			return NULL;
 		}
@@ -124,6 +189,99 @@ struct render_tile *tile_quantize(unsigned width, unsigned height, unsigned tile
 	return tiles;
 }
 
+// Append the quarters of tile to out. Tiles one pixel wide or tall are halved along the other axis.
+static void tile_split(struct render_tile **out, struct render_tile tile) {
+	const int xs[] = { tile.begin.x, tile.begin.x + tile.width / 2, tile.end.x };
+	const int ys[] = { tile.begin.y, tile.begin.y + tile.height / 2, tile.end.y };
+	for (int j = 0; j < 2; ++j) {
+		for (int i = 0; i < 2; ++i) {
+			if (xs[i] == xs[i + 1] || ys[j] == ys[j + 1]) continue;
+			struct render_tile sub = tile;
+			sub.begin = (struct intCoord){ xs[i], ys[j] };
+			sub.end = (struct intCoord){ xs[i + 1], ys[j + 1] };
+			sub.width = sub.end.x - sub.begin.x;
+			sub.height = sub.end.y - sub.begin.y;
+			v_arr_add(*out, sub);
+		}
+	}
+}
+
+// Split the last count tiles, leaving the ones before them alone
+static void split_last(struct render_tile **tiles, size_t count) {
+	const size_t len = v_arr_len(*tiles);
+	const size_t head = count < len ? len - count : 0;
+	struct render_tile *temp = { 0 };
+	v_arr_add_n(temp, *tiles, head);
+	for (size_t i = head; i < len; ++i)
+		tile_split(&temp, (*tiles)[i]);
+	v_arr_free((*tiles));
+	*tiles = temp;
+}
+
+void tile_split_tail(struct render_tile **tiles, size_t threads) {
+	if (!v_arr_len(*tiles) || !threads) return;
+	size_t len = v_arr_len(*tiles);
+	while (len < threads) {
+		split_last(tiles, len);
+		if (v_arr_len(*tiles) == len) break; // Down to single pixels
+		len = v_arr_len(*tiles);
+	}
+	for (size_t level = 0; level < TILE_SPLIT_LEVELS; ++level)
+		split_last(tiles, threads);
+	for (size_t i = 0; i < v_arr_len(*tiles); ++i)
+		(*tiles)[i].index = i;
+	logr(debug, "Split tile queue tail, %zu tiles in total\n", v_arr_len(*tiles));
+}
+
+struct tile_dirty_set *tile_dirty_new(void) {
+	struct tile_dirty_set *d = calloc(1, sizeof(*d));
+	d->lock = v_mutex_create();
+	return d;
+}
+
+void tile_dirty_destroy(struct tile_dirty_set *d) {
+	if (!d) return;
+	v_arr_free(d->tiles);
+	if (d->dirty) free(d->dirty);
+	v_mutex_destroy(d->lock);
+	free(d);
+}
+
+void tile_dirty_reset(struct tile_dirty_set *d, const struct render_tile *tiles) {
+	if (!d) return;
+	v_mutex_lock(d->lock);
+	v_arr_free(d->tiles);
+	if (d->dirty) free(d->dirty);
+	v_arr_add_n(d->tiles, tiles, v_arr_len(tiles));
+	d->dirty = malloc(v_arr_len(tiles) * sizeof(*d->dirty));
+	for (size_t i = 0; i < v_arr_len(d->tiles); ++i)
+		d->dirty[i] = true;
+	v_mutex_release(d->lock);
+}
+
+void tile_dirty_mark(struct tile_dirty_set *d, const struct render_tile *tile) {
+	if (!d || !tile) return;
+	v_mutex_lock(d->lock);
+	// Tiles from a previous tile set may still trickle in right after a reset
+	if ((size_t)tile->index < v_arr_len(d->tiles))
+		d->dirty[tile->index] = true;
+	v_mutex_release(d->lock);
+}
+
+size_t tile_dirty_collect(struct tile_dirty_set *d, struct render_tile *out, size_t max) {
+	if (!d) return 0;
+	size_t count = 0;
+	v_mutex_lock(d->lock);
+	for (size_t i = 0; i < v_arr_len(d->tiles) && count < max; ++i) {
+		if (!d->dirty[i]) continue;
+		d->dirty[i] = false;
+		out[count] = d->tiles[i];
+		out[count++].index = i;
+	}
+	v_mutex_release(d->lock);
+	return count;
+}
+
 void tile_set_free(struct tile_set *set) {
 	v_arr_free(set->tiles);
 	v_mutex_destroy(set->tile_mutex);
@@ -40,17 +40,62 @@ struct render_tile {
 	int index;
 	size_t total_samples;
 	size_t completed_samples;
+	size_t claimed_samples; // Handed out by tile_claim_sample(), can overshoot total_samples
+	size_t merged_samples; // Written out to the result buffer so far
+	size_t workers; // Threads rendering samples of this tile, more than one once it's stolen from
 };
 
 struct tile_set {
 	struct render_tile *tiles;
-	size_t finished;
-	struct v_mutex *tile_mutex;
+	size_t finished; // Tiles handed out so far. Can overshoot the tile count, tile_next() bumps it atomically.
+	struct v_mutex *tile_mutex; // Held by tile_next_interactive(), tile_steal(), whatever swaps out tiles and merges samples of stolen tiles
 };
 
 struct render_tile *tile_quantize(unsigned width, unsigned height, unsigned tile_w, unsigned tile_h, enum render_order order);
+
+// Split the last tiles in the queue into quarters, a few times over, so render threads
+// run out of work at about the same time instead of a few of them finishing big tiles
+// while the rest sit idle. Also splits everything until there are at least as many tiles
+// as threads, if the tiles are big enough for that.
+void tile_split_tail(struct render_tile **tiles, size_t threads);
 void tile_set_free(struct tile_set *set);
 
+// Lock-free, the mutex is only taken once all tiles have been handed out
 struct render_tile *tile_next(struct tile_set *set);
 
+// Same as tile_next(), but the tile is marked as rendered by a network worker before any
+// other thread can see it, so it's never stolen from.
+struct render_tile *tile_next_network(struct tile_set *set);
+
 struct render_tile *tile_next_interactive(struct renderer *r, struct tile_set *set);
+
+// Once tile_next() runs dry, join the in-flight tile with the most samples left to claim, so
+// threads don't sit idle while others finish their last tiles. Threads on the same tile claim
+// samples from it with tile_claim_sample(), and merge their sums into the result when done.
+// Returns NULL if no tile has enough samples left to be worth it.
+struct render_tile *tile_steal(struct tile_set *set);
+
+// Claim the next sample of a tile into sample. Returns false once all of them have been handed out.
+bool tile_claim_sample(struct render_tile *tile, size_t *sample);
+
+// Count a finished sample, safe with several threads on the same tile
+void tile_sample_done(struct render_tile *tile);
+
+// Tracks which tiles of the result buffer were written to since they were last collected,
+// so viewers can re-upload just those instead of the whole buffer.
+struct tile_dirty_set {
+	struct v_mutex *lock;
+	struct render_tile *tiles; // Copy of tile rects, indexed like tile->index
+	bool *dirty;
+};
+
+struct tile_dirty_set *tile_dirty_new(void);
+void tile_dirty_destroy(struct tile_dirty_set *d);
+
+// Start tracking a new set of tiles. They all start out dirty, since the result buffer was just cleared.
+void tile_dirty_reset(struct tile_dirty_set *d, const struct render_tile *tiles);
+void tile_dirty_mark(struct tile_dirty_set *d, const struct render_tile *tile);
+
+// Copy up to max dirty tiles into out and mark them clean. Returns the amount copied,
+// tiles that didn't fit are left dirty for the next call.
+size_t tile_dirty_collect(struct tile_dirty_set *d, struct render_tile *out, size_t max);
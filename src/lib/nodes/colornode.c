@@ -9,6 +9,7 @@
 #include <v.h>
 #include <renderer/samplers/sampler.h>
 #include <renderer/renderer.h>
+#include <renderer/stats.h>
 #include <common/color.h>
 #include <common/vector.h>
 #include <common/loaders/textureloader.h>
@@ -27,18 +28,23 @@ struct decode_task_arg {
 	char *path;
 	struct texture *out;
 	uint8_t options;
+	struct stats *stats;
 };
 
 void tex_decode_task(void *arg) {
 	struct decode_task_arg *dt = (struct decode_task_arg *)arg;
 	v_timer timer = v_timer_start();
 	file_data data = file_load(dt->path);
+	const int64_t file_bytes = v_arr_len(data);
+	stats_add_memory(dt->stats, cr_mem_textures, 0, file_bytes);
 	load_texture(dt->path, data, dt->out);
+	stats_add_memory(dt->stats, cr_mem_textures, tex_bytes(dt->out), 0);
 	long ms_decode = v_timer_get_ms(timer);
 	//Since the texture is probably srgb, transform it back to linear colorspace for rendering
 	if (dt->options & SRGB_TRANSFORM) tex_from_srgb(dt->out);
 	long ms_total = v_timer_get_ms(timer);
 	v_arr_free(data);
+	stats_add_memory(dt->stats, cr_mem_textures, 0, -file_bytes);
 	char buf[3][64];
 	logr(debug, "Async decode of '%s' took %s (%s dec, %s sRGB)\n",
 		dt->path,
@@ -87,7 +93,8 @@ const struct colorNode *build_color_node(struct cr_scene *s_ext, const struct cr
 				*arg = (struct decode_task_arg){
 					.path = stringCopy(path),
 					.out = tex,
-					.options = desc->arg.image.options
+					.options = desc->arg.image.options,
+					.stats = scene->stats,
 				};
 				v_threadpool_enqueue(scene->bg_worker, tex_decode_task, arg);
 			}
@@ -0,0 +1,185 @@
+//
+//  baked.c
+//  c-ray
+//
+//  Created by agent on 18/10/2026.
+//  Copyright © 2026 agent. All rights reserved.
+//
+
+#include "../../includes.h"
+#include "baked.h"
+#include "protocol.h"
+
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <common/logging.h>
+
+#ifndef WINDOWS
+
+#include <errno.h>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#include <v.h>
+#include <renderer/renderer.h>
+#include <datatypes/scene.h>
+
+// Blobs are aligned to this, and the first page holds the header.
+#define BAKED_PAGE_SIZE 4096
+
+static const char baked_magic[8] = "CRBAKED";
+
+struct baked_header {
+	char magic[8];
+	uint32_t version;
+	uint32_t page_size;
+	uint64_t desc_offset; // Scene description JSON, after all the blobs
+	uint64_t desc_bytes;
+};
+
+cJSON *baked_put(struct baked_writer *w, const void *data, size_t bytes) {
+	if (w->failed || !data || !bytes) return NULL;
+	size_t offset = (w->offset + BAKED_PAGE_SIZE - 1) & ~((size_t)BAKED_PAGE_SIZE - 1);
+	if (fseek(w->file, offset, SEEK_SET) || fwrite(data, 1, bytes, w->file) != bytes) {
+		w->failed = true;
+		return NULL;
+	}
+	w->offset = offset + bytes;
+	cJSON *ref = cJSON_CreateObject();
+	cJSON_AddNumberToObject(ref, "offset", offset);
+	cJSON_AddNumberToObject(ref, "bytes", bytes);
+	return ref;
+}
+
+const void *baked_get(const struct baked_map *m, const cJSON *ref, size_t *bytes) {
+	if (!m || !ref) return NULL;
+	const cJSON *offset = cJSON_GetObjectItem(ref, "offset");
+	const cJSON *size = cJSON_GetObjectItem(ref, "bytes");
+	if (!cJSON_IsNumber(offset) || !cJSON_IsNumber(size)) return NULL;
+	if (offset->valuedouble < 0 || size->valuedouble < 0) return NULL;
+	if (offset->valuedouble + size->valuedouble > (double)m->size) return NULL;
+	if (bytes) *bytes = size->valuedouble;
+	return m->base + (size_t)offset->valuedouble;
+}
+
+bool baked_write(struct renderer *r, const char *path) {
+	if (!r || !path) return false;
+	// Make sure textures are decoded and mesh BVHs are built
+	v_threadpool_wait(r->scene->bg_worker);
+	FILE *file = fopen(path, "wb");
+	if (!file) {
+		logr(warning, "Can't open '%s' for writing: %s\n", path, strerror(errno));
+		return false;
+	}
+	v_timer timer = v_timer_start();
+	struct baked_writer w = { .file = file, .offset = BAKED_PAGE_SIZE };
+	cJSON *desc = serialize_baked_renderer(r, &w);
+	char *data = cJSON_PrintUnformatted(desc);
+	cJSON_Delete(desc);
+	struct baked_header header = {
+		.version = BAKED_VERSION,
+		.page_size = BAKED_PAGE_SIZE,
+		.desc_offset = w.offset,
+		.desc_bytes = strlen(data),
+	};
+	memcpy(header.magic, baked_magic, sizeof(header.magic));
+	if (fseek(file, header.desc_offset, SEEK_SET) || fwrite(data, 1, header.desc_bytes, file) != header.desc_bytes)
+		w.failed = true;
+	if (fseek(file, 0, SEEK_SET) || fwrite(&header, sizeof(header), 1, file) != 1)
+		w.failed = true;
+	free(data);
+	if (fclose(file))
+		w.failed = true;
+	if (w.failed) {
+		logr(warning, "Failed to write baked scene to '%s'\n", path);
+		return false;
+	}
+	char buf[64];
+	logr(info, "Baked scene to %s in %s\n", path, ms_to_readable(v_timer_get_ms(timer), buf));
+	return true;
+}
+
+bool baked_load(struct renderer *r, const char *path) {
+	if (!r || !path) return false;
+	int fd = open(path, O_RDONLY);
+	if (fd < 0) {
+		logr(warning, "Can't open '%s': %s\n", path, strerror(errno));
+		return false;
+	}
+	struct stat st = { 0 };
+	if (fstat(fd, &st) < 0 || (size_t)st.st_size < sizeof(struct baked_header)) {
+		logr(warning, "'%s' is not a baked scene\n", path);
+		close(fd);
+		return false;
+	}
+	// Private and writable, so anything that modifies scene data in place just gets its own copy of those pages.
+	void *base = mmap(NULL, st.st_size, PROT_READ | PROT_WRITE, MAP_PRIVATE, fd, 0);
+	close(fd);
+	if (base == MAP_FAILED) {
+		logr(warning, "Couldn't mmap '%s': %s\n", path, strerror(errno));
+		return false;
+	}
+	struct baked_map *map = calloc(1, sizeof(*map));
+	*map = (struct baked_map){ .base = base, .size = st.st_size };
+
+	struct baked_header header;
+	memcpy(&header, base, sizeof(header));
+	if (memcmp(header.magic, baked_magic, sizeof(header.magic)) || header.version != BAKED_VERSION
+		|| header.desc_offset > map->size || header.desc_bytes > map->size - header.desc_offset) {
+		logr(warning, "'%s' is not a baked scene, or is from an incompatible version\n", path);
+		baked_unmap(map);
+		return false;
+	}
+	cJSON *desc = cJSON_ParseWithLength((const char *)map->base + header.desc_offset, header.desc_bytes);
+	if (!desc) {
+		logr(warning, "Baked scene '%s' is corrupt\n", path);
+		baked_unmap(map);
+		return false;
+	}
+	bool ret = deserialize_baked_renderer(r, desc, map);
+	cJSON_Delete(desc);
+	if (!ret) {
+		baked_unmap(map);
+		return false;
+	}
+	// Meshes and textures now point into the mapping, so the scene keeps it around
+	r->scene->baked = map;
+	return true;
+}
+
+void baked_unmap(struct baked_map *m) {
+	if (!m) return;
+	munmap(m->base, m->size);
+	free(m);
+}
+
+#else
+// Empty stubs for Windows
+cJSON *baked_put(struct baked_writer *w, const void *data, size_t bytes) {
+	(void)w; (void)data; (void)bytes;
+	return NULL;
+}
+
+const void *baked_get(const struct baked_map *m, const cJSON *ref, size_t *bytes) {
+	(void)m; (void)ref; (void)bytes;
+	return NULL;
+}
+
+bool baked_write(struct renderer *r, const char *path) {
+	(void)r; (void)path;
+	logr(warning, "Baked scenes are not supported on Windows yet\n");
+	return false;
+}
+
+bool baked_load(struct renderer *r, const char *path) {
+	(void)r; (void)path;
+	logr(warning, "Baked scenes are not supported on Windows yet\n");
+	return false;
+}
+
+void baked_unmap(struct baked_map *m) {
+	(void)m;
+}
+#endif
@@ -0,0 +1,49 @@
+//
+//  baked.h
+//  c-ray
+//
+//  Created by agent on 18/10/2026.
+//  Copyright © 2026 agent. All rights reserved.
+//
+
+#pragma once
+
+#include <common/vendored/cJSON.h>
+#include <stdbool.h>
+#include <stddef.h>
+#include <stdio.h>
+
+struct renderer;
+
+// A baked scene is the same scene description serialize_renderer() produces, except
+// that vertex buffers, polygons, mesh BVHs and decoded textures are written out as raw,
+// page-aligned blobs instead of base64 strings. Loading one mmap()s the file, and meshes
+// and textures point straight into the mapping. This skips OBJ parsing, texture decoding
+// and BVH builds entirely, and lets processes loading the same file share those pages.
+// Blobs are raw in-memory structs, so baked scenes are only portable between identical builds.
+
+#define BAKED_VERSION 1
+
+struct baked_writer {
+	FILE *file;
+	size_t offset;
+	bool failed;
+};
+
+struct baked_map {
+	unsigned char *base;
+	size_t size;
+};
+
+// Append a page-aligned blob, returns a reference to it to put in the scene description
+cJSON *baked_put(struct baked_writer *w, const void *data, size_t bytes);
+
+// Resolve a reference made by baked_put(). Returns NULL if it's out of bounds.
+const void *baked_get(const struct baked_map *m, const cJSON *ref, size_t *bytes);
+
+bool baked_write(struct renderer *r, const char *path);
+
+// Load a baked scene into r, which should have an empty scene.
+bool baked_load(struct renderer *r, const char *path);
+
+void baked_unmap(struct baked_map *m);
@@ -7,6 +7,7 @@
 //
 
 #include "protocol.h"
+#include "baked.h"
 #include <stdio.h>
 
 #ifndef WINDOWS
@@ -30,6 +31,7 @@
 #include <renderer/instance.h>
 #include <datatypes/tile.h>
 #include <datatypes/scene.h>
+#include <accelerators/bvh.h>
 #include <common/cr_assert.h>
 
 // Consumes given json, no need to free it after.
@@ -118,6 +120,40 @@ cJSON *serialize_texture(const struct texture *t) {
 	return json;
 }
 
+// Baked textures are kept as-is, including colorspace, so they don't need to be decoded again
+static cJSON *serialize_baked_texture(const struct texture *t, struct baked_writer *bake) {
+	if (!t) return NULL;
+	cJSON *json = cJSON_CreateObject();
+	cJSON_AddNumberToObject(json, "width", t->width);
+	cJSON_AddNumberToObject(json, "height", t->height);
+	cJSON_AddNumberToObject(json, "channels", t->channels);
+	cJSON_AddNumberToObject(json, "colorspace", t->colorspace);
+	cJSON_AddNumberToObject(json, "precision", t->precision);
+	size_t primSize = t->precision == char_p ? sizeof(char) : sizeof(float);
+	size_t bytes = t->width * t->height * t->channels * primSize;
+	cJSON_AddItemToObject(json, "data", baked_put(bake, t->data.byte_p, t->precision == none ? 0 : bytes));
+	return json;
+}
+
+static struct texture *deserialize_baked_texture(const cJSON *json, const struct baked_map *map) {
+	if (!json) return NULL;
+	struct texture *tex = calloc(1, sizeof(*tex));
+	tex->borrowed = true;
+	tex->width = cJSON_GetNumberValue(cJSON_GetObjectItem(json, "width"));
+	tex->height = cJSON_GetNumberValue(cJSON_GetObjectItem(json, "height"));
+	tex->channels = cJSON_GetNumberValue(cJSON_GetObjectItem(json, "channels"));
+	tex->colorspace = cJSON_GetNumberValue(cJSON_GetObjectItem(json, "colorspace"));
+	tex->precision = cJSON_GetNumberValue(cJSON_GetObjectItem(json, "precision"));
+	size_t bytes = 0;
+	tex->data.byte_p = (unsigned char *)baked_get(map, cJSON_GetObjectItem(json, "data"), &bytes);
+	size_t primSize = tex->precision == char_p ? sizeof(char) : sizeof(float);
+	if (tex->precision == none || !tex->data.byte_p || bytes != tex->width * tex->height * tex->channels * primSize) {
+		// Keep the slot, so image nodes referring to it don't try to load it from disk
+		*tex = (struct texture){ .precision = none, .borrowed = true };
+	}
+	return tex;
+}
+
 struct texture *deserialize_texture(const cJSON *json) {
 	if (!json) return NULL;
 	struct texture *tex = calloc(1, sizeof(*tex));
@@ -242,32 +278,56 @@ static struct euler_angles deserialize_euler_angles(const cJSON *in) {
 
 // We likely need to convert to network byte order before packing
 // TODO: These would benefit much from zlib and not having to b64
-static cJSON *serialize_vertex_buffer(const struct vertex_buffer in) {
+static cJSON *serialize_vertex_buffer(const struct vertex_buffer in, struct baked_writer *bake) {
 	cJSON *out = cJSON_CreateObject();
 
-	cJSON_AddNumberToObject(out, "vertex_count", v_arr_len(in.vertices));
-	if (v_arr_len(in.vertices)) {
-		char *data = b64encode(in.vertices, v_arr_len(in.vertices) * sizeof(*in.vertices));
+	if (bake) {
+		cJSON_AddNumberToObject(out, "vertex_count", vbuf_vertex_count(&in));
+		cJSON_AddItemToObject(out, "vertices", baked_put(bake, in.vertices, vbuf_vertex_count(&in) * sizeof(*in.vertices)));
+		cJSON_AddNumberToObject(out, "normal_count", vbuf_normal_count(&in));
+		cJSON_AddItemToObject(out, "normals", baked_put(bake, in.normals, vbuf_normal_count(&in) * sizeof(*in.normals)));
+		cJSON_AddNumberToObject(out, "texture_coord_count", vbuf_texture_coord_count(&in));
+		cJSON_AddItemToObject(out, "texture_coords", baked_put(bake, in.texture_coords, vbuf_texture_coord_count(&in) * sizeof(*in.texture_coords)));
+		return out;
+	}
+
+	cJSON_AddNumberToObject(out, "vertex_count", vbuf_vertex_count(&in));
+	if (vbuf_vertex_count(&in)) {
+		char *data = b64encode(in.vertices, vbuf_vertex_count(&in) * sizeof(*in.vertices));
 		cJSON_AddStringToObject(out, "vertices", data);
 		free(data);
 	}
 
-	cJSON_AddNumberToObject(out, "normal_count", v_arr_len(in.normals));
-	if (v_arr_len(in.normals)) {
-		char *data = b64encode(in.normals, v_arr_len(in.normals) * sizeof(*in.normals));
+	cJSON_AddNumberToObject(out, "normal_count", vbuf_normal_count(&in));
+	if (vbuf_normal_count(&in)) {
+		char *data = b64encode(in.normals, vbuf_normal_count(&in) * sizeof(*in.normals));
 		cJSON_AddStringToObject(out, "normals", data);
 		free(data);
 	}
 
-	cJSON_AddNumberToObject(out, "texture_coord_count", v_arr_len(in.texture_coords));
-	if (v_arr_len(in.texture_coords)) {
-		char *data = b64encode(in.texture_coords, v_arr_len(in.texture_coords) * sizeof(*in.texture_coords));
+	cJSON_AddNumberToObject(out, "texture_coord_count", vbuf_texture_coord_count(&in));
+	if (vbuf_texture_coord_count(&in)) {
+		char *data = b64encode(in.texture_coords, vbuf_texture_coord_count(&in) * sizeof(*in.texture_coords));
 		cJSON_AddStringToObject(out, "texture_coords", data);
 		free(data);
 	}
 	return out;
 }
 
+// Baked vertex buffers are borrowed straight from the mapping
+static struct vertex_buffer deserialize_baked_vertex_buffer(const cJSON *in, const struct baked_map *map) {
+	struct vertex_buffer out = { .borrowed = true };
+	if (!in) return out;
+	size_t bytes = 0;
+	out.vertices = (struct vector *)baked_get(map, cJSON_GetObjectItem(in, "vertices"), &bytes);
+	out.vertex_count = out.vertices ? bytes / sizeof(*out.vertices) : 0;
+	out.normals = (struct vector *)baked_get(map, cJSON_GetObjectItem(in, "normals"), &bytes);
+	out.normal_count = out.normals ? bytes / sizeof(*out.normals) : 0;
+	out.texture_coords = (struct coord *)baked_get(map, cJSON_GetObjectItem(in, "texture_coords"), &bytes);
+	out.texture_coord_count = out.texture_coords ? bytes / sizeof(*out.texture_coords) : 0;
+	return out;
+}
+
 static struct vertex_buffer deserialize_vertex_buffer(const cJSON *in) {
 	struct vertex_buffer out = { 0 };
 	if (!in) return out;
@@ -309,11 +369,16 @@ static struct vertex_buffer deserialize_vertex_buffer(const cJSON *in) {
 	return out;
 }
 
-static cJSON *serialize_faces(const struct poly *in) {
+static cJSON *serialize_faces(const struct poly *in, struct baked_writer *bake) {
 	if (!v_arr_len(in))
 		return NULL;
 	cJSON *out = cJSON_CreateObject();
 	size_t bytes = v_arr_len(in) * sizeof(*in);
+	if (bake) {
+		cJSON_AddItemToObject(out, "data", baked_put(bake, in, bytes));
+		cJSON_AddNumberToObject(out, "poly_count", v_arr_len(in));
+		return out;
+	}
 	char *encoded = b64encode(in, bytes);
 	cJSON_AddStringToObject(out, "data", encoded);
 	free(encoded);
@@ -321,6 +386,18 @@ static cJSON *serialize_faces(const struct poly *in) {
 	return out;
 }
 
+// Polygons get copied, since meshes own and append to them
+static struct poly *deserialize_baked_faces(const cJSON *in, const struct baked_map *map) {
+	struct poly *out = { 0 };
+	if (!in)
+		return out;
+	size_t bytes = 0;
+	const struct poly *polys = baked_get(map, cJSON_GetObjectItem(in, "data"), &bytes);
+	if (polys && bytes)
+		v_arr_add_n(out, polys, bytes / sizeof(*polys));
+	return out;
+}
+
 struct poly *deserialize_faces(const cJSON *in) {
 	struct poly *out = { 0 };
 	if (!in)
@@ -337,11 +414,48 @@ struct poly *deserialize_faces(const cJSON *in) {
 	return out;
 }
 
-static cJSON *serialize_mesh(const struct mesh in) {
+static cJSON *serialize_mesh_bvh(const struct mesh in, struct baked_writer *bake) {
+	size_t node_count = 0;
+	const void *nodes = bvh_nodes(in.bvh, &node_count);
+	if (!node_count) return NULL;
+	cJSON *out = cJSON_CreateObject();
+	cJSON_AddNumberToObject(out, "node_count", node_count);
+	cJSON_AddItemToObject(out, "nodes", baked_put(bake, nodes, node_count * bvh_node_size()));
+	cJSON_AddItemToObject(out, "prim_indices", baked_put(bake, bvh_prim_indices(in.bvh), v_arr_len(in.polygons) * sizeof(size_t)));
+	return out;
+}
+
+static cJSON *serialize_mesh(const struct mesh in, struct baked_writer *bake) {
 	cJSON *out = cJSON_CreateObject();
-	cJSON_AddItemToObject(out, "polygons", serialize_faces(in.polygons));
-	cJSON_AddItemToObject(out, "vbuf", serialize_vertex_buffer(in.vbuf));
+	cJSON_AddItemToObject(out, "polygons", serialize_faces(in.polygons, bake));
+	cJSON_AddItemToObject(out, "vbuf", serialize_vertex_buffer(in.vbuf, bake));
 	cJSON_AddStringToObject(out, "name", in.name);
+	// Network workers build their own BVHs
+	if (bake && in.bvh)
+		cJSON_AddItemToObject(out, "bvh", serialize_mesh_bvh(in, bake));
+	return out;
+}
+
+static struct bvh *deserialize_baked_mesh_bvh(const cJSON *in, const struct baked_map *map, size_t poly_count) {
+	if (!in) return NULL;
+	size_t node_count = cJSON_GetNumberValue(cJSON_GetObjectItem(in, "node_count"));
+	size_t node_bytes = 0, index_bytes = 0;
+	const void *nodes = baked_get(map, cJSON_GetObjectItem(in, "nodes"), &node_bytes);
+	const size_t *prim_indices = baked_get(map, cJSON_GetObjectItem(in, "prim_indices"), &index_bytes);
+	if (!nodes || !prim_indices || node_bytes != node_count * bvh_node_size() || index_bytes != poly_count * sizeof(size_t))
+		return NULL;
+	return bvh_wrap(nodes, node_count, prim_indices, poly_count);
+}
+
+static struct mesh deserialize_baked_mesh(const cJSON *in, const struct baked_map *map) {
+	struct mesh out = { 0 };
+	if (!in) return out;
+
+	out.polygons = deserialize_baked_faces(cJSON_GetObjectItem(in, "polygons"), map);
+	out.vbuf = deserialize_baked_vertex_buffer(cJSON_GetObjectItem(in, "vbuf"), map);
+	out.name = stringCopy(cJSON_GetStringValue(cJSON_GetObjectItem(in, "name")));
+	out.bvh = deserialize_baked_mesh_bvh(cJSON_GetObjectItem(in, "bvh"), map, v_arr_len(out.polygons));
+
 	return out;
 }
 
@@ -707,7 +821,7 @@ struct cr_shader_node *deserialize_shader_node(const cJSON *in) {
 	return cr_shader_node_build(in);
 }
 
-static cJSON *serialize_scene(const struct world *in) {
+static cJSON *serialize_scene(const struct world *in, struct baked_writer *bake) {
 	cJSON *out = cJSON_CreateObject();
 
 	cJSON_AddStringToObject(out, "asset_path", in->asset_path);
@@ -718,7 +832,7 @@ static cJSON *serialize_scene(const struct world *in) {
 	for (size_t i = 0; i < v_arr_len(in->textures); ++i) {
 		cJSON *asset = cJSON_CreateObject();
 		cJSON_AddItemToObject(asset, "p", cJSON_CreateString(in->textures[i].path));
-		cJSON_AddItemToObject(asset, "t", serialize_texture(in->textures[i].t));
+		cJSON_AddItemToObject(asset, "t", bake ? serialize_baked_texture(in->textures[i].t, bake) : serialize_texture(in->textures[i].t));
 		cJSON_AddItemToArray(textures, asset);
 	}
 	cJSON_AddItemToObject(out, "textures", textures);
@@ -736,7 +850,7 @@ static cJSON *serialize_scene(const struct world *in) {
 
 	cJSON *meshes = cJSON_CreateArray();
 	for (size_t i = 0; i < v_arr_len(in->meshes); ++i) {
-		cJSON_AddItemToArray(meshes, serialize_mesh(in->meshes[i]));
+		cJSON_AddItemToArray(meshes, serialize_mesh(in->meshes[i], bake));
 	}
 	cJSON_AddItemToObject(out, "meshes", meshes);
 
@@ -761,10 +875,8 @@ static cJSON *serialize_scene(const struct world *in) {
 	return out;
 }
 
-struct world *deserialize_scene(const cJSON *in) {
-	if (!in) return NULL;
-	struct world *out = scene_new();
-
+// If map is set, in is from a baked scene
+static void deserialize_scene_into(struct world *out, const cJSON *in, const struct baked_map *map) {
 	cJSON *asset_path = cJSON_GetObjectItem(in, "asset_path");
 	if (cJSON_IsString(asset_path)) {
 		if (out->asset_path) free(out->asset_path);
@@ -777,7 +889,7 @@ struct world *deserialize_scene(const cJSON *in) {
 		cJSON_ArrayForEach(texture, textures) {
 			v_arr_add(out->textures, (struct texture_asset){
 				.path = stringCopy(cJSON_GetStringValue(cJSON_GetObjectItem(texture, "p"))),
-				.t = deserialize_texture(cJSON_GetObjectItem(texture, "t"))
+				.t = map ? deserialize_baked_texture(cJSON_GetObjectItem(texture, "t"), map) : deserialize_texture(cJSON_GetObjectItem(texture, "t"))
 			});
 		}
 	}
@@ -810,8 +922,9 @@ struct world *deserialize_scene(const cJSON *in) {
 		cJSON *mesh = NULL;
 		cJSON_ArrayForEach(mesh, meshes) {
 			v_rwlock_write_lock(out->bvh_lock);
-			cr_mesh idx = v_arr_add(out->meshes, deserialize_mesh(mesh));
-			cr_mesh_finalize((struct cr_scene *)out, idx);
+			cr_mesh idx = v_arr_add(out->meshes, map ? deserialize_baked_mesh(mesh, map) : deserialize_mesh(mesh));
+			if (!out->meshes[idx].bvh)
+				cr_mesh_finalize((struct cr_scene *)out, idx);
 			v_rwlock_unlock(out->bvh_lock);
 		}
 	}
@@ -849,7 +962,13 @@ struct world *deserialize_scene(const cJSON *in) {
 			v_arr_add(out->cameras, deserialize_camera(camera));
 		}
 	}
+	out->top_level_dirty = true;
+}
 
+struct world *deserialize_scene(const cJSON *in) {
+	if (!in) return NULL;
+	struct world *out = scene_new();
+	deserialize_scene_into(out, in, NULL);
 	return out;
 }
 
@@ -863,6 +982,9 @@ static cJSON *serialize_prefs(const struct prefs in) {
 	cJSON_AddItemToObject(out, "width", cJSON_CreateNumber(in.override_width));
 	cJSON_AddItemToObject(out, "height", cJSON_CreateNumber(in.override_height));
 	cJSON_AddItemToObject(out, "selected_camera", cJSON_CreateNumber(in.selected_camera));
+	cJSON_AddItemToObject(out, "adaptive_threshold", cJSON_CreateNumber(in.adaptive_threshold));
+	cJSON_AddItemToObject(out, "adaptive_min_samples", cJSON_CreateNumber(in.adaptive_min_samples));
+	cJSON_AddItemToObject(out, "time_limit_ms", cJSON_CreateNumber(in.time_limit_ms));
 	return out;
 }
 
@@ -877,13 +999,19 @@ struct prefs deserialize_prefs(const cJSON *in) {
 	p.override_width = cJSON_GetNumberValue(cJSON_GetObjectItem(in, "width"));
 	p.override_height = cJSON_GetNumberValue(cJSON_GetObjectItem(in, "height"));
 	p.selected_camera = cJSON_GetNumberValue(cJSON_GetObjectItem(in, "selected_camera"));
+	const cJSON *adaptive_threshold = cJSON_GetObjectItem(in, "adaptive_threshold");
+	if (cJSON_IsNumber(adaptive_threshold)) p.adaptive_threshold = adaptive_threshold->valuedouble;
+	const cJSON *adaptive_min_samples = cJSON_GetObjectItem(in, "adaptive_min_samples");
+	if (cJSON_IsNumber(adaptive_min_samples)) p.adaptive_min_samples = adaptive_min_samples->valuedouble;
+	const cJSON *time_limit = cJSON_GetObjectItem(in, "time_limit_ms");
+	if (cJSON_IsNumber(time_limit)) p.time_limit_ms = time_limit->valuedouble;
 	return p;
 }
 
 static cJSON *serialize_json(const struct renderer *r) {
 	if (!r) return NULL;
 	cJSON *out = cJSON_CreateObject();
-	cJSON_AddItemToObject(out, "scene", serialize_scene(r->scene));
+	cJSON_AddItemToObject(out, "scene", serialize_scene(r->scene, NULL));
 	cJSON_AddItemToObject(out, "prefs", serialize_prefs(r->prefs));
 	return out;
 }
@@ -896,6 +1024,55 @@ char *serialize_renderer(const struct renderer *r) {
 	return data;
 }
 
+// In-memory layout of structs baked scenes store as-is
+static cJSON *serialize_baked_layout(void) {
+	cJSON *out = cJSON_CreateObject();
+	cJSON_AddNumberToObject(out, "version", BAKED_VERSION);
+	cJSON_AddNumberToObject(out, "size_t", sizeof(size_t));
+	cJSON_AddNumberToObject(out, "vector", sizeof(struct vector));
+	cJSON_AddNumberToObject(out, "coord", sizeof(struct coord));
+	cJSON_AddNumberToObject(out, "poly", sizeof(struct poly));
+	cJSON_AddNumberToObject(out, "bvh_node", bvh_node_size());
+	return out;
+}
+
+cJSON *serialize_baked_renderer(const struct renderer *r, struct baked_writer *bake) {
+	if (!r) return NULL;
+	cJSON *out = cJSON_CreateObject();
+	cJSON_AddItemToObject(out, "layout", serialize_baked_layout());
+	cJSON_AddItemToObject(out, "scene", serialize_scene(r->scene, bake));
+	cJSON_AddItemToObject(out, "prefs", serialize_prefs(r->prefs));
+	return out;
+}
+
+bool deserialize_baked_renderer(struct renderer *r, const cJSON *in, const struct baked_map *map) {
+	cJSON *layout = serialize_baked_layout();
+	bool compatible = cJSON_Compare(layout, cJSON_GetObjectItem(in, "layout"), true);
+	cJSON_Delete(layout);
+	if (!compatible) {
+		logr(warning, "Baked scene is from an incompatible c-ray build\n");
+		return false;
+	}
+	if (v_arr_len(r->scene->meshes) || v_arr_len(r->scene->instances)) {
+		logr(warning, "Baked scenes can only be loaded into an empty scene\n");
+		return false;
+	}
+	deserialize_scene_into(r->scene, cJSON_GetObjectItem(in, "scene"), map);
+	struct prefs p = deserialize_prefs(cJSON_GetObjectItem(in, "prefs"));
+	r->prefs.sampleCount = p.sampleCount;
+	r->prefs.bounces = p.bounces;
+	r->prefs.tileWidth = p.tileWidth;
+	r->prefs.tileHeight = p.tileHeight;
+	r->prefs.tileOrder = p.tileOrder;
+	r->prefs.override_width = p.override_width;
+	r->prefs.override_height = p.override_height;
+	r->prefs.selected_camera = p.selected_camera;
+	r->prefs.adaptive_threshold = p.adaptive_threshold;
+	r->prefs.adaptive_min_samples = p.adaptive_min_samples;
+	r->prefs.time_limit_ms = p.time_limit_ms;
+	return true;
+}
+
 void dump_renderer_state(const struct renderer *r) {
 	if (!r) return;
 	cJSON *out = serialize_json(r);
@@ -17,6 +17,8 @@ struct render_tile;
 struct render_client;
 struct texture;
 struct renderer;
+struct baked_writer;
+struct baked_map;
 
 struct command {
 	char *name;
@@ -53,4 +55,8 @@ bool containsStats(const cJSON *json);
 char *serialize_renderer(const struct renderer *r);
 struct renderer *deserialize_renderer(const char *data);
 
+// Baked scenes, see baked.h
+cJSON *serialize_baked_renderer(const struct renderer *r, struct baked_writer *bake);
+bool deserialize_baked_renderer(struct renderer *r, const cJSON *in, const struct baked_map *map);
+
 void dump_renderer_state(const struct renderer *r);
@@ -141,9 +141,8 @@ static struct render_client *build_client_list(const char *node_list) {
 static cJSON *handle_get_work(struct worker *state, const cJSON *json) {
 	(void)state;
 	(void)json;
-	struct render_tile *tile = tile_next(state->tiles);
+	struct render_tile *tile = tile_next_network(state->tiles);
 	if (!tile) return newAction("renderComplete");
-	tile->network_renderer = true;
 	cJSON *response = newAction("newWork");
 	cJSON_AddItemToObject(response, "tile", encodeTile(tile));
 	return response;
@@ -154,8 +153,12 @@ static cJSON *handle_submit_work(struct worker *state, const cJSON *json) {
 	struct texture *texture = deserialize_texture(result);
 	cJSON *tile_json = cJSON_GetObjectItem(json, "tile");
 	struct render_tile tile = decodeTile(tile_json);
-	state->tiles->tiles[tile.index] = tile;
-	state->tiles->tiles[tile.index].state = finished; // FIXME: Remove
+	// Only take the progress, the rest of the tile may be in use by a local thread that picked it up
+	v_mutex_lock(state->tiles->tile_mutex);
+	struct render_tile *local = &state->tiles->tiles[tile.index];
+	local->completed_samples = tile.completed_samples;
+	if (local->network_renderer) local->state = finished;
+	v_mutex_release(state->tiles->tile_mutex);
 	for (int y = tile.end.y - 1; y > tile.begin.y - 1; --y) {
 		for (int x = tile.begin.x; x < tile.end.x; ++x) {
 			struct color value = tex_get_px(texture, x - tile.begin.x, y - tile.begin.y, false);
@@ -163,6 +166,7 @@ static cJSON *handle_submit_work(struct worker *state, const cJSON *json) {
 		}
 	}
 	tex_destroy(texture);
+	tile_dirty_mark(state->renderer->state.dirty_tiles, &tile);
 	return newAction("ok");
 }
 
@@ -134,7 +134,7 @@ struct instance new_sphere_instance(struct sphere **spheres, size_t idx, float *
 }
 
 static void mesh_uv(const struct mesh *mesh, struct hitRecord *isect) {
-	if (!v_arr_len(mesh->vbuf.texture_coords))
+	if (!vbuf_texture_coord_count(&mesh->vbuf))
 		return;
 	struct poly *p = isect->polygon;
 	if (p->textureIndex[0] == -1)
@@ -170,6 +170,34 @@ static bool intersectMesh(const struct instance *instance, const struct lightRay
 	return false;
 }
 
+// Same as intersectMesh, for the active lanes of a packet
+static lane_mask intersectMeshPacket(const struct instance *instance, const struct ray_packet *packet, lane_mask active) {
+	struct mesh *mesh = &(*((struct mesh **)instance->object_arr))[instance->object_idx];
+	struct ray_packet local;
+	local.count = packet->count;
+	for (size_t lane = 0; lane < packet->count; ++lane) {
+		if (!(active & lane_bit(lane)))
+			continue;
+		local.rays[lane] = packet->rays[lane];
+		tform_ray(&local.rays[lane], instance->composite.Ainv);
+		local.rays[lane].start = vec_add(local.rays[lane].start, vec_scale(local.rays[lane].direction, mesh->rayOffset));
+		local.isects[lane] = packet->isects[lane];
+		local.samplers[lane] = packet->samplers[lane];
+	}
+	const lane_mask hit = traverse_bottom_level_bvh_packet(mesh, &local, active);
+	for (size_t lane = 0; lane < packet->count; ++lane) {
+		if (!(hit & lane_bit(lane)))
+			continue;
+		struct hitRecord *isect = packet->isects[lane];
+		isect->bsdf = instance->bbuf->bsdfs[isect->polygon->materialIndex];
+		tform_point(&isect->hitPoint, instance->composite.A);
+		tform_vector_transpose(&isect->surfaceNormal, instance->composite.Ainv);
+		isect->surfaceNormal = vec_normalize(isect->surfaceNormal);
+		mesh_uv(mesh, isect);
+	}
+	return hit;
+}
+
 static bool intersectMeshVolume(const struct instance *instance, const struct lightRay *ray, struct hitRecord *isect, sampler *sampler) {
 	return false;
 	struct hitRecord record1, record2;
@@ -244,6 +272,7 @@ struct instance new_mesh_instance(struct mesh **meshes, size_t idx, float *densi
 			.object_idx = idx,
 			.composite = tform_new(),
 			.intersectFn = intersectMesh,
+			.intersectPacketFn = intersectMeshPacket,
 			.getBBoxAndCenterFn = getMeshBBoxAndCenter
 		};
 	}
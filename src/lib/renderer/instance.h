@@ -18,6 +18,7 @@
 #include <nodes/bsdfnode.h>
 #include <datatypes/mesh.h>
 #include <datatypes/sphere.h>
+#include <datatypes/lightray.h>
 
 struct lightRay;
 struct hitRecord;
@@ -28,6 +29,8 @@ struct instance {
 	size_t bbuf_idx;
 	bool emits_light;
 	bool (*intersectFn)(const struct instance *, const struct lightRay *, struct hitRecord *, sampler *);
+	// Optional, packets are intersected one lane at a time with intersectFn without it
+	lane_mask (*intersectPacketFn)(const struct instance *, const struct ray_packet *, lane_mask);
 	void (*getBBoxAndCenterFn)(const struct instance *, struct boundingBox *, struct vector *);
 	void *object_arr;
 	size_t object_idx;
@@ -25,13 +25,14 @@ static inline struct hitRecord getClosestIsect(struct lightRay *incidentRay, con
 	return isect;
 }
 
-struct color path_trace(struct lightRay incident, const struct world *scene, int max_bounces, sampler *sampler) {
+// Trace a path onwards from the first intersection of its camera ray
+static inline struct color path_continue(struct lightRay incident, struct hitRecord isect, const struct world *scene, int max_bounces, sampler *sampler) {
 	struct color path_weight = g_white_color;
 	struct color path_radiance = g_black_color; // Final path contribution "color"
 	struct lightRay currentRay = incident;
 
 	for (int bounce = 0; bounce <= max_bounces; ++bounce) {
-		const struct hitRecord isect = getClosestIsect(&currentRay, scene, sampler);
+		if (bounce > 0) isect = getClosestIsect(&currentRay, scene, sampler);
 		if (isect.instIndex < 0) {
 			path_radiance = colorAdd(path_radiance, colorMul(path_weight, scene->background->sample(scene->background, sampler, &isect).weight));
 			break;
@@ -60,3 +61,19 @@ struct color path_trace(struct lightRay incident, const struct world *scene, int
 	}
 	return path_radiance;
 }
+
+struct color path_trace(struct lightRay incident, const struct world *scene, int max_bounces, sampler *sampler) {
+	return path_continue(incident, getClosestIsect(&incident, scene, sampler), scene, max_bounces, sampler);
+}
+
+void path_trace_packet(struct ray_packet *packet, struct color *out, const struct world *scene, int max_bounces) {
+	struct hitRecord isects[RAY_PACKET_SIZE];
+	for (size_t lane = 0; lane < packet->count; ++lane) {
+		isects[lane] = (struct hitRecord){ .incident = &packet->rays[lane], .instIndex = -1, .distance = FLT_MAX, .polygon = NULL };
+		packet->isects[lane] = &isects[lane];
+	}
+	traverse_top_level_bvh_packet(scene->instances, scene->topLevel, packet, lanes_first(packet->count));
+	// Bounced rays scatter all over the place, so the rest of each path is traced on its own
+	for (size_t lane = 0; lane < packet->count; ++lane)
+		out[lane] = path_continue(packet->rays[lane], isects[lane], scene, max_bounces, packet->samplers[lane]);
+}
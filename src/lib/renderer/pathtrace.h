@@ -14,3 +14,8 @@
 struct world;
 
 struct color path_trace(struct lightRay incident, const struct world *scene, int max_bounces, sampler *sampler);
+
+// Path trace the rays of a packet, with the first hits found for the whole packet at once.
+// The samplers in the packet must be ready to continue where generating the rays left off.
+// Writes one color per lane to out, identical to what path_trace() would return for that lane.
+void path_trace_packet(struct ray_packet *packet, struct color *out, const struct world *scene, int max_bounces);
@@ -11,11 +11,13 @@
 #include <v.h>
 #include "renderer.h"
 #include "pathtrace.h"
+#include "stats.h"
 #include <common/hashtable.h>
 #include <common/logging.h>
 #include <common/texture.h>
 #include <common/platform/signal.h>
 #include <common/cr_string.h>
+#include <common/cr_assert.h>
 #include <datatypes/mesh.h>
 #include <datatypes/camera.h>
 #include <datatypes/scene.h>
@@ -38,8 +40,8 @@ static void print_stats(const struct world *scene) {
 		if (instance_type(&scene->instances[i]) == CR_I_MESH) {
 			const struct mesh *mesh = &scene->meshes[scene->instances[i].object_idx];
 			polys += v_arr_len(mesh->polygons);
-			vertices += v_arr_len(mesh->vbuf.vertices);
-			normals += v_arr_len(mesh->vbuf.normals);
+			vertices += vbuf_vertex_count(&mesh->vbuf);
+			normals += vbuf_normal_count(&mesh->vbuf);
 		}
 	}
 	logr(info, "Totals: %"PRIu64"V, %"PRIu64"N, %zuI, %"PRIu64"P, %zuS, %zuM\n",
@@ -55,6 +57,201 @@ void *render_thread(void *arg);
 void *render_thread_interactive(void *arg);
 void *render_single_iteration(void *arg);
 
+// Adaptive sampling checks tiles for convergence this often, in samples
+#define ADAPTIVE_CHECK_INTERVAL 4
+
+// Tile accumulation buffers are aligned to this, in bytes. One cache line.
+#define ACCUM_ALIGN 64
+
+// Each render thread accumulates the tile it's working on here, and only writes it out to
+// result_buf once the tile is done. That keeps the shared framebuffer out of the per-sample
+// path, and the samples of neighbouring tiles off each others' cache lines.
+// Pixels are indexed by (y - begin.y) * tile->width + (x - begin.x)
+struct tile_accum {
+	void *mem;
+	size_t capacity; // In pixels
+	struct color *pass; // Samples of the latest pass
+	struct color *sum;  // Sum of all samples so far
+	struct color *half; // Sum of odd-numbered samples only, for adaptive sampling
+};
+
+static void tile_accum_reserve(struct tile_accum *a, const struct render_tile *tile) {
+	const size_t pixels = (size_t)tile->width * tile->height;
+	if (pixels <= a->capacity) return;
+	// Round up so all three arrays start on a cache line
+	const size_t per_line = ACCUM_ALIGN / sizeof(struct color);
+	const size_t capacity = (pixels + per_line - 1) / per_line * per_line;
+	free(a->mem);
+	a->mem = malloc(3 * capacity * sizeof(struct color) + ACCUM_ALIGN);
+	struct color *base = (struct color *)(((uintptr_t)a->mem + ACCUM_ALIGN - 1) & ~(uintptr_t)(ACCUM_ALIGN - 1));
+	a->pass = base;
+	a->sum = base + capacity;
+	a->half = base + 2 * capacity;
+	a->capacity = capacity;
+}
+
+static void tile_accum_begin(struct tile_accum *a, const struct render_tile *tile) {
+	tile_accum_reserve(a, tile);
+	const size_t pixels = (size_t)tile->width * tile->height;
+	memset(a->sum, 0, pixels * sizeof(*a->sum));
+	memset(a->half, 0, pixels * sizeof(*a->half));
+}
+
+static void tile_accum_free(struct tile_accum *a) {
+	free(a->mem);
+	*a = (struct tile_accum){ 0 };
+}
+
+// Add the latest pass to the sums. samples is the number of samples including this pass.
+// Odd-numbered samples also go into a second sum. Both averages converge to the same value,
+// so the difference between them is an estimate of how noisy the full one still is.
+static void tile_accum_add(struct tile_accum *a, const struct render_tile *tile, size_t samples, bool adaptive) {
+	const size_t pixels = (size_t)tile->width * tile->height;
+	const bool odd = adaptive && (samples & 1);
+	for (size_t i = 0; i < pixels; ++i) {
+		struct color sample = a->pass[i];
+		// Clamp out fireflies - This is probably not a good way to do that.
+		if (sample.red != sample.red || sample.green != sample.green || sample.blue != sample.blue || sample.alpha != sample.alpha) {
+			sample = samples > 1 ? colorCoef(1.0f / (samples - 1), a->sum[i]) : (struct color){ 0 };
+		}
+		a->sum[i] = colorAdd(a->sum[i], sample);
+		if (odd) a->half[i] = colorAdd(a->half[i], sample);
+	}
+}
+
+static inline float *result_row(struct texture *buf, int x, int y) {
+	ASSERT(buf->precision == float_p && buf->channels == 4);
+	ASSERT(x >= 0 && (size_t)x < buf->width && y >= 0 && (size_t)y < buf->height);
+	return buf->data.float_p + ((buf->height - (y + 1)) * buf->width + x) * 4;
+}
+
+// Write the average of samples accumulated so far out to buf
+static void tile_accum_resolve(const struct tile_accum *a, const struct render_tile *tile, struct texture *buf, size_t samples) {
+	if (!samples) return;
+	const float t = 1.0f / samples;
+	const struct color *src = a->sum;
+	for (int y = tile->begin.y; y < tile->end.y; ++y) {
+		float *dst = result_row(buf, tile->begin.x, y);
+		for (unsigned x = 0; x < tile->width; ++x, ++src, dst += 4) {
+			dst[0] = src->red * t;
+			dst[1] = src->green * t;
+			dst[2] = src->blue * t;
+			dst[3] = src->alpha * t;
+		}
+	}
+}
+
+// Fold the sums of another thread's samples into buf, which has the average of merged samples
+// of the same tile so far. Used when a tile was stolen from, and several threads rendered it.
+static void tile_accum_combine(const struct tile_accum *a, const struct render_tile *tile, struct texture *buf, size_t merged, size_t samples) {
+	const float prev = (float)merged;
+	const float t = 1.0f / (merged + samples);
+	const struct color *src = a->sum;
+	for (int y = tile->begin.y; y < tile->end.y; ++y) {
+		float *dst = result_row(buf, tile->begin.x, y);
+		for (unsigned x = 0; x < tile->width; ++x, ++src, dst += 4) {
+			dst[0] = (dst[0] * prev + src->red) * t;
+			dst[1] = (dst[1] * prev + src->green) * t;
+			dst[2] = (dst[2] * prev + src->blue) * t;
+			dst[3] = (dst[3] * prev + src->alpha) * t;
+		}
+	}
+}
+
+// Write out the samples this thread rendered of a tile, and leave it. The last thread to
+// leave a tile with all of its samples merged marks it finished.
+static void tile_accum_commit(struct tile_set *set, const struct tile_accum *a, struct render_tile *tile, struct texture *buf, size_t samples) {
+	v_mutex_lock(set->tile_mutex);
+	if (!tile->merged_samples)
+		tile_accum_resolve(a, tile, buf, samples);
+	else if (samples)
+		tile_accum_combine(a, tile, buf, tile->merged_samples, samples);
+	tile->merged_samples += samples;
+	if (!--tile->workers && tile->merged_samples >= tile->total_samples)
+		tile->state = finished;
+	v_mutex_release(set->tile_mutex);
+}
+
+// Fold the latest pass into the running average in buf. This is for interactive mode, where
+// every pass over a tile is its own job, and buf holds the result of the previous ones.
+static void tile_accum_merge(const struct tile_accum *a, const struct render_tile *tile, struct texture *buf, size_t samples) {
+	const float prev = (float)(samples - 1);
+	const float t = 1.0f / samples;
+	const struct color *src = a->pass;
+	for (int y = tile->begin.y; y < tile->end.y; ++y) {
+		float *dst = result_row(buf, tile->begin.x, y);
+		for (unsigned x = 0; x < tile->width; ++x, ++src, dst += 4) {
+			struct color output = { dst[0], dst[1], dst[2], dst[3] };
+			struct color sample = *src;
+			// Clamp out fireflies - This is probably not a good way to do that.
+			nan_clamp(&sample, &output);
+			output = colorCoef(t, colorAdd(colorCoef(prev, output), sample));
+			dst[0] = output.red;
+			dst[1] = output.green;
+			dst[2] = output.blue;
+			dst[3] = output.alpha;
+		}
+	}
+}
+
+// Mean relative difference between the full and half averages over the tile. The error is
+// scaled by the square root of brightness, roughly how noise is perceived.
+static float tile_noise(const struct tile_accum *a, const struct render_tile *tile, size_t samples) {
+	const size_t pixels = (size_t)tile->width * tile->height;
+	const float full_t = 1.0f / samples;
+	const float half_t = 1.0f / ((samples + 1) / 2);
+	float error = 0.0f;
+	for (size_t p = 0; p < pixels; ++p) {
+		const struct color i = colorCoef(full_t, a->sum[p]);
+		const struct color h = colorCoef(half_t, a->half[p]);
+		const float diff = fabsf(i.red - h.red) + fabsf(i.green - h.green) + fabsf(i.blue - h.blue);
+		error += diff / (0.0001f + sqrtf(i.red + i.green + i.blue));
+	}
+	return error / (float)pixels;
+}
+
+// Called after every finished sample of a tile. If the tile is below the adaptive noise threshold,
+// lowers its total_samples to what it got so far and returns true.
+static bool tile_converged(const struct renderer *r, struct render_tile *tile, const struct tile_accum *a) {
+	if (!r->state.adaptive) return false;
+	const size_t done = tile->completed_samples;
+	if (done < r->prefs.adaptive_min_samples || done >= tile->total_samples || done % ADAPTIVE_CHECK_INTERVAL)
+		return false;
+	if (tile_noise(a, tile, done) >= r->prefs.adaptive_threshold)
+		return false;
+	tile->total_samples = done;
+	return true;
+}
+
+// Render one sample for every pixel of the tile into out, in tile order.
+// Pixels go in blocks of RAY_PACKET_DIM x RAY_PACKET_DIM, so their camera rays can be traced
+// as a packet. samplers has one sampler per packet lane. Returns false if the render was stopped.
+static bool render_tile_pass(struct renderer *r, const struct camera *cam, const struct render_tile *tile, sampler **samplers, int sampler_pass, struct color *out) {
+	struct ray_packet packet;
+	struct color colors[RAY_PACKET_SIZE];
+	size_t pixels[RAY_PACKET_SIZE];
+	for (int block_y = tile->end.y - 1; block_y > tile->begin.y - 1; block_y -= RAY_PACKET_DIM) {
+		for (int block_x = tile->begin.x; block_x < tile->end.x; block_x += RAY_PACKET_DIM) {
+			if (r->state.s != r_rendering) return false;
+			packet.count = 0;
+			for (int y = block_y; y > block_y - RAY_PACKET_DIM && y > tile->begin.y - 1; --y) {
+				for (int x = block_x; x < block_x + RAY_PACKET_DIM && x < tile->end.x; ++x) {
+					const size_t lane = packet.count++;
+					uint32_t pixIdx = (uint32_t)(y * cam->width + x);
+					sampler_init(samplers[lane], SAMPLING_STRATEGY, sampler_pass, r->prefs.sampleCount, pixIdx);
+					packet.samplers[lane] = samplers[lane];
+					packet.rays[lane] = cam_get_ray(cam, x, y, samplers[lane]);
+					pixels[lane] = (size_t)(y - tile->begin.y) * tile->width + (x - tile->begin.x);
+				}
+			}
+			path_trace_packet(&packet, colors, r->scene, r->prefs.bounces);
+			for (size_t lane = 0; lane < packet.count; ++lane)
+				out[pixels[lane]] = colors[lane];
+		}
+	}
+	return true;
+}
+
 //FIXME: Statistics computation is a gigantic mess. It will also break in the case
 //where a worker node disconnects during a render, so maybe fix that next.
 void update_cb_info(struct renderer *r, struct tile_set *set, struct cr_renderer_cb_info *i) {
@@ -82,7 +279,11 @@ void update_cb_info(struct renderer *r, struct tile_set *set, struct cr_renderer
 	for (size_t t = 0; t < v_arr_len(r->state.workers); ++t) {
 		completed_samples += r->state.workers[t].totalSamples;
 	}
-	uint64_t remainingTileSamples = (v_arr_len(set->tiles) * r->prefs.sampleCount) - completed_samples;
+	// Adaptive sampling lowers total_samples of tiles that finish early
+	uint64_t total_samples = 0;
+	for (size_t t = 0; t < v_arr_len(set->tiles); ++t)
+		total_samples += set->tiles[t].total_samples;
+	uint64_t remainingTileSamples = total_samples > completed_samples ? total_samples - completed_samples : 0;
 	uint64_t eta_ms_till_done = (avg_tile_pass_us * remainingTileSamples) / 1000;
 	eta_ms_till_done /= (r->prefs.threads + remote_threads);
 	uint64_t sps = (1000000 / avg_per_ray_us) * (r->prefs.threads + remote_threads);
@@ -93,7 +294,17 @@ void update_cb_info(struct renderer *r, struct tile_set *set, struct cr_renderer
 	i->eta_ms = eta_ms_till_done;
 	i->completion = r->prefs.interactive ?
 		((double)r->state.finishedPasses / (double)r->prefs.sampleCount) :
-		((double)set->finished / (double)v_arr_len(set->tiles));
+		((double)min(set->finished, v_arr_len(set->tiles)) / (double)v_arr_len(set->tiles));
+	if (r->prefs.time_limit_ms && !r->prefs.interactive) {
+		// Done at the deadline, or when all passes are, whichever comes first
+		const uint64_t elapsed_ms = v_timer_get_ms(r->state.render_started);
+		const double by_time = (double)elapsed_ms / (double)r->prefs.time_limit_ms;
+		const double by_passes = (double)(r->state.finishedPasses - 1) / (double)r->prefs.sampleCount;
+		i->completion = min(1.0, max(by_time, by_passes));
+		i->finished_passes = r->state.finishedPasses - 1;
+		if (elapsed_ms < r->prefs.time_limit_ms && (uint64_t)i->eta_ms > r->prefs.time_limit_ms - elapsed_ms)
+			i->eta_ms = r->prefs.time_limit_ms - elapsed_ms;
+	}
 
 }
 
@@ -112,15 +323,31 @@ void renderer_start_interactive(struct renderer *r) {
 	}, v_thread_type_detached);
 }
 
+bool renderer_time_is_up(const struct renderer *r) {
+	if (!r->prefs.time_limit_ms || r->prefs.interactive) return false;
+	return (uint64_t)v_timer_get_ms(r->state.render_started) >= r->prefs.time_limit_ms;
+}
+
 void update_toplevel_bvh(struct world *s) {
 	if (!s->top_level_dirty && s->topLevel) return;
-	struct bvh *new = build_top_level_bvh(s->instances);
+	v_timer timer = v_timer_start();
+	// When only transforms have changed, refitting the current tree is enough
+	struct bvh *new = s->topLevel ? refit_top_level_bvh(s->topLevel, s->instances) : NULL;
+	if (!new) {
+		const int64_t scratch = bvh_build_bytes(v_arr_len(s->instances));
+		stats_add_memory(s->stats, cr_mem_bvh, 0, scratch);
+		new = build_top_level_bvh(s->instances, s->bvh_builder);
+		stats_add_memory(s->stats, cr_mem_bvh, 0, -scratch);
+	}
+	stats_add_timing(s->stats, cr_phase_top_level_bvh, NULL, v_timer_get_us(timer));
+	stats_add_memory(s->stats, cr_mem_bvh, bvh_bytes(new), 0);
 	//!//!//!//!//!//!//!//!//!//!//!//!
 	v_rwlock_write_lock(s->bvh_lock);
 	struct bvh *old = s->topLevel;
 	s->topLevel = new;
 	v_rwlock_unlock(s->bvh_lock);
 	//!//!//!//!//!//!//!//!//!//!//!//!
+	stats_add_memory(s->stats, cr_mem_bvh, -(int64_t)bvh_bytes(old), 0);
 	destroy_bvh(old);
 	// Bind shader buffers to instances
 	// dyn_array may realloc(), so we refresh these last
@@ -180,6 +407,15 @@ void renderer_render(struct renderer *r) {
 
 	print_stats(r->scene);
 
+	// Time-limited renders go pass by pass over the whole image, like interactive ones, so
+	// stopping at the deadline leaves every tile with about the same amount of samples.
+	const bool time_limited = r->prefs.time_limit_ms && !r->prefs.interactive && !v_arr_len(r->state.clients);
+
+	// Passes of the interactive loop have no tail to speak of. Network workers index into
+	// a tile set of their own, so they need the tiles as quantized.
+	if (!r->prefs.interactive && !time_limited && !v_arr_len(r->state.clients))
+		tile_split_tail(&set.tiles, r->prefs.threads);
+
 	for (size_t i = 0; i < v_arr_len(set.tiles); ++i)
 		set.tiles[i].total_samples = r->prefs.sampleCount;
 
@@ -202,6 +438,11 @@ void renderer_render(struct renderer *r) {
 		// Clear
 		tex_clear(r->state.result_buf);
 	}
+	// Adaptive sampling only applies to regular local renders
+	r->state.adaptive = r->prefs.adaptive_threshold > 0.0f && !r->prefs.interactive && !time_limited && r->prefs.adaptive_min_samples < r->prefs.sampleCount;
+	if (r->prefs.interactive)
+		snapshots_reset(r->state.snapshots, camera->width, camera->height, set.tiles);
+	tile_dirty_reset(r->state.dirty_tiles, set.tiles);
 
 	struct texture **result = &r->state.result_buf;
 
@@ -219,7 +460,15 @@ void renderer_render(struct renderer *r) {
 		start.fn(&cb_info, start.user_data);
 	}
 
-	logr(info, "Pathtracing%s...\n", r->prefs.interactive ? " iteratively" : "");
+	if (time_limited) {
+		r->state.finishedPasses = 1;
+		logr(info, "Pathtracing for up to %s...\n", ms_to_readable(r->prefs.time_limit_ms, (char[64]){ 0 }));
+	} else {
+		logr(info, "Pathtracing%s...\n", r->prefs.interactive ? " iteratively" : "");
+	}
+	stats_sample_memory(r);
+	v_timer render_timer = v_timer_start();
+	r->state.render_started = render_timer;
 	
 	r->state.s = r_rendering;
 	
@@ -233,7 +482,11 @@ void renderer_render(struct renderer *r) {
 	void *(*local_render_thread)(void *) = render_thread;
 	// Iterative mode is incompatible with network rendering at the moment
 	if (r->prefs.interactive && !v_arr_len(r->state.clients)) local_render_thread = render_thread_interactive;
+	if (time_limited) local_render_thread = render_thread_interactive;
 	
+	// Workers from a previous render with this renderer have exited by now
+	v_arr_free(r->state.workers);
+
 	// Create & boot workers (Nonblocking)
 	// Local render threads + one thread for every client
 	for (size_t t = 0; t < r->prefs.threads; ++t) {
@@ -311,6 +564,27 @@ void renderer_render(struct renderer *r) {
 	//Make sure render threads are terminated before continuing (This blocks)
 	for (size_t w = 0; !threads_not_supported && w < v_arr_len(r->state.workers); ++w)
 		v_thread_wait_and_destroy(r->state.workers[w].thread);
+	stats_add_timing(r->scene->stats, cr_phase_render, NULL, v_timer_get_us(render_timer));
+	stats_sample_memory(r);
+
+	if (time_limited) {
+		size_t min_samples = SIZE_MAX, max_samples = 0;
+		for (size_t t = 0; t < v_arr_len(set.tiles); ++t) {
+			min_samples = min(min_samples, set.tiles[t].completed_samples);
+			max_samples = max(max_samples, set.tiles[t].completed_samples);
+		}
+		logr(info, "Time limit: %zu full pass%s, tiles got %zu to %zu samples\n",
+			r->state.finishedPasses - 1, r->state.finishedPasses - 1 == 1 ? "" : "es", min_samples, max_samples);
+	}
+
+	if (r->state.adaptive) {
+		uint64_t rendered = 0;
+		for (size_t t = 0; t < v_arr_len(set.tiles); ++t)
+			rendered += set.tiles[t].completed_samples;
+		const uint64_t budget = (uint64_t)v_arr_len(set.tiles) * r->prefs.sampleCount;
+		logr(info, "Adaptive sampling rendered %"PRIu64" of %"PRIu64" tile samples (%.1f%%)\n",
+			rendered, budget, budget ? 100.0 * (double)rendered / (double)budget : 0.0);
+	}
 
 	struct callback stop = r->state.callbacks[cr_cb_on_stop];
 	if (stop.fn) {
@@ -332,7 +606,10 @@ void *render_thread_interactive(void *arg) {
 	threadState->in_pause_loop = false;
 	struct renderer *r = threadState->renderer;
 	struct texture **buf = threadState->buf;
-	sampler *sampler = sampler_new();
+	sampler *samplers[RAY_PACKET_SIZE];
+	for (size_t i = 0; i < RAY_PACKET_SIZE; ++i)
+		samplers[i] = sampler_new();
+	struct tile_accum accum = { 0 };
 
 	struct camera *cam = threadState->cam;
 	
@@ -342,41 +619,29 @@ void *render_thread_interactive(void *arg) {
 	
 	while (tile && r->state.s == r_rendering) {
 		long total_us = 0;
+		// Read generation first, a restart resets finishedPasses before bumping it
+		const size_t snapshot_gen = r->state.snapshots->generation;
+		const size_t pass = r->state.finishedPasses;
 
 		v_timer timer = v_timer_start();
+		tile_accum_reserve(&accum, tile);
 		v_rwlock_read_lock(r->scene->bvh_lock);
-		for (int y = tile->end.y - 1; y > tile->begin.y - 1; --y) {
-			for (int x = tile->begin.x; x < tile->end.x; ++x) {
-				if (r->state.s != r_rendering) {
-					v_rwlock_unlock(r->scene->bvh_lock);
-					goto exit;
-				}
-				uint32_t pixIdx = (uint32_t)(y * (*buf)->width + x);
-				//FIXME: This does not converge to the same result as with regular renderThread.
-				//I assume that's because we'd have to init the sampler differently when we render all
-				//the tiles in one go per sample, instead of the other way around.
-				sampler_init(sampler, SAMPLING_STRATEGY, r->state.finishedPasses, r->prefs.sampleCount, pixIdx);
-				
-				struct color output = tex_get_px(*buf, x, y, false);
-				struct color sample = path_trace(cam_get_ray(cam, x, y, sampler), r->scene, r->prefs.bounces, sampler);
-
-				nan_clamp(&sample, &output);
-				
-				//And process the running average
-				output = colorCoef((float)(r->state.finishedPasses - 1), output);
-				output = colorAdd(output, sample);
-				float t = 1.0f / r->state.finishedPasses;
-				output = colorCoef(t, output);
-				
-				//Store internal render buffer (float precision)
-				tex_set_px(*buf, output, x, y);
-			}
+		//FIXME: This does not converge to the same result as with regular renderThread.
+		//I assume that's because we'd have to init the sampler differently when we render all
+		//the tiles in one go per sample, instead of the other way around.
+		if (!render_tile_pass(r, cam, tile, samplers, pass, accum.pass)) {
+			v_rwlock_unlock(r->scene->bvh_lock);
+			goto exit;
 		}
 		v_rwlock_unlock(r->scene->bvh_lock);
+		tile_accum_merge(&accum, tile, *buf, pass);
 		//For performance metrics
 		total_us += v_timer_get_us(timer);
 		threadState->totalSamples++;
 		threadState->avg_per_sample_us = total_us / r->state.finishedPasses;
+		snapshots_tile_done(r->state.snapshots, snapshot_gen, tile, pass, *buf);
+		tile_dirty_mark(r->state.dirty_tiles, tile);
+		tile->completed_samples = pass;
 		
 		//Tile has finished rendering, get a new one and start rendering it.
 		tile->state = finished;
@@ -396,7 +661,9 @@ void *render_thread_interactive(void *arg) {
 		threadState->currentTile = tile;
 	}
 exit:
-	sampler_destroy(sampler);
+	for (size_t i = 0; i < RAY_PACKET_SIZE; ++i)
+		sampler_destroy(samplers[i]);
+	tile_accum_free(&accum);
 	//No more tiles to render, exit thread. (render done)
 	threadState->thread_complete = true;
 	threadState->currentTile = NULL;
@@ -414,7 +681,10 @@ void *render_thread(void *arg) {
 	struct worker *threadState = arg;
 	struct renderer *r = threadState->renderer;
 	struct texture **buf = threadState->buf;
-	sampler *sampler = sampler_new();
+	sampler *samplers[RAY_PACKET_SIZE];
+	for (size_t i = 0; i < RAY_PACKET_SIZE; ++i)
+		samplers[i] = sampler_new();
+	struct tile_accum accum = { 0 };
 
 	struct camera *cam = threadState->cam;
 
@@ -422,55 +692,49 @@ void *render_thread(void *arg) {
 	struct render_tile *tile = tile_next(threadState->tiles);
 	threadState->currentTile = tile;
 	
-	size_t samples = 1;
-	
 	while (tile && r->state.s == r_rendering) {
 		long total_us = 0;
+		// Samples this thread rendered of the tile. Other threads may render the rest.
+		size_t samples = 0;
+		size_t sample;
+		tile_accum_begin(&accum, tile);
 		
-		while (samples < r->prefs.sampleCount + 1 && r->state.s == r_rendering) {
+		while (r->state.s == r_rendering && tile_claim_sample(tile, &sample)) {
 			v_timer timer = v_timer_start();
-			for (int y = tile->end.y - 1; y > tile->begin.y - 1; --y) {
-				for (int x = tile->begin.x; x < tile->end.x; ++x) {
-					if (r->state.s != r_rendering) goto exit;
-					uint32_t pixIdx = (uint32_t)(y * (*buf)->width + x);
-					sampler_init(sampler, SAMPLING_STRATEGY, samples - 1, r->prefs.sampleCount, pixIdx);
-					
-					struct color output = tex_get_px(*buf, x, y, false);
-					struct color sample = path_trace(cam_get_ray(cam, x, y, sampler), r->scene, r->prefs.bounces, sampler);
-					
-					// Clamp out fireflies - This is probably not a good way to do that.
-					nan_clamp(&sample, &output);
-
-					//And process the running average
-					output = colorCoef((float)(samples - 1), output);
-					output = colorAdd(output, sample);
-					float t = 1.0f / samples;
-					output = colorCoef(t, output);
-					
-					//Store internal render buffer (float precision)
-					tex_set_px(*buf, output, x, y);
-				}
+			if (!render_tile_pass(r, cam, tile, samplers, sample, accum.pass)) {
+				// Keep what the tile got before the render was stopped
+				tile_accum_commit(threadState->tiles, &accum, tile, *buf, samples);
+				tile_dirty_mark(r->state.dirty_tiles, tile);
+				goto exit;
 			}
+			tile_accum_add(&accum, tile, ++samples, r->state.adaptive);
 			//For performance metrics
 			total_us += v_timer_get_us(timer);
 			threadState->totalSamples++;
-			samples++;
-			tile->completed_samples++;
+			tile_sample_done(tile);
 			//Pause rendering when bool is set
 			while (threadState->paused && r->state.s == r_rendering) {
 				v_timer_sleep_ms(100);
 			}
 			threadState->avg_per_sample_us = total_us / samples;
+			if (tile_converged(r, tile, &accum))
+				break;
 		}
+		tile_accum_commit(threadState->tiles, &accum, tile, *buf, samples);
+		tile_dirty_mark(r->state.dirty_tiles, tile);
 		//Tile has finished rendering, get a new one and start rendering it.
-		tile->state = finished;
 		threadState->currentTile = NULL;
-		samples = 1;
 		tile = tile_next(threadState->tiles);
+		// Out of tiles, help with the ones still being rendered instead of idling. Adaptive
+		// sampling needs all samples of a tile in one place to tell when it has converged.
+		if (!tile && !r->state.adaptive)
+			tile = tile_steal(threadState->tiles);
 		threadState->currentTile = tile;
 	}
 exit:
-	sampler_destroy(sampler);
+	for (size_t i = 0; i < RAY_PACKET_SIZE; ++i)
+		sampler_destroy(samplers[i]);
+	tile_accum_free(&accum);
 	//No more tiles to render, exit thread. (render done)
 	threadState->thread_complete = true;
 	threadState->currentTile = NULL;
@@ -481,8 +745,6 @@ void *render_single_iteration(void *arg) {
 	struct worker *threadState = arg;
 	struct renderer *r = threadState->renderer;
 	struct texture **buf = threadState->buf;
-	// FIXME: persist this
-	sampler *sampler = sampler_new();
 
 	struct camera *cam = threadState->cam;
 
@@ -492,6 +754,12 @@ void *render_single_iteration(void *arg) {
 		threadState->thread_complete = true;
 		return NULL;
 	}
+	// FIXME: persist these
+	sampler *samplers[RAY_PACKET_SIZE];
+	for (size_t i = 0; i < RAY_PACKET_SIZE; ++i)
+		samplers[i] = sampler_new();
+	struct tile_accum accum = { 0 };
+	tile_accum_begin(&accum, tile);
 	threadState->currentTile = tile;
 
 	size_t samples = 1;
@@ -500,28 +768,13 @@ void *render_single_iteration(void *arg) {
 
 	while (samples < r->prefs.sampleCount + 1 && r->state.s == r_rendering) {
 		v_timer timer = v_timer_start();
-		for (int y = tile->end.y - 1; y > tile->begin.y - 1; --y) {
-			for (int x = tile->begin.x; x < tile->end.x; ++x) {
-				if (r->state.s != r_rendering) goto exit;
-				uint32_t pixIdx = (uint32_t)(y * (*buf)->width + x);
-				sampler_init(sampler, SAMPLING_STRATEGY, samples - 1, r->prefs.sampleCount, pixIdx);
-
-				struct color output = tex_get_px(*buf, x, y, false);
-				struct color sample = path_trace(cam_get_ray(cam, x, y, sampler), r->scene, r->prefs.bounces, sampler);
-
-				// Clamp out fireflies - This is probably not a good way to do that.
-				nan_clamp(&sample, &output);
-
-				//And process the running average
-				output = colorCoef((float)(samples - 1), output);
-				output = colorAdd(output, sample);
-				float t = 1.0f / samples;
-				output = colorCoef(t, output);
-
-				//Store internal render buffer (float precision)
-				tex_set_px(*buf, output, x, y);
-			}
+		if (!render_tile_pass(r, cam, tile, samplers, samples - 1, accum.pass)) {
+			// Keep what the tile got before the render was stopped
+			tile_accum_resolve(&accum, tile, *buf, samples - 1);
+			tile_dirty_mark(r->state.dirty_tiles, tile);
+			goto exit;
 		}
+		tile_accum_add(&accum, tile, samples, r->state.adaptive);
 		//For performance metrics
 		total_us += v_timer_get_us(timer);
 		threadState->totalSamples++;
@@ -532,11 +785,17 @@ void *render_single_iteration(void *arg) {
 		// 	timer_sleep_ms(100);
 		// }
 		threadState->avg_per_sample_us = total_us / samples;
+		if (tile_converged(r, tile, &accum))
+			break;
 	}
+	tile_accum_resolve(&accum, tile, *buf, samples - 1);
+	tile_dirty_mark(r->state.dirty_tiles, tile);
 	tile->state = finished;
 	threadState->currentTile = NULL;
 exit:
-	sampler_destroy(sampler);
+	for (size_t i = 0; i < RAY_PACKET_SIZE; ++i)
+		sampler_destroy(samplers[i]);
+	tile_accum_free(&accum);
 	threadState->currentTile = NULL;
 	return 0;
 }
@@ -549,6 +808,7 @@ struct prefs default_prefs(void) {
 			.bounces = 20,
 			.tileWidth = 32,
 			.tileHeight = 32,
+			.adaptive_min_samples = 16,
 	};
 }
 
@@ -556,6 +816,8 @@ struct renderer *renderer_new(void) {
 	struct renderer *r = calloc(1, sizeof(*r));
 	r->prefs = default_prefs();
 	r->state.finishedPasses = 1;
+	r->state.snapshots = snapshots_new();
+	r->state.dirty_tiles = tile_dirty_new();
 	r->scene = scene_new();
 	return r;
 }
@@ -568,5 +830,7 @@ void renderer_destroy(struct renderer *r) {
 	v_arr_free(r->state.clients);
 	if (r->prefs.node_list) free(r->prefs.node_list);
 	if (r->state.result_buf) tex_destroy(r->state.result_buf);
+	snapshots_destroy(r->state.snapshots);
+	tile_dirty_destroy(r->state.dirty_tiles);
 	free(r);
 }
@@ -12,6 +12,7 @@
 #include <c-ray/c-ray.h>
 #include <datatypes/tile.h>
 #include <protocol/server.h>
+#include "snapshot.h"
 
 struct worker {
 	v_thread_ctx thread_ctx;
@@ -59,6 +60,10 @@ struct state {
 
 	struct texture *result_buf;
 	struct tile_set *current_set;
+	struct snapshots *snapshots; // Per-pass copies of result_buf, for interactive mode
+	struct tile_dirty_set *dirty_tiles; // Tiles of result_buf written since the last cr_renderer_get_dirty_tiles()
+	bool adaptive; // Adaptive sampling is enabled for the current render
+	v_timer render_started; // For prefs.time_limit_ms
 };
 
 /// Preferences data (Set by user)
@@ -78,12 +83,16 @@ struct prefs {
 	char *node_list;
 	bool interactive;
 	bool blender_mode;
+	float adaptive_threshold; // 0 to disable
+	size_t adaptive_min_samples;
+	uint64_t time_limit_ms; // 0 to disable
 };
 
 struct renderer {
 	struct world *scene; //Scene to render
 	struct state state;  //Internal state
 	struct prefs prefs;  //User prefs
+	char pref_str[32];   //Returned by cr_renderer_get_str_pref() for prefs not stored as strings
 };
 
 struct renderer *renderer_new(void);
@@ -94,4 +103,7 @@ void renderer_destroy(struct renderer *r);
 // Exposed for now, so API calls can synchronously ensure the BVH is up to date
 void update_toplevel_bvh(struct world *s);
 
+// True if this is a time-limited render, and the time is up
+bool renderer_time_is_up(const struct renderer *r);
+
 struct prefs default_prefs(void); // TODO: Remove
@@ -0,0 +1,163 @@
+//
+//  snapshot.c
+//  c-ray
+//
+//  Created by agent on 18/10/2026.
+//  Copyright © 2026 agent. All rights reserved.
+//
+
+#include "../../includes.h"
+#include "snapshot.h"
+
+#include <string.h>
+#include <common/texture.h>
+#include <datatypes/tile.h>
+
+static void snapshot_free(struct snapshot *snap) {
+	if (snap->tex) tex_destroy(snap->tex);
+	if (snap->tile_pass) free(snap->tile_pass);
+	*snap = (struct snapshot){ 0 };
+}
+
+static void snapshot_swap(struct snapshot *a, struct snapshot *b) {
+	struct snapshot tmp = *a;
+	*a = *b;
+	*b = tmp;
+}
+
+struct snapshots *snapshots_new(void) {
+	struct snapshots *s = calloc(1, sizeof(*s));
+	s->lock = v_mutex_create();
+	s->published = v_cond_create();
+	return s;
+}
+
+void snapshots_destroy(struct snapshots *s) {
+	if (!s) return;
+	snapshot_free(&s->back);
+	snapshot_free(&s->ready);
+	snapshot_free(&s->front);
+	if (s->retired) tex_destroy(s->retired);
+	v_arr_free(s->tiles);
+	v_cond_destroy(s->published);
+	v_mutex_destroy(s->lock);
+	free(s);
+}
+
+static void snapshot_resize(struct snapshot *snap, size_t width, size_t height, size_t tile_count, bool keep_tex) {
+	if (!snap->tex || snap->tex->width != width || snap->tex->height != height) {
+		if (snap->tex && !keep_tex) tex_destroy(snap->tex);
+		snap->tex = tex_new(float_p, width, height, 4);
+	}
+	if (snap->tile_pass) free(snap->tile_pass);
+	snap->tile_pass = calloc(tile_count, sizeof(*snap->tile_pass));
+	snap->pass = 0;
+}
+
+static void reset_locked(struct snapshots *s, size_t width, size_t height, const struct render_tile *tiles, size_t tile_count) {
+	snapshot_resize(&s->back, width, height, tile_count, false);
+	snapshot_resize(&s->ready, width, height, tile_count, false);
+	// The reader may still be looking at the front buffer, so if it needs
+	// to be reallocated, hang on to it until the next acquire.
+	struct texture *old_front = s->front.tex;
+	snapshot_resize(&s->front, width, height, tile_count, true);
+	if (old_front && old_front != s->front.tex) {
+		// If there's already a retired one, the reader never got to see this front
+		if (s->retired) tex_destroy(old_front);
+		else s->retired = old_front;
+	}
+	v_arr_free(s->tiles);
+	v_arr_add_n(s->tiles, tiles, tile_count);
+	s->tile_count = tile_count;
+	s->pending = tile_count;
+	s->back_pass = 1;
+	s->generation++;
+}
+
+void snapshots_reset(struct snapshots *s, size_t width, size_t height, const struct render_tile *tiles) {
+	if (!s) return;
+	v_mutex_lock(s->lock);
+	s->enabled = true;
+	reset_locked(s, width, height, tiles, v_arr_len(tiles));
+	v_mutex_release(s->lock);
+}
+
+static void copy_tile(struct texture *dst, const struct texture *src, const struct render_tile *tile) {
+	// Textures are stored bottom-up, see tex_set_px()
+	const size_t row_bytes = tile->width * src->channels * sizeof(float);
+	for (int y = tile->begin.y; y < tile->end.y; ++y) {
+		const size_t offset = (tile->begin.x + (src->height - (y + 1)) * src->width) * src->channels;
+		memcpy(dst->data.float_p + offset, src->data.float_p + offset, row_bytes);
+	}
+}
+
+void snapshots_tile_done(struct snapshots *s, size_t generation, const struct render_tile *tile, size_t pass, const struct texture *src) {
+	if (!s || !s->enabled) return;
+	v_mutex_lock(s->lock);
+	if (!s->enabled || generation != s->generation || (size_t)tile->index >= s->tile_count
+		|| src->width != s->back.tex->width || src->height != s->back.tex->height) {
+		v_mutex_release(s->lock);
+		return;
+	}
+	copy_tile(s->back.tex, src, tile);
+	size_t *tile_pass = &s->back.tile_pass[tile->index];
+	if (*tile_pass < s->back_pass && pass >= s->back_pass)
+		s->pending--;
+	*tile_pass = pass;
+	if (!s->pending) {
+		// Every tile in back is now from at least back_pass, publish it.
+		s->back.pass = s->back_pass++;
+		snapshot_swap(&s->back, &s->ready);
+		s->back.pass = 0;
+		s->pending = 0;
+		for (size_t i = 0; i < s->tile_count; ++i) {
+			if (s->back.tile_pass[i] >= s->back_pass) continue;
+			// Tiles that already finished the next pass won't come around again
+			// until the one after that, so carry them over from what we just published.
+			if (s->ready.tile_pass[i] >= s->back_pass) {
+				copy_tile(s->back.tex, s->ready.tex, &s->tiles[i]);
+				s->back.tile_pass[i] = s->ready.tile_pass[i];
+				continue;
+			}
+			s->pending++;
+		}
+		v_cond_broadcast(s->published);
+	}
+	v_mutex_release(s->lock);
+}
+
+const struct texture *snapshots_acquire(struct snapshots *s, size_t after_pass, long timeout_ms, size_t *pass) {
+	if (!s) return NULL;
+	v_timer now = v_timer_start();
+	const long long deadline_us = (long long)now.tv_sec * 1000000 + now.tv_usec + (long long)timeout_ms * 1000;
+	const struct timespec deadline = {
+		.tv_sec = deadline_us / 1000000,
+		.tv_nsec = (deadline_us % 1000000) * 1000,
+	};
+	v_mutex_lock(s->lock);
+	if (s->retired) {
+		tex_destroy(s->retired);
+		s->retired = NULL;
+	}
+	for (;;) {
+		// Passes start over after a reset
+		if (s->reader_generation != s->generation)
+			after_pass = 0;
+		if (timeout_ms <= 0 || s->ready.pass > after_pass || s->front.pass > after_pass)
+			break;
+		if (v_cond_timedwait(s->published, s->lock, &deadline))
+			break;
+	}
+	if (s->ready.pass > s->front.pass) {
+		snapshot_swap(&s->front, &s->ready);
+		s->ready.pass = 0;
+	}
+	const struct texture *ret = NULL;
+	if (s->front.pass > after_pass) {
+		ret = s->front.tex;
+		if (pass) *pass = s->front.pass;
+		s->reader_generation = s->generation;
+	}
+	v_mutex_release(s->lock);
+	return ret;
+}
@@ -0,0 +1,60 @@
+//
+//  snapshot.h
+//  c-ray
+//
+//  Created by agent on 18/10/2026.
+//  Copyright © 2026 agent. All rights reserved.
+//
+
+#pragma once
+
+#include <v.h>
+#include <stdbool.h>
+#include <stddef.h>
+
+struct texture;
+struct render_tile;
+
+// Pass-consistent copies of the interactive result buffer, for readers that
+// want progressive frames without racing the render threads.
+// Render threads copy each tile they finish into the back buffer. Once every tile
+// there is from at least the pass being collected, back and ready get swapped.
+// Readers swap ready to the front, so neither side ever holds the lock for longer
+// than a tile copy or a pointer swap.
+
+struct snapshot {
+	struct texture *tex;
+	size_t *tile_pass; // Pass each tile in tex was last copied from
+	size_t pass;       // Every tile in tex is from at least this pass. 0 if incomplete
+};
+
+struct snapshots {
+	v_mutex *lock;
+	v_cond *published;
+	bool enabled;
+	struct snapshot back;
+	struct snapshot ready;
+	struct snapshot front;
+	struct texture *retired; // Old front after a resize, freed on next acquire
+	struct render_tile *tiles; // Copy of tile rects, indexed like tile->index
+	size_t tile_count;
+	size_t pending;    // Tiles in back still older than back_pass
+	size_t back_pass;
+	size_t generation; // Bumped on reset, to discard tiles rendered before it
+	size_t reader_generation; // Generation of the last snapshot handed to the reader
+};
+
+struct snapshots *snapshots_new(void);
+void snapshots_destroy(struct snapshots *s);
+
+// Clear everything and size buffers to match. Snapshots are collected after the first reset.
+void snapshots_reset(struct snapshots *s, size_t width, size_t height, const struct render_tile *tiles);
+
+// Called by render threads when a tile finished a pass. generation is the value of
+// s->generation when the tile was started.
+void snapshots_tile_done(struct snapshots *s, size_t generation, const struct render_tile *tile, size_t pass, const struct texture *src);
+
+// Wait up to timeout_ms (if > 0) for a pass newer than after_pass. Returns the front buffer and stores
+// its pass in *pass, or returns NULL on timeout. The texture stays valid until the next call.
+// If there was a reset since the last returned snapshot, after_pass is treated as 0.
+const struct texture *snapshots_acquire(struct snapshots *s, size_t after_pass, long timeout_ms, size_t *pass);
@@ -0,0 +1,145 @@
+//
+//  stats.c
+//  c-ray
+//
+//  Created by agent on 18/10/2026.
+//  Copyright © 2026 agent. All rights reserved.
+//
+
+#include "../../includes.h"
+#include "stats.h"
+
+#include <common/texture.h>
+#include <common/mempool.h>
+#include <common/cr_string.h>
+#include <common/hashtable.h>
+#include <datatypes/scene.h>
+#include <datatypes/mesh.h>
+#include <datatypes/sphere.h>
+#include <accelerators/bvh.h>
+#include "renderer.h"
+#include "snapshot.h"
+
+// Entry of timing_index
+struct timing_key {
+	enum cr_phase phase;
+	const char *name;
+	size_t idx; // In timings
+};
+
+static bool compare_timing_keys(const void *a, const void *b) {
+	const struct timing_key *ka = a, *kb = b;
+	if (ka->phase != kb->phase) return false;
+	if (!ka->name || !kb->name) return ka->name == kb->name;
+	return stringEquals(ka->name, kb->name);
+}
+
+struct stats *stats_new(void) {
+	struct stats *s = calloc(1, sizeof(*s));
+	s->lock = v_mutex_create();
+	s->timing_index = newHashtable(compare_timing_keys, NULL);
+	return s;
+}
+
+void stats_destroy(struct stats *s) {
+	if (!s) return;
+	for (size_t i = 0; i < v_arr_len(s->timings); ++i)
+		free((char *)s->timings[i].name);
+	v_arr_free(s->timings);
+	v_arr_free(s->handed_out);
+	destroyHashtable(s->timing_index);
+	v_mutex_destroy(s->lock);
+	free(s);
+}
+
+void stats_add_timing(struct stats *s, enum cr_phase phase, const char *name, uint64_t us) {
+	if (!s) return;
+	struct timing_key key = { .phase = phase, .name = name };
+	const uint32_t hash = hashString(hashBytes(hashInit(), &phase, sizeof(phase)), name ? name : "");
+	v_mutex_lock(s->lock);
+	const struct timing_key *found = findInHashtable(s->timing_index, &key, hash);
+	if (found) {
+		s->timings[found->idx].us += us;
+		s->timings[found->idx].count++;
+	} else {
+		key.idx = v_arr_add(s->timings, (struct cr_timing){
+			.phase = phase,
+			.name = name ? stringCopy(name) : NULL,
+			.us = us,
+			.count = 1,
+		});
+		key.name = s->timings[key.idx].name;
+		forceInsertInHashtable(s->timing_index, &key, sizeof(key), hash);
+	}
+	v_mutex_release(s->lock);
+}
+
+static void update_peaks(struct stats *s) {
+	for (size_t i = 0; i < cr_mem_category_count; ++i) {
+		const int64_t bytes = s->resident_bytes[i] + s->scratch_bytes[i];
+		if (bytes > 0 && (uint64_t)bytes > s->peak_bytes[i])
+			s->peak_bytes[i] = bytes;
+	}
+}
+
+void stats_add_memory(struct stats *s, enum cr_mem_category category, int64_t resident, int64_t scratch) {
+	if (!s) return;
+	v_mutex_lock(s->lock);
+	s->resident_bytes[category] += resident;
+	s->scratch_bytes[category] += scratch;
+	update_peaks(s);
+	v_mutex_release(s->lock);
+}
+
+void stats_sample_memory(struct renderer *r) {
+	struct world *scene = r->scene;
+	if (!scene->stats) return;
+	uint64_t bytes[cr_mem_category_count] = { 0 };
+
+	v_rwlock_read_lock(scene->bvh_lock);
+	for (size_t i = 0; i < v_arr_len(scene->meshes); ++i) {
+		const struct mesh *m = &scene->meshes[i];
+		bytes[cr_mem_geometry] += vbuf_bytes(&m->vbuf);
+		bytes[cr_mem_geometry] += v_arr_len(m->polygons) * sizeof(*m->polygons);
+		bytes[cr_mem_bvh] += bvh_bytes(m->bvh);
+	}
+	bytes[cr_mem_geometry] += v_arr_len(scene->spheres) * sizeof(*scene->spheres);
+	bytes[cr_mem_geometry] += v_arr_len(scene->instances) * sizeof(*scene->instances);
+	bytes[cr_mem_bvh] += bvh_bytes(scene->topLevel);
+	v_rwlock_unlock(scene->bvh_lock);
+
+	for (size_t i = 0; i < v_arr_len(scene->textures); ++i)
+		bytes[cr_mem_textures] += tex_bytes(scene->textures[i].t);
+
+	bytes[cr_mem_node_pool] = totalBlockSize(scene->storage.node_pool);
+
+	bytes[cr_mem_framebuffer] = tex_bytes(r->state.result_buf);
+	struct snapshots *snaps = r->state.snapshots;
+	if (snaps) {
+		v_mutex_lock(snaps->lock);
+		bytes[cr_mem_framebuffer] += tex_bytes(snaps->back.tex) + tex_bytes(snaps->ready.tex) + tex_bytes(snaps->front.tex);
+		v_mutex_release(snaps->lock);
+	}
+
+	v_mutex_lock(scene->stats->lock);
+	// Anything tracked with stats_add_memory() since the last sample is part of this measurement
+	for (size_t i = 0; i < cr_mem_category_count; ++i)
+		scene->stats->resident_bytes[i] = bytes[i];
+	update_peaks(scene->stats);
+	v_mutex_release(scene->stats->lock);
+}
+
+struct cr_renderer_stats stats_get(struct stats *s) {
+	struct cr_renderer_stats out = { 0 };
+	if (!s) return out;
+	v_mutex_lock(s->lock);
+	v_arr_free(s->handed_out);
+	if (v_arr_len(s->timings))
+		v_arr_add_n(s->handed_out, s->timings, v_arr_len(s->timings));
+	out.timings = s->handed_out;
+	out.timing_count = v_arr_len(s->handed_out);
+	for (size_t i = 0; i < cr_mem_category_count; ++i)
+		out.peak_bytes[i] = s->peak_bytes[i];
+	v_mutex_release(s->lock);
+	return out;
+}
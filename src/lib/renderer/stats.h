@@ -0,0 +1,45 @@
+//
+//  stats.h
+//  c-ray
+//
+//  Created by agent on 18/10/2026.
+//  Copyright © 2026 agent. All rights reserved.
+//
+
+#pragma once
+
+#include <v.h>
+#include <c-ray/c-ray.h>
+
+struct renderer;
+
+// Machine-readable versions of the timings c-ray logs, along with memory
+// high-water marks. Background BVH builds only see the scene, so this lives there.
+
+struct stats {
+	v_mutex *lock;
+	struct cr_timing *timings; // Owns the name strings, one per phase and name
+	struct hashtable *timing_index; // Finds the entry in timings for a phase and name
+	struct cr_timing *handed_out; // Copy of timings returned by the last stats_get()
+	int64_t resident_bytes[cr_mem_category_count]; // Last stats_sample_memory(), plus what was tracked since
+	int64_t scratch_bytes[cr_mem_category_count]; // Temporary buffers of work in progress
+	uint64_t peak_bytes[cr_mem_category_count];
+};
+
+struct stats *stats_new(void);
+void stats_destroy(struct stats *s);
+
+// name is copied, and can be NULL. Repeated timings of the same phase and name, like
+// rebuilding a BVH in an interactive session, add up in one entry.
+void stats_add_timing(struct stats *s, enum cr_phase phase, const char *name, uint64_t us);
+
+// Measure current memory use of r, and update the high-water marks
+void stats_sample_memory(struct renderer *r);
+
+// Track memory allocated (positive) or freed (negative) between stats_sample_memory() calls.
+// Resident memory stays around, like a bound vertex buffer or a finished BVH. Scratch memory
+// only exists while some work is in progress, like the buffers of a BVH build.
+void stats_add_memory(struct stats *s, enum cr_mem_category category, int64_t resident, int64_t scratch);
+
+// The returned timings array stays valid until the next call
+struct cr_renderer_stats stats_get(struct stats *s);
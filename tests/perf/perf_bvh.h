@@ -0,0 +1,408 @@
+//
+//  perf_bvh.h
+//  c-ray
+//
+//  Created by agent on 18/10/2026.
+//  Copyright © 2026 agent. All rights reserved.
+//
+
+#include <v.h>
+#include <float.h>
+#include <stdio.h>
+
+#include "../../src/common/transforms.h"
+#include "../../src/common/loaders/meshloader.h"
+#include "../../src/lib/accelerators/bvh.h"
+#include "../../src/lib/datatypes/bbox.h"
+#include "../../src/lib/datatypes/hitrecord.h"
+#include "../../src/lib/datatypes/lightray.h"
+#include "../../src/lib/datatypes/mesh.h"
+#include "../../src/lib/nodes/bsdfnode.h"
+#include "../../src/lib/renderer/instance.h"
+#include "../../src/lib/vendored/pcg_basic.h"
+
+// Rays per traversal test. Coherent rays are a square image, so keep this a power of 4.
+#define PERF_RAY_COUNT (1024 * 1024)
+
+static float perf_randf(pcg32_random_t *rng) {
+	return (float)pcg32_random_r(rng) / (float)UINT32_MAX;
+}
+
+// Bumpy heightfield over [-1, 1] on x and z, with roughly tri_count triangles.
+// Neighbouring triangles are next to each other in memory, like in most real meshes.
+static struct mesh perf_grid_mesh(size_t tri_count) {
+	struct mesh mesh = { 0 };
+	const size_t quads = (size_t)sqrtf((float)tri_count / 2.0f);
+	const size_t side = quads + 1;
+	for (size_t z = 0; z < side; ++z) {
+		for (size_t x = 0; x < side; ++x) {
+			const float u = (float)x / (float)quads * 2.0f - 1.0f;
+			const float v = (float)z / (float)quads * 2.0f - 1.0f;
+			const float y = 0.1f * sinf(u * 12.0f) * cosf(v * 9.0f);
+			v_arr_add(mesh.vbuf.vertices, ((struct vector){ u, y, v }));
+		}
+	}
+	for (size_t z = 0; z < quads; ++z) {
+		for (size_t x = 0; x < quads; ++x) {
+			const int i = z * side + x;
+			v_arr_add(mesh.polygons, ((struct poly){ .vertexIndex = { i, i + 1, i + side } }));
+			v_arr_add(mesh.polygons, ((struct poly){ .vertexIndex = { i + 1, i + side + 1, i + side } }));
+		}
+	}
+	return mesh;
+}
+
+// All meshes in an OBJ file, merged into one
+static struct mesh perf_file_mesh(const char *path) {
+	struct mesh mesh = { 0 };
+	struct mesh_parse_result result = load_meshes_from_file(path);
+	mesh.vbuf = result.geometry;
+	for (size_t i = 0; i < v_arr_len(result.meshes); ++i) {
+		struct cr_face *faces = result.meshes[i].faces;
+		for (size_t f = 0; f < v_arr_len(faces); ++f) {
+			struct poly p = { 0 };
+			memcpy(p.vertexIndex, faces[f].vertex_idx, sizeof(p.vertexIndex));
+			v_arr_add(mesh.polygons, p);
+		}
+		ext_mesh_free(&result.meshes[i]);
+	}
+	v_arr_free(result.meshes);
+	for (size_t i = 0; i < v_arr_len(result.materials); ++i) {
+		if (result.materials[i].name) free(result.materials[i].name);
+		if (result.materials[i].mat) cr_shader_node_free(result.materials[i].mat);
+	}
+	v_arr_free(result.materials);
+	return mesh;
+}
+
+static time_t perf_build(struct mesh *mesh) {
+	if (!v_arr_len(mesh->polygons)) {
+		snprintf(perf_report, sizeof(perf_report), "no mesh to build, skipped");
+		return 0;
+	}
+	// Created up front, like the scene's build pool
+	v_threadpool *pool = v_threadpool_create(v_sys_get_cores());
+	v_timer timer = v_timer_start();
+	mesh->bvh = build_mesh_bvh(mesh, pool);
+	time_t us = v_timer_get_us(timer);
+	v_threadpool_wait(pool);
+	v_threadpool_destroy(pool);
+	size_t node_count = 0;
+	bvh_nodes(mesh->bvh, &node_count);
+	snprintf(perf_report, sizeof(perf_report), "%zu tris, %zu nodes", v_arr_len(mesh->polygons), node_count);
+	return us;
+}
+
+// Pinhole camera looking down at the bounding box, with rays in scanline order
+static struct lightRay *perf_coherent_rays(struct boundingBox bbox) {
+	struct lightRay *rays = calloc(PERF_RAY_COUNT, sizeof(*rays));
+	const size_t width = (size_t)sqrtf((float)PERF_RAY_COUNT);
+	const struct vector center = bboxCenter(&bbox);
+	const float radius = vec_length(vec_sub(bbox.max, bbox.min)) * 0.5f;
+	const struct vector dir = vec_normalize((struct vector){ 0.3f, -0.6f, 1.0f });
+	const struct vector origin = vec_sub(center, vec_scale(dir, radius * 2.0f));
+	const struct vector right = vec_normalize(vec_cross((struct vector){ 0.0f, 1.0f, 0.0f }, dir));
+	const struct vector up = vec_cross(dir, right);
+	for (size_t i = 0; i < PERF_RAY_COUNT; ++i) {
+		const float u = ((float)(i % width) + 0.5f) / (float)width * 2.0f - 1.0f;
+		const float v = ((float)(i / width) + 0.5f) / (float)width * 2.0f - 1.0f;
+		const struct vector target = vec_add(center, vec_add(vec_scale(right, u * radius), vec_scale(up, v * radius)));
+		rays[i] = (struct lightRay){ .start = origin, .direction = vec_normalize(vec_sub(target, origin)) };
+	}
+	return rays;
+}
+
+// Random origins inside the bounding box, random directions
+static struct lightRay *perf_incoherent_rays(struct boundingBox bbox) {
+	struct lightRay *rays = calloc(PERF_RAY_COUNT, sizeof(*rays));
+	pcg32_random_t rng;
+	pcg32_srandom_r(&rng, 1337, 0);
+	const struct vector extent = vec_sub(bbox.max, bbox.min);
+	for (size_t i = 0; i < PERF_RAY_COUNT; ++i) {
+		const struct vector start = {
+			bbox.min.x + perf_randf(&rng) * extent.x,
+			bbox.min.y + perf_randf(&rng) * extent.y,
+			bbox.min.z + perf_randf(&rng) * extent.z,
+		};
+		struct vector dir;
+		do {
+			dir = (struct vector){ perf_randf(&rng) * 2.0f - 1.0f, perf_randf(&rng) * 2.0f - 1.0f, perf_randf(&rng) * 2.0f - 1.0f };
+		} while (vec_dot(dir, dir) > 1.0f || vec_dot(dir, dir) < 0.0001f);
+		rays[i] = (struct lightRay){ .start = start, .direction = vec_normalize(dir) };
+	}
+	return rays;
+}
+
+static void perf_report_rays(time_t us, size_t hits) {
+	snprintf(perf_report, sizeof(perf_report), "%.2f Mrays/s, %.1f%% hit",
+		(double)PERF_RAY_COUNT / (double)(us ? us : 1), 100.0 * (double)hits / PERF_RAY_COUNT);
+}
+
+// Gather packet number block of the coherent rays, blocks of RAY_PACKET_DIM x RAY_PACKET_DIM pixels
+static void perf_fill_packet(struct ray_packet *packet, struct hitRecord *isects, const struct lightRay *rays, size_t block) {
+	const size_t width = (size_t)sqrtf((float)PERF_RAY_COUNT);
+	const size_t blocks_x = width / RAY_PACKET_DIM;
+	const size_t x0 = (block % blocks_x) * RAY_PACKET_DIM;
+	const size_t y0 = (block / blocks_x) * RAY_PACKET_DIM;
+	packet->count = 0;
+	for (size_t y = y0; y < y0 + RAY_PACKET_DIM; ++y) {
+		for (size_t x = x0; x < x0 + RAY_PACKET_DIM; ++x) {
+			const size_t lane = packet->count++;
+			packet->rays[lane] = rays[y * width + x];
+			packet->samplers[lane] = NULL;
+			isects[lane] = (struct hitRecord){ .incident = &packet->rays[lane], .instIndex = -1, .distance = FLT_MAX };
+			packet->isects[lane] = &isects[lane];
+		}
+	}
+}
+
+static time_t perf_traverse_mesh_packets(struct mesh *mesh) {
+	mesh->bvh = build_mesh_bvh(mesh, NULL);
+	struct lightRay *rays = perf_coherent_rays(get_root_bbox(mesh->bvh));
+	struct ray_packet packet;
+	struct hitRecord isects[RAY_PACKET_SIZE];
+	size_t hits = 0;
+	v_timer timer = v_timer_start();
+	for (size_t b = 0; b < PERF_RAY_COUNT / RAY_PACKET_SIZE; ++b) {
+		perf_fill_packet(&packet, isects, rays, b);
+		hits += lane_count(traverse_bottom_level_bvh_packet(mesh, &packet, lanes_first(packet.count)));
+	}
+	time_t us = v_timer_get_us(timer);
+	perf_report_rays(us, hits);
+	free(rays);
+	mesh_free(mesh);
+	return us;
+}
+
+static time_t perf_traverse_mesh(struct mesh *mesh, bool coherent) {
+	if (!v_arr_len(mesh->polygons)) {
+		snprintf(perf_report, sizeof(perf_report), "no mesh to traverse, skipped");
+		mesh_free(mesh);
+		return 0;
+	}
+	mesh->bvh = build_mesh_bvh(mesh, NULL);
+	struct boundingBox bbox = get_root_bbox(mesh->bvh);
+	struct lightRay *rays = coherent ? perf_coherent_rays(bbox) : perf_incoherent_rays(bbox);
+	size_t hits = 0;
+	v_timer timer = v_timer_start();
+	for (size_t i = 0; i < PERF_RAY_COUNT; ++i) {
+		struct hitRecord isect = { .incident = &rays[i], .instIndex = -1, .distance = FLT_MAX };
+		hits += traverse_bottom_level_bvh(mesh, &rays[i], &isect, NULL);
+	}
+	time_t us = v_timer_get_us(timer);
+	perf_report_rays(us, hits);
+	free(rays);
+	mesh_free(mesh);
+	return us;
+}
+
+// A field of randomly placed and rotated copies of a small mesh
+struct perf_instances {
+	struct mesh *meshes;
+	struct instance *instances;
+	const struct bsdfNode *bsdfs[1];
+	struct bsdf_buffer bbuf;
+};
+
+static void perf_instances_init(struct perf_instances *s, size_t count) {
+	*s = (struct perf_instances){ 0 };
+	s->bbuf.bsdfs = s->bsdfs;
+	struct mesh mesh = perf_grid_mesh(2000);
+	mesh.bvh = build_mesh_bvh(&mesh, NULL);
+	v_arr_add(s->meshes, mesh);
+	pcg32_random_t rng;
+	pcg32_srandom_r(&rng, 1337, 0);
+	const float spread = sqrtf((float)count);
+	for (size_t i = 0; i < count; ++i) {
+		struct instance instance = new_mesh_instance(&s->meshes, 0, NULL, NULL);
+		struct transform translate = tform_new_translate(
+			(perf_randf(&rng) * 2.0f - 1.0f) * spread,
+			perf_randf(&rng),
+			(perf_randf(&rng) * 2.0f - 1.0f) * spread);
+		struct transform rotate = tform_new_rot(perf_randf(&rng) * 6.28f, perf_randf(&rng) * 6.28f, perf_randf(&rng) * 6.28f);
+		instance.composite.A = mat_mul(translate.A, rotate.A);
+		instance.composite.Ainv = mat_invert(instance.composite.A);
+		instance.bbuf = &s->bbuf;
+		v_arr_add(s->instances, instance);
+	}
+}
+
+static void perf_instances_free(struct perf_instances *s) {
+	mesh_free(&s->meshes[0]);
+	v_arr_free(s->meshes);
+	v_arr_free(s->instances);
+}
+
+static time_t perf_traverse_instances(size_t count, bool coherent) {
+	struct perf_instances s;
+	perf_instances_init(&s, count);
+	struct bvh *top_level = build_top_level_bvh(s.instances, NULL);
+	struct boundingBox bbox = get_root_bbox(top_level);
+	struct lightRay *rays = coherent ? perf_coherent_rays(bbox) : perf_incoherent_rays(bbox);
+	size_t hits = 0;
+	v_timer timer = v_timer_start();
+	for (size_t i = 0; i < PERF_RAY_COUNT; ++i) {
+		struct hitRecord isect = { .incident = &rays[i], .instIndex = -1, .distance = FLT_MAX };
+		hits += traverse_top_level_bvh(s.instances, top_level, &rays[i], &isect, NULL);
+	}
+	time_t us = v_timer_get_us(timer);
+	perf_report_rays(us, hits);
+	free(rays);
+	destroy_bvh(top_level);
+	perf_instances_free(&s);
+	return us;
+}
+
+static time_t perf_traverse_instances_packets(size_t count) {
+	struct perf_instances s;
+	perf_instances_init(&s, count);
+	struct bvh *top_level = build_top_level_bvh(s.instances, NULL);
+	struct lightRay *rays = perf_coherent_rays(get_root_bbox(top_level));
+	struct ray_packet packet;
+	struct hitRecord isects[RAY_PACKET_SIZE];
+	size_t hits = 0;
+	v_timer timer = v_timer_start();
+	for (size_t b = 0; b < PERF_RAY_COUNT / RAY_PACKET_SIZE; ++b) {
+		perf_fill_packet(&packet, isects, rays, b);
+		hits += lane_count(traverse_top_level_bvh_packet(s.instances, top_level, &packet, lanes_first(packet.count)));
+	}
+	time_t us = v_timer_get_us(timer);
+	perf_report_rays(us, hits);
+	free(rays);
+	destroy_bvh(top_level);
+	perf_instances_free(&s);
+	return us;
+}
+
+time_t bvh_build_10k(void) {
+	struct mesh mesh = perf_grid_mesh(10000);
+	time_t us = perf_build(&mesh);
+	mesh_free(&mesh);
+	return us;
+}
+
+time_t bvh_build_100k(void) {
+	struct mesh mesh = perf_grid_mesh(100000);
+	time_t us = perf_build(&mesh);
+	mesh_free(&mesh);
+	return us;
+}
+
+time_t bvh_build_1m(void) {
+	struct mesh mesh = perf_grid_mesh(1000000);
+	time_t us = perf_build(&mesh);
+	mesh_free(&mesh);
+	return us;
+}
+
+time_t bvh_build_10m(void) {
+	struct mesh mesh = perf_grid_mesh(10000000);
+	time_t us = perf_build(&mesh);
+	mesh_free(&mesh);
+	return us;
+}
+
+time_t bvh_build_teapot(void) {
+	struct mesh mesh = perf_file_mesh("input/teapot.obj");
+	time_t us = perf_build(&mesh);
+	mesh_free(&mesh);
+	return us;
+}
+
+time_t bvh_build_venus(void) {
+	struct mesh mesh = perf_file_mesh("input/venusscaled.obj");
+	time_t us = perf_build(&mesh);
+	mesh_free(&mesh);
+	return us;
+}
+
+time_t bvh_build_top_level(void) {
+	struct perf_instances s;
+	perf_instances_init(&s, 100000);
+	v_threadpool *pool = v_threadpool_create(v_sys_get_cores());
+	v_timer timer = v_timer_start();
+	struct bvh *top_level = build_top_level_bvh(s.instances, pool);
+	time_t us = v_timer_get_us(timer);
+	v_threadpool_wait(pool);
+	v_threadpool_destroy(pool);
+	size_t node_count = 0;
+	bvh_nodes(top_level, &node_count);
+	snprintf(perf_report, sizeof(perf_report), "%zu instances, %zu nodes", v_arr_len(s.instances), node_count);
+	destroy_bvh(top_level);
+	perf_instances_free(&s);
+	return us;
+}
+
+// One frame of a deforming mesh, every vertex moves a little
+time_t bvh_refit_1m(void) {
+	struct mesh mesh = perf_grid_mesh(1000000);
+	mesh.bvh = build_mesh_bvh(&mesh, NULL);
+	for (size_t i = 0; i < v_arr_len(mesh.vbuf.vertices); ++i) {
+		struct vector *v = &mesh.vbuf.vertices[i];
+		v->y += 0.02f * sinf(v->x * 5.0f + v->z * 3.0f);
+	}
+	v_timer timer = v_timer_start();
+	struct bvh *refit = refit_mesh_bvh(mesh.bvh, &mesh);
+	time_t us = v_timer_get_us(timer);
+	snprintf(perf_report, sizeof(perf_report), "%zu tris, %s", v_arr_len(mesh.polygons), refit ? "refitted" : "rebuild needed");
+	destroy_bvh(refit);
+	mesh_free(&mesh);
+	return us;
+}
+
+// Interactive restart after nudging every instance, like dragging a selection around in a viewport
+time_t bvh_refit_top_level_100k(void) {
+	struct perf_instances s;
+	perf_instances_init(&s, 100000);
+	struct bvh *top_level = build_top_level_bvh(s.instances, NULL);
+	for (size_t i = 0; i < v_arr_len(s.instances); ++i) {
+		struct instance *instance = &s.instances[i];
+		instance->composite.A = mat_mul(tform_new_translate(0.1f, 0.05f, 0.0f).A, instance->composite.A);
+		instance->composite.Ainv = mat_invert(instance->composite.A);
+	}
+	v_timer timer = v_timer_start();
+	struct bvh *refit = refit_top_level_bvh(top_level, s.instances);
+	time_t us = v_timer_get_us(timer);
+	snprintf(perf_report, sizeof(perf_report), "%zu instances, %s", v_arr_len(s.instances), refit ? "refitted" : "rebuild needed");
+	destroy_bvh(refit);
+	destroy_bvh(top_level);
+	perf_instances_free(&s);
+	return us;
+}
+
+time_t bvh_traverse_coherent(void) {
+	struct mesh mesh = perf_grid_mesh(1000000);
+	return perf_traverse_mesh(&mesh, true);
+}
+
+time_t bvh_traverse_incoherent(void) {
+	struct mesh mesh = perf_grid_mesh(1000000);
+	return perf_traverse_mesh(&mesh, false);
+}
+
+time_t bvh_traverse_venus_coherent(void) {
+	struct mesh mesh = perf_file_mesh("input/venusscaled.obj");
+	return perf_traverse_mesh(&mesh, true);
+}
+
+time_t bvh_traverse_venus_incoherent(void) {
+	struct mesh mesh = perf_file_mesh("input/venusscaled.obj");
+	return perf_traverse_mesh(&mesh, false);
+}
+
+time_t bvh_traverse_top_level_coherent(void) {
+	return perf_traverse_instances(10000, true);
+}
+
+time_t bvh_traverse_top_level_incoherent(void) {
+	return perf_traverse_instances(10000, false);
+}
+
+time_t bvh_traverse_coherent_packets(void) {
+	struct mesh mesh = perf_grid_mesh(1000000);
+	return perf_traverse_mesh_packets(&mesh);
+}
+
+time_t bvh_traverse_top_level_coherent_packets(void) {
+	return perf_traverse_instances_packets(10000);
+}
@@ -0,0 +1,20 @@
+#!/bin/bash
+
+if [[ $# -eq 1 ]]; then
+	suite=$1
+	count=$(./tests/perfrunner --suite "$suite" --ptcount)
+else
+	count=$(./tests/perfrunner --ptcount)
+fi
+
+echo "c-ray tiny perf test runner v0.1"
+echo "Running $count performance tests."
+
+i=0; while [ $i -le $((count - 1)) ]; do
+	if [[ -n "$suite" ]]; then
+		./tests/perfrunner --suite "$suite" --test-perf $i
+	else
+		./tests/perfrunner --test-perf $i
+	fi
+	i=$(( i + 1 ))
+done
@@ -7,20 +7,42 @@
 //
 
 static char *failed_expression;
+// Tests can put extra results here, like node or ray counts. Printed after the average runtime.
+static char perf_report[128];
 
 // Testable modules
 #include "perf_fileio.h"
 #include "perf_base64.h"
+#include "perf_bvh.h"
 
 typedef struct {
 	char *test_name;
 	time_t (*func)(void);
+	unsigned runs; // Defaults to PERF_AVG_COUNT if 0
 } perf_test;
 
 static perf_test perf_tests[] = {
 	{"fileio::load", fileio_load},
 	{"base64::bigfile_encode", base64_bigfile_encode},
 	{"base64::bigfile_decode", base64_bigfile_decode},
+	
+	{"bvh::build_10k", bvh_build_10k},
+	{"bvh::build_100k", bvh_build_100k, 10},
+	{"bvh::build_1m", bvh_build_1m, 3},
+	{"bvh::build_10m", bvh_build_10m, 1},
+	{"bvh::build_teapot", bvh_build_teapot, 10},
+	{"bvh::build_venus", bvh_build_venus, 10},
+	{"bvh::build_top_level", bvh_build_top_level, 3},
+	{"bvh::refit_1m", bvh_refit_1m, 3},
+	{"bvh::refit_top_level_100k", bvh_refit_top_level_100k, 3},
+	{"bvh::traverse_coherent", bvh_traverse_coherent, 3},
+	{"bvh::traverse_incoherent", bvh_traverse_incoherent, 3},
+	{"bvh::traverse_venus_coherent", bvh_traverse_venus_coherent, 3},
+	{"bvh::traverse_venus_incoherent", bvh_traverse_venus_incoherent, 3},
+	{"bvh::traverse_top_level_coherent", bvh_traverse_top_level_coherent, 3},
+	{"bvh::traverse_top_level_incoherent", bvh_traverse_top_level_incoherent, 3},
+	{"bvh::traverse_coherent_packets", bvh_traverse_coherent_packets, 3},
+	{"bvh::traverse_top_level_coherent_packets", bvh_traverse_top_level_coherent_packets, 3},
 };
 
 #define perf_test_count (sizeof(perf_tests) / sizeof(perf_test))
@@ -32,3 +32,30 @@ $(OBJDIR_test)/%.o: %.c
 
 clean_test:
 	rm -rf $(BIN_test) $(OBJDIR_test)
+
+# `make perf` -- Optimized build of the test runner without sanitizers, to run the tests in tests/perf
+# 'make perf suite=bvh' works here as well
+
+BIN_perf=$(BINDIR_test)/perfrunner
+OBJDIR_perf=tests/obj_perf
+OBJS_perf=$(patsubst %.c, $(OBJDIR_perf)/%.o, $(SRCS_test) $(SRCS_LIB) $(SRCS_DRIVER_test) $(SRCS_COMMON))
+$(OBJS_perf): CFLAGS += -I./src/lib/ -I./src/driver/ -I./src/common/ -DCRAY_TESTING
+DEPS_perf=$(OBJS_perf:%.o=%.d)
+
+perf: $(BIN_perf)
+	tests/perf/runner.sh $(suite)
+
+$(BIN_perf): $(OBJS_perf)
+	@mkdir -p $(@D)
+	@echo "LD $@"
+	@$(CC) $(LDFLAGS) $(OBJS_perf) -o $@ $(LDLIBS)
+
+-include $(DEPS_perf)
+
+$(OBJDIR_perf)/%.o: %.c
+	@mkdir -p '$(@D)'
+	@echo "CC $<"
+	@$(CC) $(CFLAGS) -MMD -c $< -o $@
+
+clean_perf:
+	rm -rf $(BIN_perf) $(OBJDIR_perf)
@@ -0,0 +1,376 @@
+//
+//  test_bvh.h
+//  c-ray
+//
+//  Created by agent on 18/10/2026.
+//  Copyright © 2026 agent. All rights reserved.
+//
+
+#pragma once
+
+#include <float.h>
+#include <c-ray/c-ray.h>
+
+#include "../src/lib/accelerators/bvh.h"
+#include "../src/lib/datatypes/bbox.h"
+#include "../src/lib/datatypes/hitrecord.h"
+#include "../src/lib/datatypes/lightray.h"
+#include "../src/lib/datatypes/mesh.h"
+#include "../src/lib/datatypes/poly.h"
+#include "../src/lib/datatypes/scene.h"
+#include "../src/lib/renderer/instance.h"
+#include "../src/lib/renderer/samplers/sampler.h"
+
+// Wavy grid over [-1, 1] on x and z
+static struct mesh test_grid_mesh(size_t quads) {
+	struct mesh mesh = { 0 };
+	const size_t side = quads + 1;
+	for (size_t z = 0; z < side; ++z) {
+		for (size_t x = 0; x < side; ++x) {
+			const float u = (float)x / (float)quads * 2.0f - 1.0f;
+			const float v = (float)z / (float)quads * 2.0f - 1.0f;
+			v_arr_add(mesh.vbuf.vertices, ((struct vector){ u, 0.2f * sinf(u * 7.0f) * cosf(v * 5.0f), v }));
+		}
+	}
+	for (size_t z = 0; z < quads; ++z) {
+		for (size_t x = 0; x < quads; ++x) {
+			const int i = z * side + x;
+			v_arr_add(mesh.polygons, ((struct poly){ .vertexIndex = { i, i + 1, i + side } }));
+			v_arr_add(mesh.polygons, ((struct poly){ .vertexIndex = { i + 1, i + side + 1, i + side } }));
+		}
+	}
+	mesh.bvh = build_mesh_bvh(&mesh, NULL);
+	return mesh;
+}
+
+// A block of camera rays looking down at the grid, some of them off the edge
+static void test_fill_packet(struct ray_packet *packet, struct hitRecord *isects, size_t count, float x_offset) {
+	packet->count = count;
+	for (size_t lane = 0; lane < count; ++lane) {
+		const float u = x_offset + (float)(lane % RAY_PACKET_DIM) * 0.3f;
+		const float v = (float)(lane / RAY_PACKET_DIM) * 0.3f - 0.5f;
+		packet->rays[lane] = (struct lightRay){
+			.start = { 0.0f, 2.0f, -3.0f },
+			.direction = vec_normalize(vec_sub((struct vector){ u, 0.0f, v }, (struct vector){ 0.0f, 2.0f, -3.0f })),
+		};
+		packet->samplers[lane] = NULL;
+		isects[lane] = (struct hitRecord){ .incident = &packet->rays[lane], .instIndex = -1, .distance = FLT_MAX };
+		packet->isects[lane] = &isects[lane];
+	}
+}
+
+bool bvh_packet_matches_single(void) {
+	struct mesh mesh = test_grid_mesh(32);
+	struct ray_packet packet;
+	struct hitRecord isects[RAY_PACKET_SIZE];
+	// A partial packet, a packet that partially misses, and an inactive lane
+	const float offsets[] = { -0.5f, 0.8f };
+	const size_t counts[] = { RAY_PACKET_SIZE - 3, RAY_PACKET_SIZE };
+	for (size_t t = 0; t < 2; ++t) {
+		test_fill_packet(&packet, isects, counts[t], offsets[t]);
+		const lane_mask active = lanes_first(packet.count) & ~lane_bit(1);
+		const lane_mask hits = traverse_bottom_level_bvh_packet(&mesh, &packet, active);
+		test_assert(!(hits & lane_bit(1)));
+		test_assert(isects[1].distance == FLT_MAX);
+		for (size_t lane = 0; lane < packet.count; ++lane) {
+			if (lane == 1) continue;
+			struct hitRecord single = { .incident = &packet.rays[lane], .instIndex = -1, .distance = FLT_MAX };
+			const bool hit = traverse_bottom_level_bvh(&mesh, &packet.rays[lane], &single, NULL);
+			test_assert(hit == !!(hits & lane_bit(lane)));
+			test_assert(single.distance == isects[lane].distance);
+			test_assert(single.polygon == isects[lane].polygon);
+		}
+		// Some lanes of the second packet go past the edge of the grid
+		if (t == 1) test_assert(hits != (lanes_first(packet.count) & ~lane_bit(1)));
+	}
+	mesh_free(&mesh);
+	return true;
+}
+
+bool bvh_packet_top_level(void) {
+	struct mesh *meshes = NULL;
+	v_arr_add(meshes, test_grid_mesh(16));
+	const struct bsdfNode *bsdfs[1] = { NULL };
+	struct bsdf_buffer bbuf = { .bsdfs = (const struct bsdfNode **)bsdfs };
+	struct instance *instances = NULL;
+	// Two overlapping copies, one of them moved up, so lanes hit different instances
+	for (size_t i = 0; i < 2; ++i) {
+		struct instance instance = new_mesh_instance(&meshes, 0, NULL, NULL);
+		struct transform move = tform_new_translate(i * 0.7f, i * 0.3f, 0.0f);
+		instance.composite = move;
+		instance.bbuf = &bbuf;
+		v_arr_add(instances, instance);
+	}
+	struct bvh *top_level = build_top_level_bvh(instances, NULL);
+
+	struct ray_packet packet;
+	struct hitRecord isects[RAY_PACKET_SIZE];
+	test_fill_packet(&packet, isects, RAY_PACKET_SIZE, -0.9f);
+	const lane_mask hits = traverse_top_level_bvh_packet(instances, top_level, &packet, lanes_first(packet.count));
+	bool seen[2] = { false, false };
+	for (size_t lane = 0; lane < packet.count; ++lane) {
+		struct hitRecord single = { .incident = &packet.rays[lane], .instIndex = -1, .distance = FLT_MAX };
+		const bool hit = traverse_top_level_bvh(instances, top_level, &packet.rays[lane], &single, NULL);
+		test_assert(hit == !!(hits & lane_bit(lane)));
+		test_assert(single.instIndex == isects[lane].instIndex);
+		test_assert(single.distance == isects[lane].distance);
+		test_assert(vec_equals(single.hitPoint, isects[lane].hitPoint));
+		if (isects[lane].instIndex >= 0) seen[isects[lane].instIndex] = true;
+	}
+	test_assert(seen[0] && seen[1]);
+
+	destroy_bvh(top_level);
+	v_arr_free(instances);
+	mesh_free(&meshes[0]);
+	v_arr_free(meshes);
+	return true;
+}
+
+static void test_place_instance(struct instance *instance, size_t slot, float y) {
+	instance->composite = tform_new_translate((slot % 8) * 2.5f, y, (slot / 8) * 2.5f);
+}
+
+static bool test_same_top_level_hits(const struct instance *instances, const struct bvh *a, const struct bvh *b) {
+	// Rays straight down onto the block of instances
+	for (size_t i = 0; i < 256; ++i) {
+		struct lightRay ray = {
+			.start = { (i % 16) * 1.25f - 0.9f, 3.0f, (i / 16) * 1.25f - 0.9f },
+			.direction = { 0.0f, -1.0f, 0.0f },
+		};
+		struct hitRecord hit_a = { .incident = &ray, .instIndex = -1, .distance = FLT_MAX };
+		struct hitRecord hit_b = { .incident = &ray, .instIndex = -1, .distance = FLT_MAX };
+		if (traverse_top_level_bvh(instances, a, &ray, &hit_a, NULL) != traverse_top_level_bvh(instances, b, &ray, &hit_b, NULL))
+			return false;
+		if (hit_a.instIndex != hit_b.instIndex || hit_a.distance != hit_b.distance)
+			return false;
+	}
+	return true;
+}
+
+bool bvh_refit_top_level(void) {
+	struct mesh *meshes = NULL;
+	v_arr_add(meshes, test_grid_mesh(8));
+	const struct bsdfNode *bsdfs[1] = { NULL };
+	struct bsdf_buffer bbuf = { .bsdfs = (const struct bsdfNode **)bsdfs };
+	struct instance *instances = NULL;
+	for (size_t i = 0; i < 64; ++i) {
+		struct instance instance = new_mesh_instance(&meshes, 0, NULL, NULL);
+		test_place_instance(&instance, i, 0.0f);
+		instance.bbuf = &bbuf;
+		v_arr_add(instances, instance);
+	}
+	struct bvh *top_level = build_top_level_bvh(instances, NULL);
+
+	// Small moves get refitted, and trace the same as a fresh build
+	test_place_instance(&instances[5], 5, 0.5f);
+	test_place_instance(&instances[6], 6, -0.3f);
+	struct bvh *refit = refit_top_level_bvh(top_level, instances);
+	test_assert(refit);
+	struct bvh *rebuilt = build_top_level_bvh(instances, NULL);
+	test_assert(test_same_top_level_hits(instances, refit, rebuilt));
+	destroy_bvh(rebuilt);
+	destroy_bvh(top_level);
+	top_level = refit;
+
+	// Scrambling every instance makes the old tree useless
+	for (size_t i = 0; i < 64; ++i)
+		test_place_instance(&instances[i], (i * 27) % 64, 0.0f);
+	test_assert(!refit_top_level_bvh(top_level, instances));
+
+	// So does adding instances
+	v_arr_add(instances, instances[0]);
+	test_assert(!refit_top_level_bvh(top_level, instances));
+
+	destroy_bvh(top_level);
+	v_arr_free(instances);
+	mesh_free(&meshes[0]);
+	v_arr_free(meshes);
+	return true;
+}
+
+// Closest hit found by testing every polygon
+static bool test_brute_force_hit(const struct mesh *mesh, const struct lightRay *ray, struct hitRecord *isect) {
+	bool found = false;
+	for (size_t i = 0; i < v_arr_len(mesh->polygons); ++i) {
+		if (rayIntersectsWithPolygon(mesh, ray, &mesh->polygons[i], isect))
+			found = true;
+	}
+	return found;
+}
+
+bool bvh_matches_brute_force(void) {
+	// A single leaf, and a mesh deep enough to get nested wide nodes with partially filled ones at the bottom
+	const size_t sizes[] = { 1, 32 };
+	sampler *sampler = sampler_new();
+	for (size_t s = 0; s < 2; ++s) {
+		struct mesh mesh = test_grid_mesh(sizes[s]);
+		size_t hits = 0;
+		for (size_t i = 0; i < 512; ++i) {
+			sampler_init(sampler, Random, (int)i, 512, (int)i * 3);
+			// Random rays from around the grid, and every fourth one straight down onto it
+			struct lightRay ray = {
+				.start = vec_scale(vec_on_unit_sphere(sampler), 2.5f),
+				.direction = vec_on_unit_sphere(sampler),
+			};
+			if (i % 4 == 0) {
+				ray.start = (struct vector){ ray.start.x * 0.3f, 1.0f, ray.start.z * 0.3f };
+				ray.direction = (struct vector){ 0.0f, -1.0f, 0.0f };
+			}
+			struct hitRecord bvh_hit = { .incident = &ray, .instIndex = -1, .distance = FLT_MAX };
+			struct hitRecord brute_hit = { .incident = &ray, .instIndex = -1, .distance = FLT_MAX };
+			const bool hit = traverse_bottom_level_bvh(&mesh, &ray, &bvh_hit, NULL);
+			test_assert(hit == test_brute_force_hit(&mesh, &ray, &brute_hit));
+			test_assert(bvh_hit.distance == brute_hit.distance);
+			hits += hit;
+		}
+		test_assert(hits > 100);
+		mesh_free(&mesh);
+	}
+	sampler_destroy(sampler);
+	return true;
+}
+
+bool bvh_refit_mesh(void) {
+	struct mesh mesh = test_grid_mesh(32);
+	// Ripple the grid, and check the refitted tree still finds the closest hits
+	for (size_t i = 0; i < v_arr_len(mesh.vbuf.vertices); ++i) {
+		struct vector *v = &mesh.vbuf.vertices[i];
+		v->y += 0.1f * sinf(v->x * 4.0f + v->z * 3.0f);
+	}
+	struct bvh *refit = refit_mesh_bvh(mesh.bvh, &mesh);
+	test_assert(refit);
+	destroy_bvh(mesh.bvh);
+	mesh.bvh = refit;
+	sampler *sampler = sampler_new();
+	for (size_t i = 0; i < 256; ++i) {
+		sampler_init(sampler, Random, (int)i, 256, (int)i * 3);
+		struct lightRay ray = {
+			.start = vec_scale(vec_on_unit_sphere(sampler), 2.5f),
+			.direction = vec_on_unit_sphere(sampler),
+		};
+		if (i % 2 == 0) {
+			ray.start = (struct vector){ ray.start.x * 0.3f, 1.0f, ray.start.z * 0.3f };
+			ray.direction = (struct vector){ 0.0f, -1.0f, 0.0f };
+		}
+		struct hitRecord bvh_hit = { .incident = &ray, .instIndex = -1, .distance = FLT_MAX };
+		struct hitRecord brute_hit = { .incident = &ray, .instIndex = -1, .distance = FLT_MAX };
+		const bool hit = traverse_bottom_level_bvh(&mesh, &ray, &bvh_hit, NULL);
+		test_assert(hit == test_brute_force_hit(&mesh, &ray, &brute_hit));
+		test_assert(bvh_hit.distance == brute_hit.distance);
+	}
+	sampler_destroy(sampler);
+
+	// Shuffling the vertices stretches polygons across the whole grid, the old tree is useless then
+	const size_t count = v_arr_len(mesh.vbuf.vertices);
+	struct vector *shuffled = NULL;
+	for (size_t i = 0; i < count; ++i)
+		v_arr_add(shuffled, mesh.vbuf.vertices[(i * 389) % count]);
+	v_arr_free(mesh.vbuf.vertices);
+	mesh.vbuf.vertices = shuffled;
+	test_assert(!refit_mesh_bvh(mesh.bvh, &mesh));
+	mesh_free(&mesh);
+	return true;
+}
+
+bool bvh_update_vertices_rebuild(void) {
+	struct mesh grid = test_grid_mesh(32);
+	struct cr_renderer *r = cr_new_renderer();
+	struct cr_scene *s = cr_renderer_scene_get(r);
+	cr_mesh idx = cr_scene_mesh_new(s, "grid");
+	cr_mesh_bind_vertex_buf(s, idx, (struct cr_vertex_buf_param){
+		.vertices = (struct cr_vector *)grid.vbuf.vertices,
+		.vertex_count = v_arr_len(grid.vbuf.vertices),
+	});
+	int *faces = NULL;
+	for (size_t i = 0; i < v_arr_len(grid.polygons); ++i)
+		v_arr_add_n(faces, grid.polygons[i].vertexIndex, MAX_CRAY_VERTEX_COUNT);
+	cr_mesh_bind_face_indices(s, idx, (struct cr_face_index_param){
+		.vertex_idx = faces,
+		.face_count = v_arr_len(grid.polygons),
+	});
+	v_arr_free(faces);
+	cr_mesh_finalize(s, idx);
+
+	// Shuffled vertices get the refit rejected. The rebuilt tree has to be in place as soon as
+	// the new vertices are, render threads could be tracing the mesh right away.
+	const size_t count = v_arr_len(grid.vbuf.vertices);
+	struct vector *shuffled = NULL;
+	for (size_t i = 0; i < count; ++i)
+		v_arr_add(shuffled, grid.vbuf.vertices[(i * 389) % count]);
+	test_assert(cr_mesh_update_vertices(s, idx, (struct cr_vector *)shuffled, count, NULL, 0));
+	v_arr_free(shuffled);
+
+	const struct mesh *mesh = &((struct world *)s)->meshes[idx];
+	test_assert(mesh->bvh);
+	sampler *sampler = sampler_new();
+	for (size_t i = 0; i < 256; ++i) {
+		sampler_init(sampler, Random, (int)i, 256, (int)i * 3);
+		struct lightRay ray = {
+			.start = vec_scale(vec_on_unit_sphere(sampler), 2.5f),
+			.direction = vec_on_unit_sphere(sampler),
+		};
+		struct hitRecord bvh_hit = { .incident = &ray, .instIndex = -1, .distance = FLT_MAX };
+		struct hitRecord brute_hit = { .incident = &ray, .instIndex = -1, .distance = FLT_MAX };
+		const bool hit = traverse_bottom_level_bvh(mesh, &ray, &bvh_hit, NULL);
+		test_assert(hit == test_brute_force_hit(mesh, &ray, &brute_hit));
+		test_assert(bvh_hit.distance == brute_hit.distance);
+	}
+	sampler_destroy(sampler);
+	cr_destroy_renderer(r);
+	mesh_free(&grid);
+	return true;
+}
+
+struct test_build_arg {
+	const struct mesh *mesh;
+	v_threadpool *pool;
+	struct bvh *bvh;
+};
+
+static void test_build_task(void *arg) {
+	struct test_build_arg *build = arg;
+	build->bvh = build_mesh_bvh(build->mesh, build->pool);
+}
+
+bool bvh_parallel_build(void) {
+	// Big enough to be built with a thread pool, which should give the same tree as a serial build
+	struct mesh mesh = test_grid_mesh(182);
+	// Like mesh builds in the scene, run two at once from another pool, sharing one build pool
+	v_threadpool *outer = v_threadpool_create(2);
+	v_threadpool *pool = v_threadpool_create(v_sys_get_cores());
+	struct test_build_arg builds[2] = { { &mesh, pool, NULL }, { &mesh, pool, NULL } };
+	for (size_t i = 0; i < 2; ++i)
+		v_threadpool_enqueue(outer, test_build_task, &builds[i]);
+	v_threadpool_wait(outer);
+	v_threadpool_destroy(outer);
+	// Builds can leave idle helper tasks behind, destroying the pool would drop them
+	v_threadpool_wait(pool);
+	v_threadpool_destroy(pool);
+	size_t count = 0;
+	const void *nodes = bvh_nodes(mesh.bvh, &count);
+	for (size_t i = 0; i < 2; ++i) {
+		size_t again_count = 0;
+		const void *again_nodes = bvh_nodes(builds[i].bvh, &again_count);
+		test_assert(count == again_count);
+		test_assert(!memcmp(nodes, again_nodes, count * bvh_node_size()));
+		test_assert(!memcmp(bvh_prim_indices(mesh.bvh), bvh_prim_indices(builds[i].bvh), v_arr_len(mesh.polygons) * sizeof(size_t)));
+		destroy_bvh(builds[i].bvh);
+	}
+
+	sampler *sampler = sampler_new();
+	for (size_t i = 0; i < 8; ++i) {
+		sampler_init(sampler, Random, (int)i, 8, (int)i * 3);
+		struct lightRay ray = {
+			.start = vec_scale(vec_on_unit_sphere(sampler), 2.5f),
+			.direction = vec_on_unit_sphere(sampler),
+		};
+		struct hitRecord bvh_hit = { .incident = &ray, .instIndex = -1, .distance = FLT_MAX };
+		struct hitRecord brute_hit = { .incident = &ray, .instIndex = -1, .distance = FLT_MAX };
+		const bool hit = traverse_bottom_level_bvh(&mesh, &ray, &bvh_hit, NULL);
+		test_assert(hit == test_brute_force_hit(&mesh, &ray, &brute_hit));
+		test_assert(bvh_hit.distance == brute_hit.distance);
+	}
+	sampler_destroy(sampler);
+	mesh_free(&mesh);
+	return true;
+}
@@ -84,3 +84,55 @@ bool serializer_serialize(void) {
 
 	return true;
 }
+
+bool serializer_baked(void) {
+	struct cr_renderer *ext = cr_new_renderer();
+	test_assert(ext);
+
+	int bak, new;
+	silence_stdout(&bak, &new);
+	bool loaded = cr_load_json(ext, "input/hdr.json");
+	resume_stdout(&bak, &new);
+	test_assert(loaded);
+
+	const char *path = "output/serializer_test.crbake";
+	silence_stdout(&bak, &new);
+	bool written = cr_write_baked(ext, path);
+	resume_stdout(&bak, &new);
+	test_assert(written);
+
+	struct cr_renderer *baked_ext = cr_new_renderer();
+	bool baked_loaded = cr_load_baked(baked_ext, path);
+	unlink(path);
+	test_assert(baked_loaded);
+
+	// Can't load on top of an existing scene
+	silence_stdout(&bak, &new);
+	bool reloaded = cr_load_baked(ext, path);
+	resume_stdout(&bak, &new);
+	test_assert(!reloaded);
+
+	struct renderer *r = (struct renderer *)ext;
+	struct renderer *baked = (struct renderer *)baked_ext;
+	test_assert(baked->scene->baked);
+	test_assert(v_arr_len(baked->scene->meshes) == v_arr_len(r->scene->meshes));
+	for (size_t i = 0; i < v_arr_len(baked->scene->meshes); ++i) {
+		test_assert(baked->scene->meshes[i].vbuf.borrowed);
+		test_assert(baked->scene->meshes[i].bvh);
+	}
+
+	// Same scene, whether loaded from JSON or baked
+	char *ser0 = serialize_renderer(r);
+	char *ser1 = serialize_renderer(baked);
+	bool match = stringEquals(ser0, ser1);
+
+	free(ser0);
+	free(ser1);
+
+	cr_destroy_renderer(ext);
+	cr_destroy_renderer(baked_ext);
+
+	test_assert(match);
+
+	return true;
+}
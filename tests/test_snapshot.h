@@ -0,0 +1,89 @@
+//
+//  test_snapshot.h
+//  c-ray
+//
+//  Created by agent on 18/10/2026.
+//  Copyright © 2026 agent. All rights reserved.
+//
+
+#pragma once
+
+#include "../src/lib/renderer/snapshot.h"
+#include "../src/lib/datatypes/tile.h"
+#include "../src/common/texture.h"
+#include "../src/common/color.h"
+
+static void snapshot_fill_tile(struct texture *t, const struct render_tile *tile, float value) {
+	for (int y = tile->begin.y; y < tile->end.y; ++y)
+		for (int x = tile->begin.x; x < tile->end.x; ++x)
+			tex_set_px(t, (struct color){ value, value, value, 1.0f }, x, y);
+}
+
+bool snapshot_publish(void) {
+	struct render_tile *tiles = tile_quantize(8, 8, 4, 4, ro_normal);
+	const size_t count = v_arr_len(tiles);
+	for (size_t i = 0; i < count; ++i)
+		tiles[i].index = i;
+	struct texture *result = tex_new(float_p, 8, 8, 4);
+	struct snapshots *s = snapshots_new();
+	size_t pass = 0;
+	// Nothing published before reset
+	test_assert(!snapshots_acquire(s, 0, 0, &pass));
+	snapshots_reset(s, 8, 8, tiles);
+
+	// Pass 1 isn't published until every tile is done
+	for (size_t i = 0; i < count - 1; ++i) {
+		snapshot_fill_tile(result, &tiles[i], 1.0f);
+		snapshots_tile_done(s, s->generation, &tiles[i], 1, result);
+	}
+	test_assert(!snapshots_acquire(s, 0, 0, &pass));
+	snapshot_fill_tile(result, &tiles[count - 1], 1.0f);
+	snapshots_tile_done(s, s->generation, &tiles[count - 1], 1, result);
+	const struct texture *snap = snapshots_acquire(s, 0, 0, &pass);
+	test_assert(snap);
+	test_assert(pass == 1);
+
+	// Tile 0 finishes pass 2 before the rest. Render threads keep writing
+	// result, but the snapshot the reader holds stays the same.
+	snapshot_fill_tile(result, &tiles[0], 2.0f);
+	snapshots_tile_done(s, s->generation, &tiles[0], 2, result);
+	roughly_equals(tex_get_px(snap, 0, 0, false).red, 1.0f);
+	test_assert(!snapshots_acquire(s, 1, 0, &pass));
+
+	// Tile 0 even finishes pass 3 before pass 2 gets published, it must carry over to pass 3
+	snapshot_fill_tile(result, &tiles[0], 3.0f);
+	snapshots_tile_done(s, s->generation, &tiles[0], 3, result);
+	for (size_t i = 1; i < count; ++i) {
+		snapshot_fill_tile(result, &tiles[i], 2.0f);
+		snapshots_tile_done(s, s->generation, &tiles[i], 2, result);
+	}
+	snap = snapshots_acquire(s, 1, 0, &pass);
+	test_assert(snap);
+	test_assert(pass == 2);
+	roughly_equals(tex_get_px(snap, 0, 0, false).red, 3.0f);
+	roughly_equals(tex_get_px(snap, 7, 7, false).red, 2.0f);
+	for (size_t i = 1; i < count; ++i) {
+		snapshot_fill_tile(result, &tiles[i], 3.0f);
+		snapshots_tile_done(s, s->generation, &tiles[i], 3, result);
+	}
+	snap = snapshots_acquire(s, 2, 0, &pass);
+	test_assert(snap);
+	test_assert(pass == 3);
+	roughly_equals(tex_get_px(snap, 7, 7, false).red, 3.0f);
+
+	// Tiles from before a reset are ignored, and passes start over
+	const size_t old_gen = s->generation;
+	snapshots_reset(s, 8, 8, tiles);
+	for (size_t i = 0; i < count; ++i)
+		snapshots_tile_done(s, old_gen, &tiles[i], 4, result);
+	test_assert(!snapshots_acquire(s, 3, 0, &pass));
+	for (size_t i = 0; i < count; ++i)
+		snapshots_tile_done(s, s->generation, &tiles[i], 1, result);
+	test_assert(snapshots_acquire(s, 3, 0, &pass));
+	test_assert(pass == 1);
+
+	snapshots_destroy(s);
+	tex_destroy(result);
+	v_arr_free(tiles);
+	return true;
+}
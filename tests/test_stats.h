@@ -0,0 +1,84 @@
+//
+//  test_stats.h
+//  c-ray
+//
+//  Created by agent on 18/10/2026.
+//  Copyright © 2026 agent. All rights reserved.
+//
+
+#pragma once
+
+#include <c-ray/c-ray.h>
+#include "../src/lib/renderer/stats.h"
+
+bool stats_timings(void) {
+	struct stats *s = stats_new();
+
+	struct cr_renderer_stats out = stats_get(s);
+	test_assert(out.timing_count == 0);
+
+	char name[] = "mesh.obj";
+	stats_add_timing(s, cr_phase_mesh_load, name, 1500);
+	stats_add_timing(s, cr_phase_render, NULL, 42);
+	// Names are copied
+	name[0] = 'x';
+
+	out = stats_get(s);
+	test_assert(out.timing_count == 2);
+	test_assert(out.timings[0].phase == cr_phase_mesh_load);
+	test_assert(stringEquals(out.timings[0].name, "mesh.obj"));
+	test_assert(out.timings[0].us == 1500);
+	test_assert(out.timings[1].phase == cr_phase_render);
+	test_assert(!out.timings[1].name);
+
+	// Previously returned timings stay valid until the next call
+	const struct cr_timing *prev = out.timings;
+	stats_add_timing(s, cr_phase_encode, "out.png", 7);
+	test_assert(prev[1].us == 42);
+	out = stats_get(s);
+	test_assert(out.timing_count == 3);
+	test_assert(stringEquals(out.timings[2].name, "out.png"));
+
+	// Repeats of a phase and name add up in the existing entry
+	stats_add_timing(s, cr_phase_render, NULL, 8);
+	stats_add_timing(s, cr_phase_mesh_load, "mesh.obj", 500);
+	stats_add_timing(s, cr_phase_bvh_build, "mesh.obj", 3);
+	out = stats_get(s);
+	test_assert(out.timing_count == 4);
+	test_assert(out.timings[0].us == 2000);
+	test_assert(out.timings[0].count == 2);
+	test_assert(out.timings[1].us == 50);
+	test_assert(out.timings[1].count == 2);
+	test_assert(out.timings[2].count == 1);
+	test_assert(out.timings[3].phase == cr_phase_bvh_build);
+
+	stats_destroy(s);
+	return true;
+}
+
+bool stats_memory(void) {
+	struct stats *s = stats_new();
+
+	// A BVH build: scratch buffers while it runs, then the finished tree
+	stats_add_memory(s, cr_mem_bvh, 0, 1000);
+	stats_add_memory(s, cr_mem_bvh, 300, -1000);
+	struct cr_renderer_stats out = stats_get(s);
+	test_assert(out.peak_bytes[cr_mem_bvh] == 1000);
+
+	// A second build peaks on top of the first tree
+	stats_add_memory(s, cr_mem_bvh, 0, 1000);
+	stats_add_memory(s, cr_mem_bvh, 300, -1000);
+	out = stats_get(s);
+	test_assert(out.peak_bytes[cr_mem_bvh] == 1300);
+
+	// Freeing doesn't lower the peak, and categories are separate
+	stats_add_memory(s, cr_mem_bvh, -600, 0);
+	stats_add_memory(s, cr_mem_geometry, 64, 0);
+	out = stats_get(s);
+	test_assert(out.peak_bytes[cr_mem_bvh] == 1300);
+	test_assert(out.peak_bytes[cr_mem_geometry] == 64);
+	test_assert(out.peak_bytes[cr_mem_textures] == 0);
+
+	stats_destroy(s);
+	return true;
+}
@@ -0,0 +1,178 @@
+//
+//  test_tile.h
+//  c-ray
+//
+//  Created by agent on 18/10/2026.
+//  Copyright © 2026 agent. All rights reserved.
+//
+
+#pragma once
+
+#include "../src/lib/datatypes/tile.h"
+
+bool tile_dirty_tracking(void) {
+	struct render_tile *tiles = tile_quantize(8, 8, 4, 4, ro_normal);
+	const size_t count = v_arr_len(tiles);
+	for (size_t i = 0; i < count; ++i)
+		tiles[i].index = i;
+	struct tile_dirty_set *d = tile_dirty_new();
+	struct render_tile out[4];
+
+	// Nothing is tracked yet
+	test_assert(tile_dirty_collect(d, out, 4) == 0);
+
+	// Everything is dirty after a reset, and what doesn't fit stays dirty
+	tile_dirty_reset(d, tiles);
+	test_assert(tile_dirty_collect(d, out, 3) == 3);
+	test_assert(tile_dirty_collect(d, out, 4) == 1);
+	test_assert(out[0].index == 3);
+	test_assert(tile_dirty_collect(d, out, 4) == 0);
+
+	// Marking a tile twice only returns it once
+	tile_dirty_mark(d, &tiles[2]);
+	tile_dirty_mark(d, &tiles[2]);
+	test_assert(tile_dirty_collect(d, out, 4) == 1);
+	test_assert(out[0].index == 2);
+	test_assert(out[0].begin.x == tiles[2].begin.x && out[0].end.y == tiles[2].end.y);
+
+	// Stale tiles from a bigger set are ignored
+	struct render_tile stale = { .index = 10 };
+	tile_dirty_mark(d, &stale);
+	test_assert(tile_dirty_collect(d, out, 4) == 0);
+
+	// Resetting again makes the tiles dirty again
+	tile_dirty_reset(d, tiles);
+	test_assert(tile_dirty_collect(d, out, 4) == 4);
+
+	tile_dirty_destroy(d);
+	v_arr_free(tiles);
+	return true;
+}
+
+// Every pixel should be covered by exactly one tile
+static bool tiles_cover_once(const struct render_tile *tiles, unsigned width, unsigned height) {
+	unsigned char *hits = calloc(width * height, 1);
+	for (size_t i = 0; i < v_arr_len(tiles); ++i) {
+		if (tiles[i].width != (unsigned)(tiles[i].end.x - tiles[i].begin.x)) goto fail;
+		if (tiles[i].height != (unsigned)(tiles[i].end.y - tiles[i].begin.y)) goto fail;
+		for (int y = tiles[i].begin.y; y < tiles[i].end.y; ++y)
+			for (int x = tiles[i].begin.x; x < tiles[i].end.x; ++x)
+				hits[y * width + x]++;
+	}
+	for (size_t i = 0; i < width * height; ++i)
+		if (hits[i] != 1) goto fail;
+	free(hits);
+	return true;
+fail:
+	free(hits);
+	return false;
+}
+
+bool tile_split_tail_coverage(void) {
+	// 5x4 tiles, with odd sizes at the edges
+	struct render_tile *tiles = tile_quantize(37, 29, 8, 8, ro_normal);
+	const size_t count = v_arr_len(tiles);
+	const struct render_tile first = tiles[0];
+	tile_split_tail(&tiles, 4);
+	test_assert(tiles_cover_once(tiles, 37, 29));
+	test_assert(v_arr_len(tiles) > count);
+	// The head of the queue is left alone, and the last tiles are the smallest
+	test_assert(tiles[0].begin.x == first.begin.x && tiles[0].end.x == first.end.x);
+	test_assert(tiles[0].width == 8 && tiles[0].height == 8);
+	const struct render_tile *last = &tiles[v_arr_len(tiles) - 1];
+	test_assert(last->width <= 2 && last->height <= 2);
+	for (size_t i = 0; i < v_arr_len(tiles); ++i)
+		test_assert(tiles[i].index == (int)i);
+	v_arr_free(tiles);
+
+	// Too few tiles for the threads get split until there are enough
+	tiles = tile_quantize(16, 16, 16, 16, ro_normal);
+	tile_split_tail(&tiles, 8);
+	test_assert(v_arr_len(tiles) >= 8);
+	test_assert(tiles_cover_once(tiles, 16, 16));
+	v_arr_free(tiles);
+
+	// Single pixels can't be split any further
+	tiles = tile_quantize(1, 1, 1, 1, ro_normal);
+	tile_split_tail(&tiles, 16);
+	test_assert(v_arr_len(tiles) == 1);
+	test_assert(tiles_cover_once(tiles, 1, 1));
+	v_arr_free(tiles);
+	return true;
+}
+
+bool tile_next_claims_once(void) {
+	struct tile_set set = {
+		.tile_mutex = v_mutex_create(),
+		.tiles = tile_quantize(16, 16, 4, 4, ro_normal),
+	};
+	const size_t count = v_arr_len(set.tiles);
+	for (size_t i = 0; i < count; ++i) {
+		struct render_tile *tile = tile_next(&set);
+		test_assert(tile == &set.tiles[i]);
+		test_assert(tile->index == (int)i);
+		test_assert(tile->state == rendering);
+	}
+	// Out of tiles, and stays that way
+	test_assert(!tile_next(&set));
+	test_assert(!tile_next(&set));
+
+	// Tiles a network worker dropped are picked up locally at the end
+	set.tiles[3].network_renderer = true;
+	struct render_tile *tile = tile_next(&set);
+	test_assert(tile == &set.tiles[3]);
+	test_assert(!tile->network_renderer);
+	test_assert(!tile_next(&set));
+	tile_set_free(&set);
+	return true;
+}
+
+bool tile_steal_in_flight(void) {
+	struct tile_set set = {
+		.tile_mutex = v_mutex_create(),
+		.tiles = tile_quantize(8, 8, 4, 4, ro_normal),
+	};
+	const size_t count = v_arr_len(set.tiles);
+	for (size_t i = 0; i < count; ++i) {
+		struct render_tile *tile = tile_next(&set);
+		tile->total_samples = 8;
+		test_assert(tile->workers == 1);
+	}
+	test_assert(!tile_next(&set));
+
+	size_t sample = 0;
+	for (size_t i = 0; i < 7; ++i) test_assert(tile_claim_sample(&set.tiles[0], &sample));
+	for (size_t i = 0; i < 2; ++i) test_assert(tile_claim_sample(&set.tiles[1], &sample));
+	for (size_t i = 0; i < 8; ++i) test_assert(tile_claim_sample(&set.tiles[3], &sample));
+	test_assert(sample == 7);
+	test_assert(!tile_claim_sample(&set.tiles[3], &sample));
+	set.tiles[2].network_renderer = true;
+
+	// Tile 2 has the most left, but a network worker has it. Tile 1 is next.
+	struct render_tile *stolen = tile_steal(&set);
+	test_assert(stolen == &set.tiles[1]);
+	test_assert(stolen->workers == 2);
+	// Both threads claim from the same range, every sample is handed out once
+	size_t claims = 0;
+	while (tile_claim_sample(stolen, &sample)) claims++;
+	test_assert(claims == 6);
+
+	// Single samples aren't worth stealing, and finished tiles are left alone
+	set.tiles[2].state = finished;
+	test_assert(!tile_steal(&set));
+	tile_set_free(&set);
+
+	// Tiles handed to network workers are marked as theirs right away
+	set = (struct tile_set){
+		.tile_mutex = v_mutex_create(),
+		.tiles = tile_quantize(8, 8, 4, 4, ro_normal),
+	};
+	struct render_tile *remote = tile_next_network(&set);
+	test_assert(remote == &set.tiles[0]);
+	test_assert(remote->network_renderer);
+	test_assert(remote->state == rendering);
+	remote->total_samples = 8;
+	test_assert(!tile_steal(&set));
+	tile_set_free(&set);
+	return true;
+}
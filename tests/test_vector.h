@@ -198,3 +198,21 @@ bool vector_reflect(void) {
 	roughly_equals(dot, 0.0f);
 	return true;
 }
+
+bool vector_vertex_buf_borrowed(void) {
+	struct vector verts[] = { { 0.0f, 0.0f, 0.0f }, { 1.0f, 0.0f, 0.0f }, { 0.0f, 1.0f, 0.0f } };
+	struct vertex_buffer owned = { 0 };
+	v_arr_add_n(owned.vertices, verts, 3);
+	test_assert(vbuf_vertex_count(&owned) == 3);
+	test_assert(vbuf_normal_count(&owned) == 0);
+	vertex_buf_free(&owned);
+
+	struct vertex_buffer borrowed = { .vertices = verts, .vertex_count = 3, .borrowed = true };
+	test_assert(vbuf_vertex_count(&borrowed) == 3);
+	test_assert(vbuf_texture_coord_count(&borrowed) == 0);
+	// Must not try to free caller memory
+	vertex_buf_free(&borrowed);
+	test_assert(!borrowed.vertices);
+	test_assert(vbuf_vertex_count(&borrowed) == 0);
+	return true;
+}
@@ -46,10 +46,10 @@ int runTests(char *suite) {
 int runPerfTests(char *suite) {
 	unsigned test_count = getPerfTestCount(suite);
 	logr(info, "C-ray performance tests v0.1\n");
-	logr(info, "Running performance tests in a single process. Consider using run-perf-tests.sh instead.\n");
+	logr(info, "Running performance tests in a single process. Consider using tests/perf/runner.sh (make perf) instead.\n");
 	
 	logr(info, "Running %u test%s.\n", test_count, PLURAL(test_count));
-	logr(info, "Averaging runtime from %i runs for each test.\n", PERF_AVG_COUNT);
+	logr(info, "Averaging runtime from %i runs for each test, unless it sets its own run count.\n", PERF_AVG_COUNT);
 	v_timer t = v_timer_start();
 	for (unsigned t = 0; t < test_count; ++t) {
 		runPerfTest(t, suite);
@@ -99,14 +99,17 @@ int runPerfTest(unsigned t, char *suite) {
 	
 	
 	time_t usecs = 0;
+	const perf_test *test = &perf_tests[first_idx + t];
+	const unsigned runs = test->runs ? test->runs : PERF_AVG_COUNT;
 	
-	for (size_t i = 0; i < PERF_AVG_COUNT; ++i) {
-		usecs += perf_tests[t].func();
+	for (size_t i = 0; i < runs; ++i) {
+		usecs += test->func();
 	}
 	
-	usecs = usecs / PERF_AVG_COUNT;
+	usecs = usecs / runs;
 	
-	printf("(%6ld μs avg) \n", usecs);
+	printf("(%6ld μs avg) %s\n", usecs, perf_report);
+	perf_report[0] = '\0';
 	return 0;
 }
 
@@ -50,6 +50,10 @@ static char *failed_expression;
 #include "test_parser.h"
 #include "test_serializer.h"
 #include "test_thread_pool.h"
+#include "test_snapshot.h"
+#include "test_tile.h"
+#include "test_bvh.h"
+#include "test_stats.h"
 
 typedef struct {
 	char *test_name;
@@ -75,6 +79,7 @@ static test tests[] = {
 	{"vector::vecEquals", vector_vecequals},
 	{"vector::randomOnUnitSphere", vector_random_on_sphere},
 	{"vector::reflect", vector_reflect},
+	{"vector::vertexBufBorrowed", vector_vertex_buf_borrowed},
 	
 	{"transforms::transpose", transform_transpose},
 	{"transforms::multiply", transform_multiply},
@@ -179,8 +184,23 @@ static test tests[] = {
 	{"parser::parser_color_hsl", parser_color_hsl},
 
 	{"serializer::serialize", serializer_serialize},
+	{"serializer::baked", serializer_baked},
 
 	{"threadpool::basic", test_thread_pool},
+	{"snapshot::publish", snapshot_publish},
+	{"tile::dirty_tracking", tile_dirty_tracking},
+	{"tile::split_tail_coverage", tile_split_tail_coverage},
+	{"tile::next_claims_once", tile_next_claims_once},
+	{"tile::steal_in_flight", tile_steal_in_flight},
+	{"bvh::packet_matches_single", bvh_packet_matches_single},
+	{"bvh::packet_top_level", bvh_packet_top_level},
+	{"bvh::refit_top_level", bvh_refit_top_level},
+	{"bvh::matches_brute_force", bvh_matches_brute_force},
+	{"bvh::refit_mesh", bvh_refit_mesh},
+	{"bvh::update_vertices_rebuild", bvh_update_vertices_rebuild},
+	{"bvh::parallel_build", bvh_parallel_build},
+	{"stats::timings", stats_timings},
+	{"stats::memory", stats_memory},
 };
 
 #define testCount (sizeof(tests) / sizeof(test))